@@ -10,3 +10,22 @@ def temporary_media_root(tmp_path_factory):
     from django.conf import settings
 
     settings.MEDIA_ROOT = tmp_path_factory.mktemp("media")
+
+
+@pytest.fixture(autouse=True)
+def temporary_metrics_db(tmp_path_factory, settings):
+    """Give each test empty metrics, flushed as soon as they are recorded."""
+    settings.GALLERY_METRICS_DB = tmp_path_factory.mktemp("metrics") / "metrics.sqlite3"
+    settings.GALLERY_METRICS_FLUSH_INTERVAL = 0
+
+
+@pytest.fixture(autouse=True)
+def temporary_fragment_cache(tmp_path_factory, settings):
+    """Give each test an empty fragment cache, instead of the dev one."""
+    settings.CACHES = {
+        **settings.CACHES,
+        "fragments": {
+            **settings.CACHES["fragments"],
+            "LOCATION": tmp_path_factory.mktemp("cache"),
+        },
+    }
@@ -161,8 +161,15 @@ function createCaptionEditor(entryId: number, initialCaption: string, htmlCaptio
 }
 
 function start() {
+  setupEntries(document);
+  setupInfiniteScroll();
+}
+
+// Set up the editing widgets of entries under root, which is the whole
+// document at first, then each fragment loaded by infinite scroll
+function setupEntries(root: ParentNode) {
   // Find all caption containers
-  const captionContainers = document.querySelectorAll('.caption');
+  const captionContainers = root.querySelectorAll('.caption');
 
   captionContainers.forEach(container => {
     const entryId = container.dataset.entryId;
@@ -179,12 +186,108 @@ function start() {
   });
 
   // Handle toggle-hidden checkboxes
-  setupHiddenToggleCheckboxes();
+  setupHiddenToggleCheckboxes(root);
 
   // Handle video play buttons
-  setupVideoPlayButtons();
+  setupVideoPlayButtons(root);
 }
 
+// When the "More" link at the end of the entries comes near the viewport,
+// replace it with the next page of entries, which ends with another one if
+// there are more still.
+function setupInfiniteScroll() {
+  let loading = false;
+
+  const observer = new IntersectionObserver(async entries => {
+    const sentinel = entries.find(e => e.isIntersecting)?.target;
+    if (!(sentinel instanceof HTMLElement) || loading) return;
+
+    const url = sentinel.dataset.nextUrl;
+    if (!url) return;
+
+    loading = true;
+    observer.unobserve(sentinel);
+    try {
+      const response = await fetch(url);
+      if (!response.ok) {
+        throw new Error(`Failed to load entries: ${response.status}`);
+      }
+      const template = document.createElement('template');
+      template.innerHTML = await response.text();
+      const fragment = template.content;
+
+      setupEntries(fragment);
+      const next = fragment.querySelector('.entries-sentinel');
+      sentinel.replaceWith(fragment);
+      if (next) {
+        observer.observe(next);
+      }
+    } catch (err) {
+      console.error(err);
+      // the link still works
+      observer.observe(sentinel);
+    } finally {
+      loading = false;
+    }
+  }, { rootMargin: '1500px 0px' });
+
+  document.querySelectorAll('.entries-sentinel').forEach(s => observer.observe(s));
+}
+
+// Entry changes waiting to be sent together to the bulk edit endpoint, so
+// that toggling many entries is one request and one database transaction
+type EntryChange = { id: number, caption?: string, hidden?: boolean, order?: number };
+type EntryChangeResult = { id: number, ok: boolean, error?: string, hidden?: boolean };
+
+const EDIT_FLUSH_DELAY_MS = 500;
+let pendingEdits: { change: EntryChange, resolve: (r: EntryChangeResult) => void, reject: (e: unknown) => void }[] = [];
+let flushTimer: number | null = null;
+
+function queueEntryChange(change: EntryChange): Promise<EntryChangeResult> {
+  return new Promise((resolve, reject) => {
+    pendingEdits.push({ change, resolve, reject });
+    if (flushTimer !== null) {
+      clearTimeout(flushTimer);
+    }
+    flushTimer = window.setTimeout(flushEntryChanges, EDIT_FLUSH_DELAY_MS);
+  });
+}
+
+async function flushEntryChanges() {
+  flushTimer = null;
+  const batch = pendingEdits;
+  pendingEdits = [];
+  const url = document.querySelector<HTMLElement>('.gallery-entries')?.dataset.bulkEditUrl;
+  if (!batch.length || !url) return;
+
+  try {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-CSRFToken': getCsrfToken(),
+      },
+      body: JSON.stringify({ changes: batch.map(p => p.change) }),
+      keepalive: true,
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to save changes: ${response.status}`);
+    }
+    const { results } = await response.json();
+    batch.forEach((p, i) => p.resolve(results[i]));
+  } catch (err) {
+    batch.forEach(p => p.reject(err));
+  }
+}
+
+// Don’t lose queued changes when leaving the page
+window.addEventListener('pagehide', () => {
+  if (flushTimer !== null) {
+    clearTimeout(flushTimer);
+    flushEntryChanges();
+  }
+});
+
 // Function to create a hidden toggle checkbox component
 function createHiddenToggleCheckbox(entryId: string, initialHidden: boolean) {
   // State variables
@@ -203,20 +306,10 @@ function createHiddenToggleCheckbox(entryId: string, initialHidden: boolean) {
     render();
 
     try {
-      const response = await fetch(`/gallery/entry/${entryId}/set_hidden`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-CSRFToken': getCsrfToken(),
-        },
-        body: JSON.stringify({ hidden: newHiddenState }),
-      });
-
-      if (!response.ok) {
-        throw new Error(`Failed to update hidden status: ${response.status}`);
+      const data = await queueEntryChange({ id: Number(entryId), hidden: newHiddenState });
+      if (!data.ok) {
+        throw new Error(`Failed to update hidden status: ${data.error}`);
       }
-
-      const data = await response.json();
       console.log(`Entry ${entryId} hidden status updated to: ${data.hidden}`);
 
       // Update the state to match the server response
@@ -278,8 +371,8 @@ function createHiddenToggleCheckbox(entryId: string, initialHidden: boolean) {
 }
 
 // Function to setup hidden toggle checkboxes
-function setupHiddenToggleCheckboxes() {
-  const checkboxes = document.querySelectorAll('.toggle-hidden-checkbox');
+function setupHiddenToggleCheckboxes(root: ParentNode) {
+  const checkboxes = root.querySelectorAll('.toggle-hidden-checkbox');
 
   checkboxes.forEach(checkbox => {
     if (!(checkbox instanceof HTMLInputElement)) return;
@@ -304,13 +397,13 @@ function setupHiddenToggleCheckboxes() {
 }
 
 // Function to set up video play buttons
-function setupVideoPlayButtons() {
-  const playButtons = document.querySelectorAll('.play-video-btn');
+function setupVideoPlayButtons(root: ParentNode) {
+  const playButtons = root.querySelectorAll('.play-video-btn');
 
   playButtons.forEach(button => {
     if (!(button instanceof HTMLButtonElement)) return;
 
-    button.addEventListener('click', function() {
+    button.addEventListener('click', async function() {
       const entryId = this.getAttribute('data-entry-id');
       const videoFilename = this.getAttribute('data-video-filename');
 
@@ -324,6 +417,22 @@ function setupVideoPlayButtons() {
       const imgElement = entryContainer.querySelector('img.thumbnail');
       if (!imgElement) return;
 
+      // The server remuxes and transcodes videos in the background; start
+      // playing as soon as one of them is done, and add the others as they
+      // finish, leaving out any that can't be made
+      const sources: VideoSource[] = JSON.parse(
+        this.getAttribute('data-video-sources') ?? '[]');
+      const ready = sources.map(source => waitForVideo(source.src));
+      this.disabled = true;
+      try {
+        await Promise.any(ready);
+      } catch {
+        console.error(`No playable video for entry ${entryId}`);
+        return;
+      } finally {
+        this.disabled = false;
+      }
+
       // Get the image dimensions to maintain aspect ratio
       const imgWidth = imgElement.width;
       const imgHeight = imgElement.height;
@@ -337,13 +446,27 @@ function setupVideoPlayButtons() {
       videoElement.height = imgHeight;
       videoElement.style.maxWidth = '100%';
 
-      // Create a source element
-      const sourceElement = document.createElement('source');
-      sourceElement.src = `/gallery/entry/${entryId}/video`;
-      sourceElement.type = 'video/mp4';
-
-      // Add the source to the video
-      videoElement.appendChild(sourceElement);
+      // The browser plays the first source whose media query matches, so
+      // keep them in ladder order. If none match yet, it waits for more to be
+      // added.
+      const sourceElements: HTMLSourceElement[] = [];
+      sources.forEach((source, i) => {
+        ready[i].then(() => {
+          const sourceElement = document.createElement('source');
+          sourceElement.src = source.src;
+          sourceElement.type = 'video/mp4';
+          if (source.media) {
+            sourceElement.media = source.media;
+          }
+          sourceElements[i] = sourceElement;
+          const next = sourceElements.slice(i + 1).find(e => e !== undefined);
+          videoElement.insertBefore(sourceElement, next ?? null);
+          // A better rung arrived before playback got going
+          if (next && videoElement.currentTime === 0) {
+            videoElement.load();
+          }
+        }, () => {});
+      });
 
       // Store a reference to the button for later use
       const playButton = this;
@@ -366,6 +489,30 @@ function setupVideoPlayButtons() {
   });
 }
 
+interface VideoSource {
+  src: string;
+  media: string | null;
+}
+
+// Resolves once the video at url can be played, polling the job status while
+// the server is still making it.
+async function waitForVideo(url: string) {
+  const response = await fetch(url, { method: 'HEAD' });
+  if (response.ok && response.status !== 202) return;
+  if (response.status !== 202) {
+    throw new Error(`Video ${url} is unavailable: ${response.status}`);
+  }
+
+  const statusUrl = `${url}status`;
+  for (;;) {
+    await new Promise(resolve => setTimeout(resolve, 2000));
+    const status = await (await fetch(statusUrl)).json();
+    if (status.status === 'done') return;
+    if (status.status === 'failed' || status.status === null) {
+      throw new Error(`Making video ${url} failed: ${status.error ?? ''}`);
+    }
+  }
+}
 
 // DOMContentLoaded might not fire with an async script
 // https://stackoverflow.com/questions/39993676/code-inside-domcontentloaded-event-not-working
@@ -1,3 +1,4 @@
+import re
 import shutil
 from pathlib import Path
 
@@ -81,37 +82,40 @@ def test_buildgallery2(db, tmpdir, blue_jpg_file, blue_png_file, one_frame_mov_f
     print(output_html)
     soup = BeautifulSoup(output_html, "html.parser")
 
+    def published(name):
+        assert re.fullmatch(r"media/[0-9a-f]{16}\.\w+", name)
+        return publish_dir / name
+
     e1_div = soup.find("div", {"data-entry-id": e_jpg.id})
-    e1_img = e1_div.find("img", {"src": "media/0000.webp"})
-    assert e1_img
+    e1_img = e1_div.find("img")
     assert e1_img["width"] == "800"
-    with Image.open(publish_dir / "media" / "0000.webp") as e1_thumb:
+    with Image.open(published(e1_img["src"])) as e1_thumb:
         assert e1_thumb.format == "WEBP"
 
     e2_div = soup.find("div", {"data-entry-id": e_png.id})
-    assert e2_div.find("img", {"src": "media/0001.webp"})
-    with Image.open(publish_dir / "media" / "0001.webp") as e2_thumb:
+    with Image.open(published(e2_div.find("img")["src"])) as e2_thumb:
         assert e2_thumb.format == "WEBP"
 
     e3_div = soup.find("div", {"data-entry-id": e_heic.id})
-    assert e3_div.find("img", {"src": "media/0002.jpg"})
-    with Image.open(publish_dir / "media" / "0002.jpg") as e3_thumb:
+    e3_img = e3_div.find("img")
+    assert e3_img["src"].endswith(".jpg")
+    with Image.open(published(e3_img["src"])) as e3_thumb:
         assert e3_thumb.format == "MPO"
 
     e4_div = soup.find("div", {"data-entry-id": e_live_photo.id})
-    e4_img_tag = e4_div.find("img", {"src": "media/0003.jpg"})
-    assert e4_img_tag
-    with Image.open(publish_dir / "media" / "0003.jpg") as e4_thumb:
+    e4_img_tag = e4_div.find("img")
+    with Image.open(published(e4_img_tag["src"])) as e4_thumb:
         assert e4_thumb.format == "MPO"
-        assert e4_img_tag["data-video-filename"] == "media/0003.mp4"
-        assert (publish_dir / "media" / "0003.mp4").exists()
+        assert e4_img_tag["data-video-filename"].endswith(".mp4")
+        assert published(e4_img_tag["data-video-filename"]).exists()
 
     # I thought about auto-playing videos, but decided to just show thumbnails
     # for them. Click or tap to interact.
     e5_div = soup.find("div", {"data-entry-id": e_mov_only.id})
     assert e5_div
-    e5_image = e5_div.find("img", {"src": "media/0004.webp"})
-    assert e5_image
+    e5_image = e5_div.find("img")
+    assert e5_image["src"].endswith(".webp")
+    assert published(e5_image["src"]).exists()
     assert e5_image["width"] == "800"
-    assert e5_image["data-video-filename"] == "media/0004.mp4"
-    assert (publish_dir / "media" / "0004.mp4").exists()
+    assert e5_image["data-video-filename"].endswith(".mp4")
+    assert published(e5_image["data-video-filename"]).exists()
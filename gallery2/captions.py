@@ -0,0 +1,28 @@
+"""
+Rendering entry captions from markdown to HTML.
+
+Entries store their rendered caption next to the markdown, together with
+renderer_version() at the time, so that pages don’t parse any markdown. The
+HTML is re-rendered when the caption changes, and, via the render_captions
+command, when GALLERY_MARKDOWN_EXTENSIONS or the markdown package changes.
+"""
+
+import hashlib
+import json
+
+import markdown
+from django.conf import settings
+
+
+def render_caption(text):
+    if not text:
+        return ""
+    return markdown.markdown(text, extensions=settings.GALLERY_MARKDOWN_EXTENSIONS)
+
+
+def renderer_version():
+    """Short hash of everything, besides the caption, that affects the HTML."""
+    config = json.dumps(
+        [markdown.__version__, settings.GALLERY_MARKDOWN_EXTENSIONS], sort_keys=True
+    )
+    return hashlib.sha256(config.encode()).hexdigest()[:16]
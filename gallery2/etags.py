@@ -0,0 +1,71 @@
+"""
+ETags for the gallery HTML pages.
+
+Gallery.revision is bumped by every change to a gallery or its entries, so an
+unchanged page can be answered with a 304 after one indexed lookup, without
+querying or rendering any entries.
+"""
+
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.template.loader import get_template
+
+from gallery2.captions import renderer_version
+from gallery2.models import Gallery
+from website.frontend.templatetags.frontend_extras import determine_build_asset_names
+
+PAGE_TEMPLATES = [
+    "gallery2/base.html",
+    "gallery2/gallery_list.html",
+    "gallery2/gallery_detail.html",
+    "gallery2/_entries.html",
+    "gallery2/_entry.html",
+]
+
+
+def code_version():
+    """What, besides the data, changes the pages: templates, the frontend
+    build, and settings that affect the markup."""
+    return [
+        [
+            os.stat(get_template(name).origin.name).st_mtime_ns
+            for name in PAGE_TEMPLATES
+        ],
+        settings.DEBUG or determine_build_asset_names(),
+        renderer_version(),
+        settings.GALLERY_TRANSCODE_LADDER,
+        settings.GALLERY_PAGE_SIZE,
+    ]
+
+
+def make_etag(request, data_version):
+    # The detail page embeds a CSRF token, which is valid for as long as the
+    # CSRF cookie it was masked from stays the same
+    parts = [
+        data_version,
+        request.get_full_path(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+        code_version(),
+    ]
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def gallery_detail_etag(request, pk):
+    revision = Gallery.objects.filter(pk=pk).values_list("revision", flat=True).first()
+    if revision is None:
+        return None
+    return make_etag(request, [pk, revision])
+
+
+def gallery_list_etag(request):
+    # revisions only increase, so adding, changing, or deleting any gallery
+    # changes at least one of these
+    summary = Gallery.objects.aggregate(
+        count=Count("id"), max_id=Max("id"), revisions=Sum("revision")
+    )
+    return make_etag(request, summary)
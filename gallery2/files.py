@@ -1,4 +1,40 @@
+import os
+import tempfile
+from pathlib import Path
+
 IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".heic", ".webp")
 MOVIE_EXTENSIONS = (".mov",)
 
 MEDIA_EXTENSIONS = IMAGE_EXTENSIONS + MOVIE_EXTENSIONS
+
+
+def _read_umask():
+    # The umask can only be read by setting it
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+UMASK = _read_umask()
+
+
+def write_atomically(path: Path, write):
+    """Call write with a temporary path next to path, then rename it into
+    place, so that nothing ever sees a partly written file. Returns what write
+    returns.
+
+    The temporary file gets the mode an ordinary new file would, not
+    mkstemp’s 0600, so that e.g. nginx can still serve it.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        os.fchmod(fd, 0o666 & ~UMASK)
+    finally:
+        os.close(fd)
+    tmp_path = Path(tmp_path)
+    try:
+        result = write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return result
@@ -0,0 +1,60 @@
+"""
+Caching the rendered HTML of each entry on the gallery page.
+
+Fragments are keyed on the entry’s version, which Entry.save() bumps, so
+editing a caption or hiding an entry invalidates exactly that entry’s
+fragment, and rendering a long page is mostly concatenating cache hits. The
+key also covers the entry template and settings that change its output, so
+deploying a template change doesn’t serve stale fragments.
+"""
+
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from gallery2.captions import renderer_version
+from gallery2.instrumentation import span
+
+ENTRY_TEMPLATE = "gallery2/_entry.html"
+
+
+def fragment_config_version(template):
+    config = json.dumps(
+        [
+            os.stat(template.origin.name).st_mtime_ns,
+            renderer_version(),
+            settings.GALLERY_TRANSCODE_LADDER,
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(config.encode()).hexdigest()[:16]
+
+
+def render_entry_fragments(entries):
+    """Return the HTML for each entry, rendering and caching only the ones not
+    in the fragments cache."""
+    cache = caches["fragments"]
+    template = get_template(ENTRY_TEMPLATE)
+    config = fragment_config_version(template)
+
+    keys = {f"entry:{config}:{entry.id}:{entry.version}": entry for entry in entries}
+    with span("fragment_cache"):
+        found = cache.get_many(keys)
+
+    with span("render"):
+        rendered = {
+            key: template.render({"entry": entry})
+            for key, entry in keys.items()
+            if key not in found
+        }
+    if rendered:
+        with span("fragment_cache"):
+            cache.set_many(rendered)
+
+    found.update(rendered)
+    return [mark_safe(found[key]) for key in keys]
@@ -0,0 +1,15 @@
+"""
+PIL’s Image module with HEIF support registered.
+
+Import Image from here instead of from PIL wherever a .heic file might be
+opened. Loading PIL and pillow_heif is slow, so only import this from
+functions that open images, not at the top of modules that every process
+loads.
+"""
+
+from PIL import Image
+from pillow_heif import register_heif_opener
+
+register_heif_opener()
+
+__all__ = ["Image"]
@@ -0,0 +1,110 @@
+"""
+Per-request timings, sent back in a Server-Timing header and logged.
+
+Code that might be slow wraps itself in span("name"). While a request is
+being handled by ServerTimingMiddleware, that time is added up per name,
+along with the number and duration of database queries; otherwise span()
+does nothing. The middleware is only installed when GALLERY_SERVER_TIMING
+is set.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("gallery2_request_timing", default=None)
+
+
+class RequestTiming:
+    def __init__(self):
+        # name -> [total seconds, count]
+        self.spans = {}
+        self.db_queries = 0
+        self.db_time = 0.0
+
+    def add(self, name, seconds):
+        totals = self.spans.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.db_queries += 1
+
+    def header(self, total):
+        metrics = [f"total;dur={total * 1000:.1f}"]
+        metrics.append(
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"'
+        )
+        for name, (seconds, count) in self.spans.items():
+            metrics.append(f'{name};dur={seconds * 1000:.1f};desc="{count}×"')
+        return ", ".join(metrics)
+
+    def as_dict(self, total):
+        return {
+            "total": round(total, 6),
+            "db": round(self.db_time, 6),
+            "db_queries": self.db_queries,
+            "spans": {
+                name: {"seconds": round(seconds, 6), "count": count}
+                for name, (seconds, count) in self.spans.items()
+            },
+        }
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as part of the current request, if any."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        if not settings.GALLERY_SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timing.db_wrapper):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        response["Server-Timing"] = timing.header(total)
+        logger.info(
+            "%s",
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    **timing.as_dict(total),
+                }
+            ),
+        )
+        return response
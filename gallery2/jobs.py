@@ -0,0 +1,181 @@
+"""
+A small persistent job queue, stored in the main database.
+
+Views call enqueue() and return straight away; the runworker management
+command claims jobs one at a time and runs them. There is at most one pending
+or running job per (kind, entry, variant), so repeated requests for the same
+video don’t start parallel ffmpegs on the same output, and at most
+GALLERY_MAX_CONCURRENT_TRANSCODES transcode jobs run at once.
+"""
+
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from gallery2 import metrics
+from gallery2.models import Job
+from gallery2.video import (
+    find_video_source,
+    get_rung,
+    make_hls_if_necessary,
+    remux_if_necessary,
+    transcode_if_necessary,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _video_source(job):
+    path = find_video_source(job.entry)
+    if path is None:
+        raise Exception(f"No video file found for entry {job.entry_id}")
+    return path
+
+
+def _run_remux(job):
+    remux_if_necessary(job.entry, _video_source(job))
+
+
+def _run_hls(job):
+    make_hls_if_necessary(job.entry, _video_source(job))
+
+
+def _run_transcode(job):
+    rung = get_rung(job.variant)
+    if rung is None:
+        raise Exception(f"No transcode ladder rung {job.variant!r}")
+    transcode_if_necessary(job.entry, _video_source(job), rung)
+
+
+HANDLERS = {
+    Job.Kind.REMUX: _run_remux,
+    Job.Kind.HLS: _run_hls,
+    Job.Kind.TRANSCODE: _run_transcode,
+}
+
+# Kinds that are limited to GALLERY_MAX_CONCURRENT_TRANSCODES running jobs
+CPU_BOUND_KINDS = (Job.Kind.TRANSCODE,)
+
+
+def active_job(entry, kind, variant=""):
+    return Job.objects.filter(
+        entry=entry, kind=kind, variant=variant, status__in=Job.ACTIVE_STATUSES
+    ).first()
+
+
+def latest_job(entry, kind, variant=""):
+    return (
+        Job.objects.filter(entry=entry, kind=kind, variant=variant)
+        .order_by("-id")
+        .first()
+    )
+
+
+def enqueue(entry, kind, source_path=None, variant=""):
+    """Queue a job unless one is already pending or running, and return it.
+
+    If the last attempt failed after source_path was last modified, it isn’t
+    retried, and the failed job is returned instead.
+    """
+    job = active_job(entry, kind, variant)
+    if job is not None:
+        return job
+
+    if source_path is not None:
+        last = latest_job(entry, kind, variant)
+        if (
+            last is not None
+            and last.status == Job.Status.FAILED
+            and last.finished_at.timestamp() > source_path.stat().st_mtime
+        ):
+            return last
+
+    try:
+        with transaction.atomic():
+            return Job.objects.create(entry=entry, kind=kind, variant=variant)
+    except IntegrityError:
+        # someone else queued it first
+        return active_job(entry, kind, variant)
+
+
+def claim_next(kinds=None):
+    """Atomically take the oldest runnable job, or return None.
+
+    Jobs left running for longer than GALLERY_JOB_TIMEOUT, presumably by a
+    worker that died, are runnable again. CPU-bound jobs aren’t runnable while
+    GALLERY_MAX_CONCURRENT_TRANSCODES of them are running.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.GALLERY_JOB_TIMEOUT)
+    runnable = Job.objects.filter(
+        Q(status=Job.Status.PENDING)
+        | Q(status=Job.Status.RUNNING, started_at__lt=stale)
+    )
+    if kinds:
+        runnable = runnable.filter(kind__in=kinds)
+
+    # Counted in the same UPDATE statement that claims the job, so that two
+    # workers can’t both see a free slot and take it
+    running_cpu_bound = (
+        Job.objects.filter(
+            kind__in=CPU_BOUND_KINDS,
+            status=Job.Status.RUNNING,
+            started_at__gte=stale,
+        )
+        .annotate(group=F("status"))
+        .values("group")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    has_free_slot = ~Q(kind__in=CPU_BOUND_KINDS) | Q(
+        running_cpu_bound__lt=settings.GALLERY_MAX_CONCURRENT_TRANSCODES
+    )
+
+    skipped = set()
+    while True:
+        job = runnable.exclude(pk__in=skipped).order_by("created_at", "id").first()
+        if job is None:
+            return None
+
+        claimed = (
+            Job.objects.filter(pk=job.pk, status=job.status, started_at=job.started_at)
+            .alias(running_cpu_bound=Coalesce(Subquery(running_cpu_bound), 0))
+            .filter(has_free_slot)
+            .update(
+                status=Job.Status.RUNNING,
+                started_at=timezone.now(),
+                attempts=F("attempts") + 1,
+            )
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # another worker got it first, or there’s no free slot for it; try the
+        # next one
+        skipped.add(job.pk)
+
+
+def run_job(job):
+    logger.info(f"Running {job}")
+    start = time.perf_counter()
+    try:
+        HANDLERS[job.kind](job)
+    except Exception:
+        logger.exception(f"{job} failed")
+        job.status = Job.Status.FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = Job.Status.DONE
+        job.error = ""
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "finished_at"])
+    seconds = time.perf_counter() - start
+    metrics.observe("gallery2_job_seconds", seconds, kind=job.kind, status=job.status)
+    logger.info(f"Finished {job} in {seconds:.1f}s")
+    return job
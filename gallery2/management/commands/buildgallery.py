@@ -1,18 +1,38 @@
 import argparse
-import os
-import shutil
+import itertools
+import json
+import multiprocessing
 from argparse import BooleanOptionalAction
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.template.loader import render_to_string
 
+from gallery2 import metrics
 from gallery2.models import Gallery, Entry
 from gallery2.thumbnails import ImageThumbnailExtractor, VideoThumbnailExtractor
-from gallery2.views import remux_if_necessary
-
-
-class Command(BaseCommand):
+from gallery2.publishing import COPY_METHODS, Publisher
+from gallery2.profiling import ProfileCommandMixin, add_profile_argument
+from gallery2.timing import StageReport, add_report_arguments, write_report
+from gallery2.video import (
+    HLS_FILENAME_RE,
+    HLS_PLAYLIST,
+    REMUXABLE_EXTENSIONS,
+    make_hls_if_necessary,
+    record_remux,
+    remux,
+    remux_if_necessary,
+    remux_is_current,
+    remux_output_path,
+    transcode_if_necessary,
+    transcode_rungs,
+)
+
+
+class Command(ProfileCommandMixin, BaseCommand):
     help = "Build a static gallery for publishing"
 
     def add_arguments(self, parser):
@@ -29,118 +49,216 @@ class Command(BaseCommand):
             action=BooleanOptionalAction,
             default=False,
         )
-
-    def handle(self, *args, gallery_id, output_dir, testing, **options):
+        parser.add_argument(
+            "--hls",
+            action=BooleanOptionalAction,
+            default=False,
+            help="Also publish videos as HLS playlists with fMP4 segments, so"
+            " that playback can start, and seeking can jump, without"
+            " downloading the whole file",
+        )
+        parser.add_argument(
+            "--transcode",
+            action=BooleanOptionalAction,
+            default=False,
+            help="Also publish H.264 renditions of videos from"
+            " GALLERY_TRANSCODE_LADDER, for browsers that can’t play HEVC",
+        )
+        parser.add_argument(
+            "--incremental",
+            action=BooleanOptionalAction,
+            default=False,
+            help="Only rewrite outputs that changed since the last build, and"
+            " delete ones that are no longer needed, instead of wiping the"
+            " output directory first",
+        )
+        parser.add_argument(
+            "--copy-method",
+            choices=["auto", *COPY_METHODS],
+            default="auto",
+            help="How to copy files into the output directory. auto, the"
+            " default, uses the first of these that works: a copy-on-write"
+            " clone, a hardlink, an in-kernel copy, then an ordinary copy",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="Make thumbnails, HLS segments, renditions and remuxes in"
+            " this many worker processes at once (default: 1)",
+        )
+        add_report_arguments(parser)
+        add_profile_argument(parser)
+
+    def handle(
+        self,
+        *args,
+        gallery_id,
+        output_dir,
+        testing,
+        hls,
+        transcode,
+        incremental,
+        copy_method,
+        jobs,
+        report,
+        report_file,
+        report_top,
+        **options,
+    ):
+        if jobs < 1:
+            raise CommandError("--jobs must be at least 1")
+        stage_report = StageReport("buildgallery", top_n=report_top)
+        self._build(
+            gallery_id,
+            output_dir,
+            testing,
+            stage_report,
+            hls=hls,
+            transcode=transcode,
+            incremental=incremental,
+            copy_method=copy_method,
+            jobs=jobs,
+        )
+        write_report(stage_report, report, report_file, stdout=self.stdout)
+
+    def _build(
+        self,
+        gallery_id,
+        output_dir,
+        testing,
+        report,
+        hls=False,
+        transcode=False,
+        incremental=False,
+        copy_method="auto",
+        jobs=1,
+    ):
         gallery = Gallery.objects.get(pk=gallery_id)
 
-        # Create publish directory (wipe if exists)
         publish_path = Path(output_dir)
-        if publish_path.exists():
+        publisher = Publisher(
+            publish_path, report, incremental=incremental, copy_method=copy_method
+        )
+        if publish_path.exists() and not incremental:
             self.stdout.write(f"Removing existing directory: {publish_path}")
-            shutil.rmtree(publish_path)
-
-        media_path = publish_path / "media"
-        os.makedirs(media_path, exist_ok=True)
+        publisher.prepare()
 
         self.stdout.write(f"Building gallery '{gallery.name}' to {publish_path}")
 
-        entries = (
-            Entry.objects.filter(gallery=gallery, hidden=False)
-            .exclude(caption="")
-            .order_by("order")
-        )
+        with report.stage("query") as timing:
+            entries = list(
+                Entry.objects.filter(gallery=gallery, hidden=False)
+                .exclude(caption="")
+                .order_by("order")
+            )
+            timing.count = len(entries)
 
         if not entries:
             self.stdout.write(
                 self.style.WARNING("No visible entries with captions found")
             )
+            publisher.finish()
             return
 
-        self.stdout.write(f"Found {entries.count()} entries to publish")
+        self.stdout.write(f"Found {len(entries)} entries to publish")
 
-        # Process each entry
-        published_entries = []
-        for i, entry in enumerate(entries):
-            self.stdout.write(f"Processing entry: {entry.basename}")
-
-            image_file = None
-            video_file = None
+        # Scripts and stylesheets, by e.g. gallery_css for css/gallery.css
+        assets = {}
+        assets_source_path = Path(__file__).parent.parent.parent / "publish_assets"
+        for directory in ["js", "css"]:
+            for f in (assets_source_path / directory).glob(f"*.{directory}"):
+                if f.name.startswith("."):
+                    continue
+                stem = f.name.removesuffix(f.suffix)
+                assets[f.name.replace(".", "_")] = publisher.publish_hashed(
+                    f, directory, stem
+                )
+                self.stdout.write(f"  Copied {f.name} to {directory}")
 
-            for filename in entry.filenames:
-                if ImageThumbnailExtractor.can_handle(filename):
-                    original_path = Path(gallery.directory) / filename
-                    if original_path.exists():
-                        image_file = original_path
-                        break
+        works = [self._plan(gallery, entry, hls, transcode) for entry in entries]
+        derivatives = self._make_derivatives(
+            [work for work in works if work is not None], jobs, report.top_n
+        )
 
-            for filename in entry.filenames:
-                if VideoThumbnailExtractor.can_handle(filename):
-                    original_path = Path(gallery.directory) / filename
-                    if original_path.exists():
-                        video_file = original_path
-                        break
+        # Publish each entry, in order, as its derivatives are ready
+        published_entries = []
+        for i, (entry, work) in enumerate(zip(entries, works)):
+            self.stdout.write(f"Processing entry: {entry.basename}")
 
-            if not image_file and not video_file:
+            if work is None:
                 self.stdout.write(
                     self.style.WARNING(f"No original files found for entry {entry.id}")
                 )
                 continue
 
-            # Default to image file if both are available
-            primary_file = image_file if image_file else video_file
-            file_type = "image" if image_file else "video"
-
-            extension = primary_file.suffix.lower()
-
-            dest_filename = Path(f"{i:04d}{extension}")
-            dest_path = media_path / dest_filename
-
-            # For images, use thumbnail instead of original file
-            if file_type == "image":
-                # Create thumbnail extractor
-                thumbnail_extractor = ImageThumbnailExtractor(
-                    gallery.id, entry.id, 1600
-                )
-                thumbnail_path = thumbnail_extractor.get_thumbnail(primary_file)
-
-                dest_filename = dest_filename.with_suffix(thumbnail_path.suffix)
-                dest_path = dest_path.with_suffix(thumbnail_path.suffix)
-
-                # Copy the thumbnail instead of the original
-                shutil.copy2(thumbnail_path, dest_path)
+            made = next(derivatives)
+            report.merge(*made["report"])
+            image_file = work["image_file"]
+            video_file = work["video_file"]
+            primary_file = work["primary_file"]
+
+            # For images, and video-only entries, publish a thumbnail instead
+            # of the original file
+            extractor = work["extractor"]
+            if made["thumbnail"] is not None:
+                thumbnail_path = extractor.save_thumbnail(**made["thumbnail"])
+            else:
+                thumbnail_path = extractor.get_thumbnail(primary_file)
+            dest_filename = publisher.publish_hashed(thumbnail_path, "media")
+            if image_file:
                 self.stdout.write(
-                    f"  Copied thumbnail for {primary_file.name} to {dest_path}"
+                    f"  Copied thumbnail for {primary_file.name} to {dest_filename}"
                 )
             else:
-                # video-only file; generate a thumbnail and treat as image
-                assert video_file
+                self.stdout.write(
+                    f"  Copied thumbnail for video {video_file.name} to {dest_filename}"
+                )
 
-                extractor = VideoThumbnailExtractor(
-                    gallery_id=gallery.id, entry_id=entry.id, size=1600
+            video_filename = None
+            hls_playlist = None
+            if made["hls_dir"] is not None:
+                hls_dest_dir = publisher.publish_hashed_dir(
+                    [
+                        f
+                        for f in made["hls_dir"].iterdir()
+                        if HLS_FILENAME_RE.match(f.name)
+                    ],
+                    "media",
+                    ".hls",
                 )
-                thumbnail_path = extractor.get_thumbnail(video_file)
+                self.stdout.write(f"  Copied HLS segments to {hls_dest_dir}")
+                hls_playlist = f"{hls_dest_dir}/{HLS_PLAYLIST}"
 
-                dest_filename = dest_filename.with_suffix(thumbnail_path.suffix)
-                dest_path = dest_path.with_suffix(thumbnail_path.suffix)
-                shutil.copy2(thumbnail_path, dest_path)
+            video_sources = []
+            for rung, rendition in made["renditions"]:
+                rendition_dest = publisher.publish_hashed(
+                    rendition, "media", rung["name"]
+                )
                 self.stdout.write(
-                    f"  Copied thumbnail for video {video_file.name} to {dest_path}"
+                    f"  Copied {rung['name']} rendition to {rendition_dest}"
+                )
+                video_sources.append(
+                    {
+                        "src": rendition_dest,
+                        "media": rung.get("media"),
+                    }
                 )
 
-            video_filename = None
             if video_file:
+                if work["remux_to"] is not None:
+                    record_remux(entry, video_file)
                 video_file = remux_if_necessary(entry, video_file)
 
-                video_extension = video_file.suffix.lower()
-                video_dest_filename = f"{i:04d}{video_extension}"
-                video_dest_path = media_path / video_dest_filename
-
-                shutil.copy2(video_file, video_dest_path)
-                self.stdout.write(f"  Copied {video_file.name} to {video_dest_path}")
+                video_dest_filename = publisher.publish_hashed(video_file, "media")
+                self.stdout.write(
+                    f"  Copied {video_file.name} to {video_dest_filename}"
+                )
                 video_filename = video_dest_filename
 
             # in case width, height filled in during thumbnail generation
-            entry.refresh_from_db()
+            with report.stage("db"):
+                entry.refresh_from_db()
             published_entries.append(
                 {
                     "id": entry.id,
@@ -148,7 +266,12 @@ class Command(BaseCommand):
                     "has_image": bool(image_file),
                     "has_video": bool(video_file),
                     "video_filename": video_filename,
+                    "hls_playlist": hls_playlist,
+                    "video_sources": (
+                        json.dumps(video_sources) if video_sources else None
+                    ),
                     "caption": entry.caption,
+                    "caption_html": entry.rendered_caption,
                     "timestamp": entry.timestamp,
                     "width": entry.width,
                     "height": entry.height,
@@ -160,41 +283,141 @@ class Command(BaseCommand):
             "testing": testing,
             "gallery": gallery,
             "entries": published_entries,
+            "assets": assets,
         }
 
-        html_content = render_to_string("gallery2/gallery_publish.html", context)
-
-        # Write the HTML to index.html
-        with open(publish_path / "index.html", "w") as f:
-            f.write(html_content)
-
-        assets_source_path = Path(__file__).parent.parent.parent / "publish_assets"
+        with report.stage("render") as timing:
+            html = render_to_string("gallery2/gallery_publish.html", context).encode()
+            timing.bytes_written = len(html)
+        publisher.publish_bytes(html, "index.html")
 
+        # Not renamed, so that captions can link to them
         public_src = Path(gallery.directory) / "media" / "public"
-        public_publish_dir = media_path / "public"
-        os.makedirs(public_publish_dir, exist_ok=True)
         for f in (public_src).glob("*"):
             if f.name.startswith("."):
                 continue
-            shutil.copy2(f, public_publish_dir)
-            self.stdout.write(f"  Copied {f.name} to {public_publish_dir}")
-
-        js_dir = publish_path / "js"
-        os.makedirs(js_dir, exist_ok=True)
-        for js_file in (assets_source_path / "js").glob("*.js"):
-            if f.name.startswith("."):
-                continue
-            shutil.copy2(js_file, js_dir)
-            self.stdout.write(f"  Copied {js_file.name} to {js_dir}")
-
-        css_dir = publish_path / "css"
-        os.makedirs(css_dir, exist_ok=True)
-        for css_file in (assets_source_path / "css").glob("*.css"):
-            if f.name.startswith("."):
-                continue
-            shutil.copy2(css_file, css_dir)
-            self.stdout.write(f"  Copied {css_file.name} to {css_dir}")
+            publisher.publish_file(f, f"media/public/{f.name}")
+            self.stdout.write(f"  Copied {f.name} to media/public")
 
+        removed = publisher.finish()
+        copied_by = ", ".join(
+            f"{count} by {method}" for method, count in publisher.copied_by.items()
+        )
+        self.stdout.write(
+            f"{publisher.written} files written ({copied_by or 'none copied'}),"
+            f" {publisher.unchanged} unchanged, {removed} removed"
+        )
         self.stdout.write(
             self.style.SUCCESS(f"Gallery published successfully to {publish_path}")
         )
+
+    def _plan(self, gallery, entry, hls, transcode):
+        """What make_derivatives() has to do for entry, or None if its files
+        are missing. This is where the database is read, so that the workers
+        don’t have to."""
+        image_file = None
+        video_file = None
+
+        for filename in entry.filenames:
+            if ImageThumbnailExtractor.can_handle(filename):
+                original_path = Path(gallery.directory) / filename
+                if original_path.exists():
+                    image_file = original_path
+                    break
+
+        for filename in entry.filenames:
+            if VideoThumbnailExtractor.can_handle(filename):
+                original_path = Path(gallery.directory) / filename
+                if original_path.exists():
+                    video_file = original_path
+                    break
+
+        if not image_file and not video_file:
+            return None
+
+        # Default to image file if both are available
+        if image_file:
+            primary_file = image_file
+            extractor = ImageThumbnailExtractor(gallery.id, entry.id, 1600)
+        else:
+            primary_file = video_file
+            extractor = VideoThumbnailExtractor(
+                gallery_id=gallery.id, entry_id=entry.id, size=1600
+            )
+
+        remux_to = None
+        if (
+            video_file
+            and video_file.suffix.lower() in REMUXABLE_EXTENSIONS
+            and not remux_is_current(entry, video_file)
+        ):
+            remux_to = remux_output_path(entry)
+
+        return {
+            "entry": entry,
+            "image_file": image_file,
+            "video_file": video_file,
+            "primary_file": primary_file,
+            "extractor": extractor,
+            "render": not extractor.is_current(primary_file),
+            "hls": bool(video_file and hls),
+            "transcode": bool(video_file and transcode),
+            "remux_to": remux_to,
+        }
+
+    def _make_derivatives(self, works, jobs, top_n):
+        """make_derivatives() for each of works, yielded in order, in a pool
+        of `jobs` worker processes if that’s more than 1."""
+        if jobs == 1:
+            for work in works:
+                yield make_derivatives(work, top_n)
+            return
+
+        # The workers are forked, so that they start with Django set up the
+        # same way; they mustn’t share the database connections, though
+        connections.close_all()
+        with ProcessPoolExecutor(
+            jobs,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+        ) as pool:
+            yield from pool.map(make_derivatives, works, itertools.repeat(top_n))
+
+
+def _init_worker():
+    # Samples recorded before the fork are for the parent to flush
+    metrics.discard()
+    # Pool workers exit without running atexit handlers
+    Finalize(None, metrics.finalize, exitpriority=0)
+
+
+def make_derivatives(work, top_n):
+    """Make the thumbnail, HLS segments, renditions and remuxed video that
+    work, from Command._plan(), needs. Runs in a worker process with --jobs,
+    so it only touches files, and returns what the command should record and
+    publish."""
+    report = StageReport("buildgallery", top_n=top_n)
+    entry = work["entry"]
+    video_file = work["video_file"]
+    made = {"thumbnail": None, "hls_dir": None, "renditions": []}
+
+    if work["render"]:
+        with report.stage("thumbnail", path=work["primary_file"]):
+            made["thumbnail"] = work["extractor"].render_thumbnail(work["primary_file"])
+
+    if work["hls"]:
+        with report.stage("hls", path=video_file):
+            made["hls_dir"] = make_hls_if_necessary(entry, video_file)
+
+    if work["transcode"]:
+        for rung in transcode_rungs(video_file):
+            with report.stage("transcode", path=video_file):
+                rendition = transcode_if_necessary(entry, video_file, rung)
+            made["renditions"].append((rung, rendition))
+
+    if work["remux_to"] is not None:
+        with report.stage("remux", path=video_file):
+            remux(video_file, work["remux_to"])
+
+    made["report"] = (report.stages, report.slowest())
+    return made
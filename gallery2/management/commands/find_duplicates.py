@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery2.models import Entry, Gallery
+from gallery2.phash import DEFAULT_MAX_DISTANCE, BKTree, ensure_entry_phash
+
+
+class Command(BaseCommand):
+    help = "List groups of near-duplicate entries in a gallery"
+
+    def add_arguments(self, parser):
+        parser.add_argument("gallery_id", type=int, help="ID of the gallery to check")
+        parser.add_argument(
+            "--max-distance",
+            type=int,
+            default=DEFAULT_MAX_DISTANCE,
+            help="Most differing perceptual-hash bits (out of 64) to still count"
+            f" as a near-duplicate (default: {DEFAULT_MAX_DISTANCE})",
+        )
+
+    def handle(self, *args, gallery_id, max_distance, **options):
+        try:
+            gallery = Gallery.objects.get(pk=gallery_id)
+        except Gallery.DoesNotExist:
+            raise CommandError(f"Gallery with ID {gallery_id} does not exist")
+
+        entries = list(
+            Entry.objects.filter(gallery=gallery)
+            .select_related("gallery")
+            .order_by("order")
+        )
+
+        tree = BKTree()
+        hashes = {}
+        for entry in entries:
+            try:
+                value = ensure_entry_phash(entry)
+            except Exception as e:
+                self.stdout.write(
+                    self.style.WARNING(f"Could not hash '{entry.basename}': {e}")
+                )
+                continue
+            if value is None:
+                continue
+            hashes[entry.id] = value
+            tree.add(value, entry)
+
+        groups = self.find_groups(entries, hashes, tree, max_distance)
+
+        for group in groups:
+            self.stdout.write(
+                "Near-duplicates: " + ", ".join(f"{e.basename} ({e.id})" for e in group)
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {len(hashes)} entries, found {len(groups)} groups"
+            )
+        )
+
+    def find_groups(self, entries, hashes, tree, max_distance):
+        """Connected components of the within-max_distance graph, in entry order."""
+        parent = {}
+
+        def find(x):
+            while parent.get(x, x) != x:
+                x = parent[x]
+            return x
+
+        for entry in entries:
+            if entry.id not in hashes:
+                continue
+            for _, other in tree.search(hashes[entry.id], max_distance):
+                a, b = find(entry.id), find(other.id)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+        groups = {}
+        for entry in entries:
+            if entry.id in hashes:
+                groups.setdefault(find(entry.id), []).append(entry)
+        return [g for g in groups.values() if len(g) > 1]
@@ -4,17 +4,29 @@ import re
 from collections import defaultdict
 from datetime import datetime, timezone
 
-from PIL import Image, ExifTags
+from PIL import ExifTags
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.db.models import Min
 
+from gallery2 import jobs
 from gallery2.files import MEDIA_EXTENSIONS, IMAGE_EXTENSIONS
-from gallery2.models import Entry, Gallery
+from gallery2.images import Image
+from gallery2.models import Entry, Gallery, Job
+from gallery2.phash import (
+    DEFAULT_MAX_DISTANCE,
+    BKTree,
+    dhash_file,
+    ensure_entry_phash,
+    format_hash,
+)
+from gallery2.profiling import ProfileCommandMixin, add_profile_argument
+from gallery2.timing import StageReport, add_report_arguments, write_report
 from gallery2.utils import timestamp_to_order
+from gallery2.video import find_video_source
 
 
-class Command(BaseCommand):
+class Command(ProfileCommandMixin, BaseCommand):
     help = "Import images from a directory into a gallery"
 
     def add_arguments(self, parser):
@@ -24,10 +36,30 @@ class Command(BaseCommand):
         parser.add_argument(
             "gallery_id", type=int, help="ID of the gallery to import images into"
         )
+        parser.add_argument(
+            "--skip-near-duplicates",
+            action="store_true",
+            help="Don’t import images that look the same as an existing entry",
+        )
+        parser.add_argument(
+            "--max-distance",
+            type=int,
+            default=DEFAULT_MAX_DISTANCE,
+            help="Most differing perceptual-hash bits (out of 64) to still count"
+            f" as a near-duplicate (default: {DEFAULT_MAX_DISTANCE})",
+        )
+        parser.add_argument(
+            "--remux",
+            action="store_true",
+            help="Queue remux jobs for imported videos, for runworker to pick up",
+        )
+        add_report_arguments(parser)
+        add_profile_argument(parser)
 
     def handle(self, *args, **options):
         directory_path = pathlib.Path(options["directory"])
         gallery_id = options["gallery_id"]
+        report = StageReport("importimages", top_n=options["report_top"])
 
         if not directory_path.exists() or not directory_path.is_dir():
             raise CommandError(
@@ -46,11 +78,13 @@ class Command(BaseCommand):
             f"Importing images from '{directory_path}' into gallery '{gallery.name}'"
         )
 
-        image_files = [
-            f
-            for f in directory_path.iterdir()
-            if f.is_file() and f.suffix.lower() in MEDIA_EXTENSIONS
-        ]
+        with report.stage("list") as timing:
+            image_files = [
+                f
+                for f in directory_path.iterdir()
+                if f.is_file() and f.suffix.lower() in MEDIA_EXTENSIONS
+            ]
+            timing.count = len(image_files)
 
         basename_groups = {}
         for image_file in image_files:
@@ -64,6 +98,28 @@ class Command(BaseCommand):
         created_count = 0
         skipped_count = 0
         entries_to_create = []
+        created_entries = []
+
+        near_duplicates = None
+        if options["skip_near_duplicates"]:
+            near_duplicates = BKTree()
+            with report.stage("phash") as timing:
+                existing = Entry.objects.filter(gallery=gallery).select_related(
+                    "gallery"
+                )
+                for entry in existing:
+                    try:
+                        value = ensure_entry_phash(entry)
+                    except Exception as e:
+                        self.stdout.write(
+                            self.style.WARNING(
+                                f"Could not hash '{entry.basename}': {e}"
+                            )
+                        )
+                        continue
+                    if value is not None:
+                        near_duplicates.add(value, entry.basename)
+                timing.count = len(near_duplicates)
 
         # First pass: collect all entries to create with their timestamps
         for basename, files in basename_groups.items():
@@ -76,7 +132,8 @@ class Command(BaseCommand):
             for file_path in files:
                 if file_path.suffix.lower() in IMAGE_EXTENSIONS:
                     try:
-                        timestamp = self.extract_timestamp(file_path)
+                        with report.stage("exif", path=file_path):
+                            timestamp = self.extract_timestamp(file_path)
                         if timestamp:
                             break
                     except Exception as e:
@@ -87,12 +144,33 @@ class Command(BaseCommand):
                         )
             filenames_list = [file.name for file in files]
 
+            phash = None
+            if near_duplicates is not None:
+                try:
+                    phash = self.near_duplicate_hash(files, report)
+                except Exception as e:
+                    self.stdout.write(
+                        self.style.WARNING(f"Could not hash '{basename}': {e}")
+                    )
+                if phash is not None:
+                    matches = near_duplicates.search(phash, options["max_distance"])
+                    if matches:
+                        distance, other = matches[0]
+                        self.stdout.write(
+                            f"Skipping '{basename}' - near duplicate of '{other}'"
+                            f" (distance {distance})"
+                        )
+                        skipped_count += 1
+                        continue
+                    near_duplicates.add(phash, basename)
+
             entries_to_create.append(
                 {
                     "basename": basename,
                     "filenames": filenames_list,
                     "timestamp": timestamp,
                     "files": files,
+                    "phash": format_hash(phash) if phash is not None else None,
                 }
             )
 
@@ -106,7 +184,7 @@ class Command(BaseCommand):
             order_value = timestamp_to_order(entry_data["timestamp"])
             order_groups[order_value].append(entry_data)
 
-        with transaction.atomic():
+        with report.stage("db") as db_timing, transaction.atomic():
             for order_value, entries in order_groups.items():
                 if order_value is None:
                     min_order = min(
@@ -125,17 +203,29 @@ class Command(BaseCommand):
 
                     unique_order = order_value + (1e-6 * i) if i > 0 else order_value
 
-                    Entry.objects.create(
+                    entry = Entry.objects.create(
                         gallery=gallery,
                         basename=entry_data["basename"],
                         filenames=entry_data["filenames"],
                         order=unique_order,
                         caption="",
                         timestamp=entry_data["timestamp"],
+                        phash=entry_data["phash"],
                     )
+                    created_entries.append(entry)
 
                     self.stdout.write(f"Created entry for '{entry_data['basename']}'")
                     created_count += 1
+            db_timing.count = created_count
+
+        if options["remux"]:
+            queued = 0
+            for entry in created_entries:
+                video_path = find_video_source(entry)
+                if video_path is not None:
+                    jobs.enqueue(entry, Job.Kind.REMUX, source_path=video_path)
+                    queued += 1
+            self.stdout.write(f"Queued {queued} remux jobs")
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -143,6 +233,18 @@ class Command(BaseCommand):
             )
         )
 
+        write_report(
+            report, options["report"], options["report_file"], stdout=self.stdout
+        )
+
+    def near_duplicate_hash(self, files, report):
+        """Perceptual hash of the first image in files, or None if video-only."""
+        for file_path in files:
+            if file_path.suffix.lower() in IMAGE_EXTENSIONS:
+                with report.stage("phash", path=file_path):
+                    return dhash_file(file_path)
+        return None
+
     def extract_timestamp(self, file_path):
         """
         Extract timestamp from image EXIF data if available.
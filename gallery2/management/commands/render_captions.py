@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from gallery2.captions import renderer_version
+from gallery2.models import Entry, Gallery
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Render stored caption HTML for entries whose caption_html is missing"
+        " or was made with different markdown settings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every caption, not just stale ones",
+        )
+
+    def handle(self, *args, all, **options):
+        entries = Entry.objects.only(
+            "id", "gallery_id", "caption", "caption_html_version"
+        )
+        if not all:
+            entries = entries.exclude(caption_html_version=renderer_version())
+
+        count = 0
+        batch = []
+        for entry in entries.iterator(chunk_size=BATCH_SIZE):
+            if all:
+                entry.caption_html_version = ""
+            entry.render_caption_if_stale()
+            batch.append(entry)
+            if len(batch) >= BATCH_SIZE:
+                count += self.save(batch)
+                batch = []
+        count += self.save(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered {count} captions"))
+
+    def save(self, batch):
+        Entry.objects.bulk_update(batch, ["caption_html", "caption_html_version"])
+        Gallery.bump_revisions({entry.gallery_id for entry in batch})
+        return len(batch)
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from gallery2 import jobs
+from gallery2.models import Job
+
+
+class Command(BaseCommand):
+    help = "Run queued jobs, such as video remuxes, as they come in"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for more jobs",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between checks of an empty queue (default: 2)",
+        )
+        parser.add_argument(
+            "--kind",
+            action="append",
+            choices=Job.Kind.values,
+            help="Only run jobs of this kind; may be repeated",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="Run up to this many jobs at once (default: 1); transcodes are"
+            " still limited by GALLERY_MAX_CONCURRENT_TRANSCODES",
+        )
+
+    def handle(self, *args, once, poll_interval, kind, threads, **options):
+        if threads == 1:
+            self.work(once, poll_interval, kind)
+            return
+
+        workers = [
+            threading.Thread(
+                target=self.work_in_thread, args=(once, poll_interval, kind)
+            )
+            for _ in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def work_in_thread(self, *args):
+        try:
+            self.work(*args)
+        finally:
+            connection.close()
+
+    def work(self, once, poll_interval, kind):
+        while True:
+            job = jobs.claim_next(kind)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            self.stdout.write(f"Running job {job.id}: {job}")
+            jobs.run_job(job)
+            if job.status == Job.Status.FAILED:
+                self.stdout.write(
+                    self.style.ERROR(f"Job {job.id} failed:\n{job.error}")
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Job {job.id} done"))
@@ -0,0 +1,259 @@
+"""
+Counters and histograms for operations, exported in the Prometheus text format.
+
+Each process adds up its samples in memory, and every
+GALLERY_METRICS_FLUSH_INTERVAL seconds adds them into a shared SQLite file,
+GALLERY_METRICS_DB, so the numbers cover all uwsgi workers and management
+commands. Counter and histogram series are stored as running totals, so
+flushing is an upsert that adds. Gauges like the exiftool queue are instead
+set absolutely, and stored per process, so that a process that dies without
+cleaning up can be dropped from the total instead of leaving it off forever.
+With GALLERY_METRICS_DB unset, recording does nothing.
+"""
+
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# name -> (type, help)
+METRICS = {
+    "gallery2_thumbnail_requests_total": (
+        "counter",
+        "Thumbnail lookups, by whether a current thumbnail already existed",
+    ),
+    "gallery2_thumbnail_seconds": (
+        "histogram",
+        "Time to make a thumbnail, by extractor and size",
+    ),
+    "gallery2_exiftool_queue": (
+        "gauge",
+        "exiftool queries waiting for or holding the exiftool process",
+    ),
+    "gallery2_job_seconds": ("histogram", "Time to run a queued job, by kind"),
+    "gallery2_jobs": ("gauge", "Jobs in the queue, by kind and status"),
+}
+
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float("inf"))
+
+_lock = threading.Lock()
+# (name, labels json) -> value to add
+_pending = {}
+# (name, labels json) -> this process’s current value
+_pending_gauges = {}
+# Whether this process has ever set a gauge, so has rows to delete at exit
+_set_gauges = False
+_last_flush = time.monotonic()
+
+
+def _enabled():
+    return settings.GALLERY_METRICS_DB is not None
+
+
+def _key(name, labels):
+    return name, json.dumps(labels, sort_keys=True)
+
+
+def _add(name, labels, value):
+    key = _key(name, labels)
+    _pending[key] = _pending.get(key, 0) + value
+
+
+def inc(name, value=1, **labels):
+    if not _enabled():
+        return
+    with _lock:
+        _add(name, labels, value)
+    _maybe_flush()
+
+
+def set_gauge(name, value, **labels):
+    """Set this process’s part of the gauge name, which is exported as the
+    sum over all live processes."""
+    global _set_gauges
+    if not _enabled():
+        return
+    with _lock:
+        _pending_gauges[_key(name, labels)] = value
+        _set_gauges = True
+    _maybe_flush()
+
+
+def observe(name, seconds, **labels):
+    """Record seconds in the histogram name."""
+    if not _enabled():
+        return
+    with _lock:
+        for le in BUCKETS:
+            _add(f"{name}_bucket", {**labels, "le": _format_le(le)}, seconds <= le)
+        _add(f"{name}_sum", labels, seconds)
+        _add(f"{name}_count", labels, 1)
+    _maybe_flush()
+
+
+def _format_le(le):
+    return "+Inf" if le == float("inf") else repr(float(le))
+
+
+def _connect():
+    path = Path(settings.GALLERY_METRICS_DB)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path, timeout=5)
+    db.execute(
+        "create table if not exists samples"
+        " (name text, labels text, value real, primary key (name, labels))"
+    )
+    db.execute(
+        "create table if not exists gauges (name text, labels text, host text,"
+        " pid integer, value real, primary key (name, labels, host, pid))"
+    )
+    return db
+
+
+def _process():
+    # Containers sharing the database have separate pid namespaces
+    return socket.gethostname(), os.getpid()
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= settings.GALLERY_METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """Add this process’s samples into the shared database."""
+    global _pending, _pending_gauges, _last_flush
+    with _lock:
+        pending, _pending = _pending, {}
+        gauges, _pending_gauges = _pending_gauges, {}
+        _last_flush = time.monotonic()
+    if not (pending or gauges) or not _enabled():
+        return
+    host, pid = _process()
+    with _connect() as db:
+        db.executemany(
+            "insert into samples (name, labels, value) values (?, ?, ?)"
+            " on conflict (name, labels) do update"
+            " set value = value + excluded.value",
+            [(name, labels, value) for (name, labels), value in pending.items()],
+        )
+        db.executemany(
+            "insert or replace into gauges (name, labels, host, pid, value)"
+            " values (?, ?, ?, ?, ?)",
+            [
+                (name, labels, host, pid, value)
+                for (name, labels), value in gauges.items()
+            ],
+        )
+    db.close()
+
+
+def finalize():
+    """Flush, and take this process out of the gauges. This runs at exit;
+    processes that skip atexit handlers, like multiprocessing workers, must
+    call it themselves."""
+    flush()
+    if not _set_gauges or not _enabled():
+        return
+    with _connect() as db:
+        db.execute("delete from gauges where host = ? and pid = ?", _process())
+    db.close()
+
+
+atexit.register(finalize)
+
+
+def discard():
+    """Forget this process’s unflushed samples, as a forked child must for
+    the ones it inherited from its parent."""
+    global _pending, _pending_gauges, _set_gauges
+    with _lock:
+        _pending = {}
+        _pending_gauges = {}
+        _set_gauges = False
+
+
+def _gauge_samples(db):
+    """Each gauge summed over the processes still running, after deleting
+    those of processes on this host that are gone."""
+    host = socket.gethostname()
+    rows = db.execute("select distinct pid from gauges where host = ?", (host,))
+    dead = [(host, pid) for (pid,) in rows.fetchall() if not _pid_exists(pid)]
+    db.executemany("delete from gauges where host = ? and pid = ?", dead)
+    return db.execute(
+        "select name, labels, sum(value) from gauges group by name, labels"
+    ).fetchall()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    # le goes last, by convention
+    items = sorted(labels.items(), key=lambda item: item[0] == "le")
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _sort_key(sample):
+    name, labels, _ = sample
+    le = labels.get("le")
+    others = sorted((k, str(v)) for k, v in labels.items() if k != "le")
+    return name, others, float(le) if le is not None else 0
+
+
+def _base_name(name):
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name.removesuffix(suffix) in METRICS:
+            return name.removesuffix(suffix)
+    return name
+
+
+def export(extra_samples=()):
+    """All metrics in the Prometheus text format. extra_samples are
+    (name, labels, value) tuples computed at scrape time."""
+    flush()
+    samples = []
+    if _enabled():
+        with _connect() as db:
+            rows = db.execute(
+                "select name, labels, value from samples order by name, labels"
+            ).fetchall()
+            rows.extend(_gauge_samples(db))
+        db.close()
+        samples = [(name, json.loads(labels), value) for name, labels, value in rows]
+    samples.extend(extra_samples)
+
+    by_metric = {}
+    for name, labels, value in samples:
+        by_metric.setdefault(_base_name(name), []).append((name, labels, value))
+
+    lines = []
+    for metric, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for name, labels, value in sorted(by_metric.get(metric, []), key=_sort_key):
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery2", "0012_gallery_og_image_gallery_og_url"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="phash",
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-19 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery2", "0014_job"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="job",
+            name="kind",
+            field=models.CharField(
+                choices=[("remux", "Remux"), ("hls", "HLS")], max_length=32
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-19 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery2", "0015_job_kind_hls"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="job",
+            name="one_active_job_per_entry_and_kind",
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="variant",
+            field=models.CharField(blank=True, default="", max_length=32),
+        ),
+        migrations.AlterField(
+            model_name="job",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("remux", "Remux"),
+                    ("hls", "HLS"),
+                    ("transcode", "Transcode"),
+                ],
+                max_length=32,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="job",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["pending", "running"])),
+                fields=("kind", "entry", "variant"),
+                name="one_active_job_per_entry_kind_and_variant",
+            ),
+        ),
+    ]
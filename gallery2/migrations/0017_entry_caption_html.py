@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery2", "0016_job_variant"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="caption_html",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="caption_html_version",
+            field=models.CharField(blank=True, default="", max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery2", "0017_entry_caption_html"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
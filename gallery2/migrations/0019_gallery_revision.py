@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery2", "0018_entry_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gallery",
+            name="revision",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2 on 2026-10-19 06:58
+
+import re
+from pathlib import PurePath
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+THUMBNAIL_SIZE_RE = re.compile(r"_thumb_(\d+)\.")
+
+
+def copy_thumbnails_to_derivatives(apps, schema_editor):
+    Entry = apps.get_model("gallery2", "Entry")
+    Derivative = apps.get_model("gallery2", "Derivative")
+    derivatives = []
+    for entry in Entry.objects.exclude(main_thumbnail_path=None).exclude(
+        main_thumbnail_path=""
+    ):
+        path = PurePath(entry.main_thumbnail_path)
+        match = THUMBNAIL_SIZE_RE.search(path.name)
+        if not match:
+            continue
+        derivatives.append(
+            Derivative(
+                entry=entry,
+                size=int(match.group(1)),
+                format=path.suffix[1:],
+                path=str(path),
+                source_mtimes=entry.mtimes or [],
+            )
+        )
+    Derivative.objects.bulk_create(derivatives)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery2", "0019_gallery_revision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Derivative",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("size", models.PositiveIntegerField()),
+                ("format", models.CharField(max_length=8)),
+                ("path", models.CharField(max_length=255)),
+                ("source_mtimes", models.JSONField(default=list)),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="derivatives",
+                        to="gallery2.entry",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("entry", "size", "format"),
+                        name="one_derivative_per_entry_size_and_format",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(copy_thumbnails_to_derivatives, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="entry",
+            name="main_thumbnail_path",
+        ),
+        migrations.RemoveField(
+            model_name="entry",
+            name="mtimes",
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils.safestring import mark_safe
 import reversion
 
+from gallery2.captions import render_caption, renderer_version
+
 DEFAULT_MAX_LENGTH = 255
 
 
@@ -10,28 +13,170 @@ class Gallery(models.Model):
     og_url = models.TextField(blank=True, null=True)
     # internet suggests dimensions 1200×630
     og_image = models.TextField(blank=True, null=True)
+    # bumped by every change to the gallery or its entries; see gallery2.etags
+    revision = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, update_fields=None, **kwargs):
+        bumped = not self._state.adding
+        if bumped:
+            # in the database, as entries may have bumped it since this loaded
+            self.revision = models.F("revision") + 1
+            if update_fields is not None:
+                update_fields = {*update_fields, "revision"}
+        super().save(*args, update_fields=update_fields, **kwargs)
+        if bumped:
+            self.refresh_from_db(fields=["revision"])
+
+    @staticmethod
+    def bump_revisions(gallery_ids):
+        """Mark galleries as changed, after bulk changes to their entries."""
+        Gallery.objects.filter(pk__in=gallery_ids).update(
+            revision=models.F("revision") + 1
+        )
+
 
 @reversion.register()
 class Entry(models.Model):
     gallery = models.ForeignKey(Gallery, on_delete=models.CASCADE)
     basename = models.CharField(max_length=DEFAULT_MAX_LENGTH)
     filenames = models.JSONField(default=list)
-    mtimes = models.JSONField(default=list, null=True, blank=True)
     video_mtimes = models.JSONField(default=list, null=True, blank=True)
     order = models.FloatField()
     caption = models.TextField(blank=True)
+    # caption rendered by gallery2.captions, and the renderer_version() used
+    caption_html = models.TextField(blank=True, default="")
+    caption_html_version = models.CharField(max_length=16, blank=True, default="")
     timestamp = models.DateTimeField(null=True, blank=True)
     hidden = models.BooleanField(default=False)
     width = models.IntegerField(null=True, blank=True)
     height = models.IntegerField(null=True, blank=True)
-    main_thumbnail_path = models.CharField(null=True, blank=True)
+    # perceptual hash as 16 hex digits, see gallery2.phash
+    phash = models.CharField(max_length=16, null=True, blank=True)
+    # bumped on every save, for cache keys; see gallery2.fragments
+    version = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ("gallery", "order")
 
     def __str__(self):
         return f"{self.id} {self.basename}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # deferred when loaded with .only()
+        instance._rendered_caption = instance.__dict__.get("caption")
+        return instance
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None or "caption" in update_fields:
+            if self.render_caption_if_stale() and update_fields is not None:
+                update_fields = {*update_fields, "caption_html", "caption_html_version"}
+        self.version += 1
+        if update_fields is not None:
+            update_fields = {*update_fields, "version"}
+        super().save(*args, update_fields=update_fields, **kwargs)
+        Gallery.bump_revisions([self.gallery_id])
+
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        Gallery.bump_revisions([self.gallery_id])
+        return ret
+
+    def render_caption_if_stale(self):
+        """Re-render caption_html if the caption or the renderer has changed
+        since it was rendered, and return whether it was."""
+        version = renderer_version()
+        if (
+            self.caption_html_version == version
+            and getattr(self, "_rendered_caption", None) == self.caption
+        ):
+            return False
+        self.caption_html = render_caption(self.caption)
+        self.caption_html_version = version
+        self._rendered_caption = self.caption
+        return True
+
+    @property
+    def rendered_caption(self):
+        """The caption as HTML, from caption_html unless that is stale, as it
+        is until render_captions has run after a renderer change."""
+        if self.caption_html_version != renderer_version():
+            return mark_safe(render_caption(self.caption))
+        return mark_safe(self.caption_html)
+
+
+class Derivative(models.Model):
+    """A file made from an entry’s original, like a thumbnail, kept per size
+    and format so that different sizes of the same entry don’t replace each
+    other."""
+
+    entry = models.ForeignKey(
+        Entry, on_delete=models.CASCADE, related_name="derivatives"
+    )
+    size = models.PositiveIntegerField()
+    format = models.CharField(max_length=8)
+    # relative to MEDIA_ROOT/thumbnails
+    path = models.CharField(max_length=DEFAULT_MAX_LENGTH)
+    # of the entry’s files when this was made, to tell if it is out of date
+    source_mtimes = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entry", "size", "format"],
+                name="one_derivative_per_entry_size_and_format",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.entry_id} {self.size} {self.format}"
+
+
+class Job(models.Model):
+    """Slow per-entry work, like making video derivatives, queued for the
+    runworker command so that views don’t have to wait for it."""
+
+    class Kind(models.TextChoices):
+        REMUX = "remux"
+        HLS = "hls", "HLS"
+        TRANSCODE = "transcode"
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    ACTIVE_STATUSES = (Status.PENDING, Status.RUNNING)
+
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    entry = models.ForeignKey(Entry, on_delete=models.CASCADE)
+    # e.g. which GALLERY_TRANSCODE_LADDER rung to make
+    variant = models.CharField(max_length=32, blank=True, default="")
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            # so that parallel requests don’t start parallel ffmpegs
+            models.UniqueConstraint(
+                fields=["kind", "entry", "variant"],
+                condition=models.Q(status__in=["pending", "running"]),
+                name="one_active_job_per_entry_kind_and_variant",
+            )
+        ]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        kind = f"{self.kind} {self.variant}" if self.variant else self.kind
+        return f"{kind} {self.entry_id} {self.status}"
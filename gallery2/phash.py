@@ -0,0 +1,134 @@
+"""
+Perceptual hashing for finding near-duplicate entries.
+
+Entries get a 64-bit difference hash (dHash) of a tiny grayscale downscale.
+Near-identical images, e.g. the same photo re-exported or imported from two
+phones, end up within a few bits of each other. BKTree indexes the hashes by
+Hamming distance, so finding every near-duplicate in a gallery takes roughly
+O(n log n) comparisons instead of comparing every pair.
+"""
+
+from pathlib import Path
+
+from gallery2.files import IMAGE_EXTENSIONS
+
+HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 6
+
+
+def dhash(img, hash_size=HASH_SIZE):
+    """Difference hash of a PIL image, as an int of hash_size² bits."""
+    import numpy as np
+    from gallery2.images import Image
+
+    small = img.convert("L").resize(
+        (hash_size + 1, hash_size), Image.Resampling.BOX, reducing_gap=2.0
+    )
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def dhash_file(path, hash_size=HASH_SIZE):
+    from gallery2.images import Image
+
+    with Image.open(path) as img:
+        # Lets the JPEG decoder skip most of the work
+        img.draft("RGB", (hash_size * 8, hash_size * 8))
+        return dhash(img, hash_size)
+
+
+def format_hash(value):
+    return f"{value:016x}"
+
+
+def parse_hash(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def entry_image_path(entry):
+    """The file to hash for an entry, or None for video-only entries."""
+    for filename in entry.filenames:
+        if Path(filename).suffix.lower() in IMAGE_EXTENSIONS:
+            path = Path(entry.gallery.directory) / filename
+            if path.exists():
+                return path
+    return None
+
+
+def ensure_entry_phash(entry):
+    """Return the entry’s hash as an int, computing and saving it if missing."""
+    from gallery2.models import Entry
+
+    if entry.phash:
+        return parse_hash(entry.phash)
+
+    path = entry_image_path(entry)
+    if path is None:
+        return None
+
+    value = dhash_file(path)
+    entry.phash = format_hash(value)
+    # Not entry.save(), since a hash doesn’t change anything a page shows, so
+    # shouldn’t bump the entry’s version or its gallery’s revision
+    Entry.objects.filter(pk=entry.pk).update(phash=entry.phash)
+    return value
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance.
+
+    Each node keeps its children keyed by their distance from the node, so by
+    the triangle inequality a search within distance d only has to descend into
+    children whose key is within d of the query’s distance to the node.
+    """
+
+    def __init__(self, items=()):
+        self._root = None
+        self._size = 0
+        for hash_value, item in items:
+            self.add(hash_value, item)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, hash_value, item):
+        self._size += 1
+        if self._root is None:
+            self._root = (hash_value, [item], {})
+            return
+
+        node = self._root
+        while True:
+            node_hash, node_items, children = node
+            distance = hamming(hash_value, node_hash)
+            if distance == 0:
+                node_items.append(item)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (hash_value, [item], {})
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """Return [(distance, item), …] for all items within max_distance."""
+        if self._root is None:
+            return []
+
+        ret = []
+        stack = [self._root]
+        while stack:
+            node_hash, node_items, children = stack.pop()
+            distance = hamming(hash_value, node_hash)
+            if distance <= max_distance:
+                ret.extend((distance, item) for item in node_items)
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+        ret.sort(key=lambda x: x[0])
+        return ret
@@ -0,0 +1,113 @@
+"""
+Opt-in cProfile profiles of single requests and management commands.
+
+Staff users can profile a request by adding ?profile=1 or an X-Profile: 1
+header; importimages and buildgallery take --profile. The profile is
+written to MEDIA_ROOT/profiles/ in the pstats format, for `python -m pstats`
+or snakeviz, and the oldest profiles are deleted once there are more than
+GALLERY_PROFILES_MAX_BYTES of them or they are older than
+GALLERY_PROFILES_MAX_AGE seconds.
+"""
+
+import cProfile
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+
+def profiles_dir():
+    return Path(settings.MEDIA_ROOT) / "profiles"
+
+
+@contextmanager
+def profiled(label):
+    """Profile the enclosed block; yields a list that gets the path of the
+    profile appended once it is written."""
+    written = []
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield written
+    finally:
+        profiler.disable()
+        out_dir = profiles_dir()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        label = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")[:80]
+        path = out_dir / (
+            f"{datetime.now():%Y%m%dT%H%M%S}-{label}-{uuid.uuid4().hex[:8]}.prof"
+        )
+        profiler.dump_stats(path)
+        prune_profiles()
+        written.append(path)
+
+
+def prune_profiles():
+    """Delete profiles past GALLERY_PROFILES_MAX_AGE, then the oldest until
+    the rest fit in GALLERY_PROFILES_MAX_BYTES."""
+    profiles = []
+    for path in profiles_dir().glob("*.prof"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        profiles.append((stat.st_mtime, stat.st_size, path))
+    profiles.sort(reverse=True)
+
+    cutoff = time.time() - settings.GALLERY_PROFILES_MAX_AGE
+    total = 0
+    for mtime, size, path in profiles:
+        total += size
+        if mtime < cutoff or total > settings.GALLERY_PROFILES_MAX_BYTES:
+            path.unlink(missing_ok=True)
+
+
+def wants_profile(request):
+    # Only look at request.user once asked to, since that loads the session
+    # and adds Vary: Cookie
+    asked = request.GET.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+    return asked and request.user.is_staff
+
+
+class ProfilingMiddleware:
+    """Profile requests from staff users that ask for it; the response’s
+    X-Profile header names the file."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+
+        with profiled(f"{request.method} {request.path}") as written:
+            response = self.get_response(request)
+        response["X-Profile"] = os.path.relpath(written[0], settings.MEDIA_ROOT)
+        return response
+
+
+def add_profile_argument(parser):
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write a cProfile profile of this run to MEDIA_ROOT/profiles/",
+    )
+
+
+class ProfileCommandMixin:
+    """Profiles a management command when it is run with --profile; its
+    add_arguments() should call add_profile_argument()."""
+
+    def execute(self, *args, **options):
+        if not options.get("profile"):
+            return super().execute(*args, **options)
+
+        with profiled(self.__module__.rsplit(".", 1)[-1]) as written:
+            ret = super().execute(*args, **options)
+        self.stderr.write(f"Wrote profile to {written[0]}")
+        return ret
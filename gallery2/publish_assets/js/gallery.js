@@ -9,11 +9,31 @@ function start() {
     imagesWithVideo.forEach(img => {
         img.addEventListener('click', function () {
             const videoFilename = this.getAttribute('data-video-filename');
+            const hlsPlaylist = this.getAttribute('data-hls-playlist');
+            const sources = JSON.parse(this.getAttribute('data-video-sources') || '[]');
 
             const video = document.createElement('video');
             video.width = img.width;
             video.height = img.height;
-            video.src = videoFilename;
+            // With native HLS support, playback can start after the first
+            // segment, and seeking only fetches the segments it needs
+            if (hlsPlaylist && video.canPlayType('application/vnd.apple.mpegurl')) {
+                video.src = hlsPlaylist;
+            } else if (sources.length) {
+                // H.264 renditions; the browser plays the first whose media
+                // query matches
+                for (const { src, media } of sources) {
+                    const source = document.createElement('source');
+                    source.src = src;
+                    source.type = 'video/mp4';
+                    if (media) {
+                        source.media = media;
+                    }
+                    video.appendChild(source);
+                }
+            } else {
+                video.src = videoFilename;
+            }
             video.controls = !isIOS();
             video.autoplay = true;
             video.className = 'img-fluid';
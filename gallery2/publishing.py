@@ -0,0 +1,337 @@
+"""
+Writing the files of a published gallery, for buildgallery.
+
+A Publisher writes each output file through publish_file() or
+publish_bytes(), and records it in a manifest in the publish directory: the
+content hash, the source it came from, and the size and mtime it was left
+with. In incremental mode, the next build reuses that to skip outputs whose
+source hasn’t changed, and to leave files whose content is the same
+untouched, so that their mtimes stay put and rsync-style deploys only send
+what changed. Files that aren’t published again are deleted at the end.
+
+Media, scripts and stylesheets are published by publish_hashed(), under names
+made from their content, so that they never change once published and can be
+cached forever, and an entry that moves keeps its file names.
+
+Files are copied with the cheapest of COPY_METHODS that works: a
+copy-on-write clone or a hardlink, where the publish directory is on the same
+filesystem as the media, make publishing close to free.
+
+HTML, CSS and JavaScript files also get .gz and .br siblings, compressed as
+far as they go, for nginx’s gzip_static and brotli_static to serve.
+"""
+
+import errno
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import brotli
+
+from gallery2.files import write_atomically
+
+MANIFEST_NAME = ".build-manifest.json"
+
+# hex digits of the sha256 in published file names
+HASH_LENGTH = 16
+
+COMPRESS_SUFFIXES = {".html", ".css", ".js"}
+
+# Both release the GIL while they work
+COMPRESSORS = {
+    ".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+    ".br": lambda data: brotli.compress(data, mode=brotli.MODE_TEXT, quality=11),
+}
+
+
+def _reflink(src, dest):
+    """Clone src’s blocks, on filesystems like btrfs and XFS that can."""
+    if not hasattr(fcntl, "FICLONE"):
+        raise OSError(errno.ENOTSUP, "FICLONE is not available")
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        fcntl.ioctl(d.fileno(), fcntl.FICLONE, s.fileno())
+    shutil.copystat(src, dest)
+
+
+def _hardlink(src, dest):
+    # write_atomically has already made dest
+    dest.unlink()
+    os.link(src, dest)
+
+
+def _copy_file_range(src, dest):
+    """Copy in the kernel, without reading the data into this process."""
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        remaining = os.fstat(s.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+    shutil.copystat(src, dest)
+
+
+# Cheapest first. shutil.copy2 itself uses sendfile where it can.
+COPY_METHODS = {
+    "reflink": _reflink,
+    "hardlink": _hardlink,
+    "copy_file_range": _copy_file_range,
+    "copy": shutil.copy2,
+}
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_key(path):
+    stat = path.stat()
+    return f"{Path(path).absolute()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _dest_stat(path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Publisher:
+    def __init__(self, publish_path, report, incremental=False, copy_method="auto"):
+        self.publish_path = Path(publish_path)
+        self.report = report
+        self.incremental = incremental
+        self.copy_method = copy_method
+        self.written = 0
+        self.unchanged = 0
+        # copy method -> files copied with it
+        self.copied_by = Counter()
+        # (copy method, source st_dev) pairs that have failed
+        self._unsupported = set()
+        manifest_path = self.publish_path / MANIFEST_NAME
+        self.previous = {}
+        if incremental and manifest_path.exists():
+            self.previous = json.loads(manifest_path.read_text())["files"]
+        self.files = {}
+        # (rel, sha256) of files to make compressed variants of
+        self._compressible = []
+        # source fingerprint -> sha256, to name files without reading them
+        self._hashes = {
+            record["source"]: record["sha256"]
+            for record in self.previous.values()
+            if record["source"] is not None
+        }
+
+    def prepare(self):
+        """Wipe the publish directory, unless building incrementally."""
+        if not self.incremental and self.publish_path.exists():
+            with self.report.stage("clean"):
+                shutil.rmtree(self.publish_path)
+        self.publish_path.mkdir(parents=True, exist_ok=True)
+
+    def _current(self, rel, **expected):
+        """The previous manifest record for rel, if it matches expected and the
+        file is still as it was left."""
+        record = self.previous.get(rel)
+        if record is None or any(record.get(k) != v for k, v in expected.items()):
+            return None
+        try:
+            if _dest_stat(self.publish_path / rel) != record["stat"]:
+                return None
+        except FileNotFoundError:
+            return None
+        return record
+
+    def _keep(self, rel, record, **updates):
+        self.files[rel] = {**record, **updates}
+        self.unchanged += 1
+        self._note_compressible(rel)
+
+    def _record(self, rel, sha256, source=None):
+        self.files[rel] = {
+            "sha256": sha256,
+            "source": source,
+            "stat": _dest_stat(self.publish_path / rel),
+        }
+        self.written += 1
+        self._note_compressible(rel)
+
+    def _note_compressible(self, rel):
+        if Path(rel).suffix in COMPRESS_SUFFIXES:
+            self._compressible.append((rel, self.files[rel]["sha256"]))
+
+    def _write_atomically(self, dest, write):
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        return write_atomically(dest, write)
+
+    def _copy(self, src, dest):
+        """Copy src to dest with copy_method, or, for "auto", the first of
+        COPY_METHODS that works for files from where src is. Returns the
+        method used."""
+        if self.copy_method != "auto":
+            methods = [self.copy_method]
+        else:
+            device = src.stat().st_dev
+            methods = [m for m in COPY_METHODS if (m, device) not in self._unsupported]
+
+        for method in methods:
+            with self.report.stage(f"copy:{method}") as timing:
+                try:
+                    COPY_METHODS[method](src, dest)
+                except OSError:
+                    if method == methods[-1]:
+                        raise
+                    timing.count = 0
+                    self._unsupported.add((method, device))
+                    continue
+            self.copied_by[method] += 1
+            return method
+
+    def _sha256(self, src):
+        source = _source_key(src)
+        if source not in self._hashes:
+            with self.report.stage("hash", path=src) as timing:
+                self._hashes[source] = file_sha256(src)
+                timing.bytes_read = src.stat().st_size
+        return self._hashes[source]
+
+    def publish_hashed(self, src, directory, stem=""):
+        """Publish src in directory under a name made from its content hash,
+        and stem if given: e.g. css/gallery.css as css/gallery.<hash>.css.
+        Returns the path it was published as."""
+        src = Path(src)
+        digest = self._sha256(src)[:HASH_LENGTH]
+        name = f"{stem}.{digest}" if stem else digest
+        rel = f"{directory}/{name}{src.suffix.lower()}"
+        self.publish_file(src, rel)
+        return rel
+
+    def publish_hashed_dir(self, files, directory, suffix):
+        """Publish files, which refer to each other by name, like an HLS
+        playlist and its segments, into a subdirectory of directory named
+        from all their content hashes. Returns the subdirectory."""
+        h = hashlib.sha256()
+        for f in sorted(files):
+            h.update(f"{f.name} {self._sha256(f)}\n".encode())
+        subdirectory = f"{directory}/{h.hexdigest()[:HASH_LENGTH]}{suffix}"
+        for f in files:
+            self.publish_file(f, f"{subdirectory}/{f.name}")
+        return subdirectory
+
+    def publish_file(self, src, rel):
+        """Publish the file src as rel, a path relative to the publish
+        directory. Returns whether it had to be written."""
+        rel = str(rel)
+        src = Path(src)
+        source = _source_key(src)
+        if rel in self.files and self.files[rel]["sha256"] == self._sha256(src):
+            # the same content again, e.g. in two entries
+            return False
+
+        with self.report.stage("unchanged", path=src):
+            record = self._current(rel, source=source)
+            if record is not None:
+                self._keep(rel, record)
+                return False
+
+        sha256 = self._sha256(src)
+        record = self._current(rel, sha256=sha256)
+        if record is not None:
+            # e.g. a thumbnail made again from a touched original
+            self._keep(rel, record, source=source)
+            return False
+
+        dest = self.publish_path / rel
+        with self.report.stage("copy", path=src) as timing:
+            self._write_atomically(dest, lambda tmp: self._copy(src, tmp))
+            timing.bytes_read = timing.bytes_written = dest.stat().st_size
+        self._record(rel, sha256, source)
+        return True
+
+    def publish_bytes(self, data, rel):
+        """Publish data as the file rel. Returns whether it had to be
+        written."""
+        rel = str(rel)
+        sha256 = hashlib.sha256(data).hexdigest()
+        record = self._current(rel, sha256=sha256)
+        if record is not None:
+            self._keep(rel, record)
+            return False
+
+        dest = self.publish_path / rel
+        with self.report.stage("write") as timing:
+            self._write_atomically(dest, lambda tmp: tmp.write_bytes(data))
+            timing.bytes_written = len(data)
+        self._record(rel, sha256)
+        return True
+
+    def _compress_one(self, rel, variant, compress):
+        data = (self.publish_path / rel).read_bytes()
+        compressed = compress(data)
+        self._write_atomically(
+            self.publish_path / variant, lambda tmp: tmp.write_bytes(compressed)
+        )
+        return len(data), compressed
+
+    def _compress(self):
+        """Write the compressed variants of the files that changed since
+        theirs were made, in parallel."""
+        todo = []
+        for rel, sha256 in self._compressible:
+            for suffix, compress in COMPRESSORS.items():
+                variant = rel + suffix
+                # made from this content of rel
+                source = f"{suffix[1:]}:{sha256}"
+                record = self._current(variant, source=source)
+                if record is not None:
+                    self._keep(variant, record)
+                else:
+                    todo.append((variant, source, (rel, variant, compress)))
+        if not todo:
+            return
+
+        with self.report.stage("compress", count=len(todo)) as timing:
+            with ThreadPoolExecutor() as pool:
+                futures = [
+                    (variant, source, pool.submit(self._compress_one, *args))
+                    for variant, source, args in todo
+                ]
+                for variant, source, future in futures:
+                    size, compressed = future.result()
+                    timing.bytes_read += size
+                    timing.bytes_written += len(compressed)
+                    self._record(
+                        variant, hashlib.sha256(compressed).hexdigest(), source
+                    )
+
+    def finish(self):
+        """Write the compressed variants, delete files that weren’t published
+        this time, and save the manifest."""
+        self._compress()
+        with self.report.stage("prune") as timing:
+            timing.count = 0
+            for path in sorted(self.publish_path.rglob("*"), reverse=True):
+                rel = str(path.relative_to(self.publish_path))
+                if path.is_dir():
+                    if not any(path.iterdir()):
+                        path.rmdir()
+                elif rel not in self.files and rel != MANIFEST_NAME:
+                    path.unlink()
+                    timing.count += 1
+
+        manifest = {"files": dict(sorted(self.files.items()))}
+        self._write_atomically(
+            self.publish_path / MANIFEST_NAME,
+            lambda tmp: tmp.write_text(json.dumps(manifest, indent=1) + "\n"),
+        )
+        return timing.count
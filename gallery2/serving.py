@@ -0,0 +1,234 @@
+"""
+Serving media files from disk with HTTP validators and caching headers.
+
+Every file-serving view goes through serve_file(), so that repeat visits can
+be answered with a 304 Not Modified instead of re-sending the bytes, and so
+that with GALLERY_FILE_OFFLOAD set, the bytes are sent by the web server
+instead of by a Python worker. Range requests are answered with only the
+requested bytes, which video seeking and Safari’s <video> depend on.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import secrets
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+
+# More ranges than this in one request are served as the whole file
+MAX_RANGES = 64
+
+_BYTE_RANGE_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def file_etag(stat):
+    """Strong ETag for a file on disk.
+
+    Rewriting a file, or replacing it with a new one, changes its size or
+    nanosecond mtime or inode, which is what this is derived from.
+    """
+    fingerprint = f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+    return '"' + hashlib.sha256(fingerprint.encode()).hexdigest()[:32] + '"'
+
+
+def serve_file(request, path):
+    """FileResponse for path with ETag and Last-Modified, or a 304 or 206.
+
+    Clients must revalidate on every use, since the URLs aren’t versioned and
+    the file may change, e.g. when an entry is hidden or its original edited.
+    """
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = offload_response(path)
+    if response is None and _if_range_matches(request, etag, last_modified):
+        response = range_response(request, path, stat.st_size)
+    if response is None:
+        response = FileResponse(open(path, "rb"))
+
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def offload_response(path):
+    """An empty response telling the web server to send path, if configured.
+
+    Returns None if offloading is off, or if nginx has no internal location
+    covering path, in which case the caller streams the file itself.
+    """
+    mode = settings.GALLERY_FILE_OFFLOAD
+    if mode is None:
+        return None
+
+    path = Path(path).resolve()
+    if mode == "x-accel-redirect":
+        uri = _internal_uri(path)
+        if uri is None:
+            return None
+        header = "X-Accel-Redirect"
+        value = uri
+    elif mode == "x-sendfile":
+        header = "X-Sendfile"
+        value = os.fspath(path)
+    else:
+        raise ImproperlyConfigured(f"Unknown GALLERY_FILE_OFFLOAD {mode!r}")
+
+    content_type, _ = mimetypes.guess_type(path)
+    response = HttpResponse(content_type=content_type or "application/octet-stream")
+    response.headers[header] = value
+    return response
+
+
+def _internal_uri(path):
+    for root, location in settings.GALLERY_OFFLOAD_LOCATIONS.items():
+        root = Path(root).resolve()
+        if path.is_relative_to(root):
+            relative = path.relative_to(root).as_posix()
+            return location.rstrip("/") + "/" + quote(relative)
+    return None
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Whether a Range header may be honoured, given any If-Range header.
+
+    If-Range only matches a strong ETag, or the exact Last-Modified date.
+    """
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def parse_range_header(header, size):
+    """Parse a Range header into merged, sorted [(start, end), …] byte
+    offsets, end inclusive.
+
+    Returns None if the header should be ignored, and [] if no range in it
+    overlaps the file.
+    """
+    unit, sep, specs = header.partition("=")
+    if not sep or unit.strip().lower() != "bytes":
+        return None
+
+    specs = specs.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        m = _BYTE_RANGE_RE.match(spec)
+        if not m or m.groups() == ("", ""):
+            return None
+        first, last = m.groups()
+        if first == "":
+            # suffix range: the last n bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = size - 1 if last == "" else min(int(last), size - 1)
+            if last != "" and int(last) < start:
+                return None
+        if start < size:
+            ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def range_response(request, path, size):
+    """A 206 or 416 response for a GET with a Range header, else None."""
+    header = request.headers.get("Range")
+    if request.method != "GET" or header is None:
+        return None
+
+    ranges = parse_range_header(header, size)
+    if ranges is None:
+        return None
+    if not ranges:
+        response = HttpResponse(status=416)
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or "application/octet-stream"
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            _read_ranges(path, [(b"", start, end, b"")]),
+            status=206,
+            content_type=content_type,
+        )
+        response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response.headers["Content-Length"] = str(end - start + 1)
+        return response
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    for start, end in ranges:
+        head = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n"
+            "\r\n"
+        ).encode("ascii")
+        parts.append((head, start, end, b"\r\n"))
+    # the closing delimiter goes after the last part
+    head, start, end, tail = parts[-1]
+    parts[-1] = (head, start, end, tail + f"--{boundary}--\r\n".encode("ascii"))
+
+    response = StreamingHttpResponse(
+        _read_ranges(path, parts),
+        status=206,
+        content_type=f"multipart/byteranges; boundary={boundary}",
+    )
+    response.headers["Content-Length"] = str(
+        sum(len(head) + end - start + 1 + len(tail) for head, start, end, tail in parts)
+    )
+    return response
+
+
+def _read_ranges(path, parts):
+    """Yield each part’s head, bytes start…end of path, and tail, a chunk at
+    a time, so that big files never end up in memory."""
+    with open(path, "rb") as f:
+        for head, start, end, tail in parts:
+            if head:
+                yield head
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            if tail:
+                yield tail
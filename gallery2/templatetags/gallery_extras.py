@@ -1,8 +1,13 @@
+import json
+
 from django import template
+from django.conf import settings
+from django.urls import reverse
 from django.utils.safestring import mark_safe
-import markdown
 from pathlib import Path
 
+from gallery2.captions import render_caption
+
 register = template.Library()
 
 
@@ -11,10 +16,9 @@ def markdown_to_html(text):
     """
     Convert markdown text to HTML.
     Usage: {{ caption|markdown_to_html }}
+    Entry captions are stored already rendered; use entry.rendered_caption.
     """
-    if text:
-        return mark_safe(markdown.markdown(text))
-    return ""
+    return mark_safe(render_caption(text))
 
 
 @register.simple_tag
@@ -82,3 +86,28 @@ def get_video_filename(filenames):
             return filename
 
     return None
+
+
+@register.filter
+def video_sources(entry):
+    """
+    JSON list of {"src": …, "media": …} for the player’s <source> elements:
+    the transcode ladder renditions, then the remux to fall back on.
+    Usage: data-video-sources="{{ entry|video_sources }}"
+    Renditions bigger than the video 404, and the player leaves those out.
+    """
+    sources = [
+        {
+            "src": reverse(
+                "gallery2:entry_video_variant", args=[entry.id, rung["name"]]
+            ),
+            "media": rung.get("media"),
+        }
+        for rung in sorted(
+            settings.GALLERY_TRANSCODE_LADDER, key=lambda r: r["height"], reverse=True
+        )
+    ]
+    sources.append(
+        {"src": reverse("gallery2:entry_video", args=[entry.id]), "media": None}
+    )
+    return json.dumps(sources)
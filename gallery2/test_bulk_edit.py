@@ -0,0 +1,128 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from reversion.models import Revision, Version
+
+from gallery2.models import Gallery, Entry
+
+
+@pytest.fixture
+def gallery(db):
+    gallery = Gallery.objects.create(name="bulk")
+    for i in range(3):
+        Entry.objects.create(
+            gallery=gallery, basename=f"e{i}", filenames=[f"e{i}.jpg"], order=i
+        )
+    return gallery
+
+
+def post_changes(client, gallery, changes):
+    return client.post(
+        reverse("gallery2:bulk_edit_entries", args=[gallery.id]),
+        json.dumps({"changes": changes}),
+        content_type="application/json",
+    )
+
+
+def test_bulk_edit(client, gallery):
+    e0, e1, e2 = Entry.objects.order_by("order")
+    revision = gallery.revision
+
+    with CaptureQueriesContext(connection) as queries:
+        response = post_changes(
+            client,
+            gallery,
+            [
+                {"id": e0.id, "caption": "*zero*", "order": 1},
+                {"id": e1.id, "hidden": True, "order": 0},
+                {"id": e2.id, "caption": "two"},
+            ],
+        )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["ok"] for r in results] == [True, True, True]
+    assert results[0]["caption_html"] == "<p><em>zero</em></p>"
+
+    # swapped places despite the unique constraint
+    assert list(Entry.objects.order_by("order").values_list("basename", flat=True)) == [
+        "e1",
+        "e0",
+        "e2",
+    ]
+    e0.refresh_from_db()
+    assert e0.caption_html == "<p><em>zero</em></p>"
+    assert e0.version == 2
+    assert Entry.objects.get(pk=e1.id).hidden
+
+    # one transaction, one revision covering every entry
+    savepoints = [
+        q for q in queries.captured_queries if q["sql"].startswith("SAVEPOINT")
+    ]
+    assert len(savepoints) == 1
+    assert Revision.objects.count() == 1
+    assert Version.objects.filter(revision=Revision.objects.get()).count() == 3
+
+    gallery.refresh_from_db()
+    assert gallery.revision > revision
+
+
+def test_bulk_edit_reports_errors_per_item(client, gallery):
+    e0, e1, e2 = Entry.objects.order_by("order")
+    other = Entry.objects.create(
+        gallery=Gallery.objects.create(name="other"),
+        basename="x",
+        filenames=[],
+        order=0,
+    )
+
+    response = post_changes(
+        client,
+        gallery,
+        [
+            {"id": e0.id, "caption": "ok"},
+            {"id": other.id, "caption": "not in this gallery"},
+            {"id": e1.id, "order": 2},
+            {"id": e2.id, "bogus": 1},
+            {"id": e2.id, "hidden": "yes"},
+            {"caption": "no id"},
+        ],
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["ok"] for r in results] == [True, False, False, False, False, False]
+    assert results[2]["error"] == "Another entry already has that order"
+    assert results[5]["id"] is None
+
+    assert Entry.objects.get(pk=e0.id).caption == "ok"
+    assert Entry.objects.get(pk=e1.id).order == 1
+    assert Entry.objects.get(pk=other.id).caption == ""
+
+
+def test_bulk_edit_rejects_duplicate_orders_in_batch(client, gallery):
+    e0, e1, _ = Entry.objects.order_by("order")
+    results = post_changes(
+        client, gallery, [{"id": e0.id, "order": 5}, {"id": e1.id, "order": 5}]
+    ).json()["results"]
+    assert [r["ok"] for r in results] == [True, False]
+    assert Entry.objects.get(pk=e0.id).order == 5
+
+
+def test_bulk_edit_rejects_orders_too_big_for_a_float(client, gallery):
+    e0, e1, _ = Entry.objects.order_by("order")
+    response = post_changes(
+        client, gallery, [{"id": e0.id, "order": 10**400}, {"id": e1.id, "order": 7}]
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["ok"] for r in results] == [False, True]
+    assert results[0]["error"] == "Invalid order"
+    assert Entry.objects.get(pk=e0.id).order == 0
+
+
+def test_bulk_edit_requires_changes_list(client, gallery):
+    url = reverse("gallery2:bulk_edit_entries", args=[gallery.id])
+    assert client.post(url, "{}", content_type="application/json").status_code == 400
+    assert client.get(url).status_code == 405
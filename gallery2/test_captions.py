@@ -0,0 +1,79 @@
+import json
+
+import markdown
+from django.core.management import call_command
+from django.urls import reverse
+
+from gallery2.captions import renderer_version
+from gallery2.models import Gallery, Entry
+
+
+def make_entry(caption):
+    gallery = Gallery.objects.create(name="captions")
+    return Entry.objects.create(
+        gallery=gallery, basename="e1", filenames=[], order=1.0, caption=caption
+    )
+
+
+def test_caption_html_is_stored(db):
+    entry = make_entry("some *text*")
+    entry.refresh_from_db()
+    assert entry.caption_html == "<p>some <em>text</em></p>"
+    assert entry.caption_html_version == renderer_version()
+
+    entry.caption = "**new**"
+    entry.save()
+    assert Entry.objects.get().caption_html == "<p><strong>new</strong></p>"
+
+
+def test_unchanged_caption_is_not_rerendered(db, monkeypatch):
+    entry = make_entry("some *text*")
+    entry = Entry.objects.get(pk=entry.pk)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("markdown was rendered")
+
+    monkeypatch.setattr(markdown, "markdown", fail)
+    entry.hidden = True
+    entry.save()
+    entry.phash = "0" * 16
+    entry.save(update_fields=["phash"])
+
+
+def test_page_render_does_no_markdown(db, client, monkeypatch):
+    entry = make_entry("some *text*")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("markdown was rendered")
+
+    monkeypatch.setattr(markdown, "markdown", fail)
+    response = client.get(reverse("gallery2:gallery_detail", args=[entry.gallery.id]))
+    assert "<p>some <em>text</em></p>" in response.text
+
+
+def test_edit_caption_returns_stored_html(db, client):
+    entry = make_entry("")
+    response = client.post(
+        reverse("gallery2:entry_edit_caption", args=[entry.id]),
+        json.dumps({"caption": "*hi*"}),
+        content_type="application/json",
+    )
+    assert response.json()["html_caption"] == "<p><em>hi</em></p>"
+    assert Entry.objects.get().caption_html == "<p><em>hi</em></p>"
+
+
+def test_render_captions_after_config_change(db, settings):
+    make_entry("a\nb")
+    old_version = renderer_version()
+
+    settings.GALLERY_MARKDOWN_EXTENSIONS = ["nl2br"]
+    assert renderer_version() != old_version
+    # stale until backfilled, but rendered with the new config meanwhile
+    entry = Entry.objects.get()
+    assert entry.caption_html == "<p>a\nb</p>"
+    assert entry.rendered_caption == "<p>a<br />\nb</p>"
+
+    call_command("render_captions")
+    entry = Entry.objects.get()
+    assert entry.caption_html == "<p>a<br />\nb</p>"
+    assert entry.caption_html_version == renderer_version()
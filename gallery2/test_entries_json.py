@@ -0,0 +1,75 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gallery2.models import Gallery, Entry
+
+
+@pytest.fixture
+def gallery(db):
+    gallery = Gallery.objects.create(name="json")
+    Entry.objects.create(
+        gallery=gallery,
+        basename="e0",
+        filenames=["e0.jpg"],
+        order=0.5,
+        caption="*a*",
+        width=1600,
+        height=1200,
+    )
+    Entry.objects.create(
+        gallery=gallery,
+        basename="e1",
+        filenames=["e1.heic", "e1.mov"],
+        order=1.5,
+        hidden=True,
+    )
+    Entry.objects.create(gallery=gallery, basename="e2", filenames=[], order=2.5)
+    return gallery
+
+
+def test_entries_json(client, gallery):
+    response = client.get(reverse("gallery2:gallery_entries_json", args=[gallery.id]))
+    assert response.status_code == 200
+    data = response.json()
+    assert data["next"] is None
+    assert [e["basename"] for e in data["entries"]] == ["e0", "e1", "e2"]
+
+    e0, e1, _ = data["entries"]
+    assert e0["caption_html"] == "<p><em>a</em></p>"
+    assert e0["thumbnail"] == {
+        "url": f"/gallery/entry/{e0['id']}/thumbnail/",
+        "width": 800,
+        "height": 600,
+    }
+    assert e0["has_video"] is False
+    assert e0["video_url"] is None
+    assert e1["hidden"] is True
+    assert e1["thumbnail"]["width"] is None
+    assert e1["video_url"] == f"/gallery/entry/{e1['id']}/video/"
+
+
+def test_entries_json_sparse_fields_and_cursor(client, gallery):
+    url = reverse("gallery2:gallery_entries_json", args=[gallery.id])
+
+    with CaptureQueriesContext(connection) as queries:
+        data = client.get(url + "?fields=id,basename&limit=2").json()
+    assert [set(e) for e in data["entries"]] == [{"id", "basename"}] * 2
+    entry_queries = [q["sql"] for q in queries if '"gallery2_entry"' in q["sql"]]
+    assert len(entry_queries) == 1
+    assert "caption" not in entry_queries[0]
+
+    assert data["next"].endswith("?fields=id,basename&limit=2&after=1.5")
+    data = client.get(data["next"]).json()
+    assert [e["basename"] for e in data["entries"]] == ["e2"]
+    assert data["next"] is None
+
+
+def test_entries_json_errors(client, gallery):
+    url = reverse("gallery2:gallery_entries_json", args=[gallery.id])
+    assert client.get(url + "?fields=nope").status_code == 400
+    assert client.get(url + "?limit=0").status_code == 400
+    assert client.get(url + "?after=x").status_code == 400
+    missing = reverse("gallery2:gallery_entries_json", args=[gallery.id + 1])
+    assert client.get(missing).status_code == 404
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gallery2.models import Gallery, Entry
+
+
+@pytest.fixture
+def gallery(db):
+    gallery = Gallery.objects.create(name="etags")
+    Entry.objects.create(gallery=gallery, basename="e1", filenames=[], order=1.0)
+    return gallery
+
+
+def test_unchanged_detail_page_is_304(client, gallery):
+    url = reverse("gallery2:gallery_detail", args=[gallery.id])
+    # sets the CSRF cookie, which is part of the ETag
+    client.get(url)
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert "no-cache" in response["Cache-Control"]
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+
+def test_entry_changes_change_etag(client, gallery):
+    url = reverse("gallery2:gallery_detail", args=[gallery.id])
+    entry = gallery.entry_set.get()
+    etags = {client.get(url)["ETag"]}
+
+    client.post(
+        reverse("gallery2:entry_edit_caption", args=[entry.id]),
+        json.dumps({"caption": "new"}),
+        content_type="application/json",
+    )
+    etags.add(client.get(url)["ETag"])
+
+    client.post(
+        reverse("gallery2:set_entry_hidden", args=[entry.id]),
+        json.dumps({"hidden": True}),
+        content_type="application/json",
+    )
+    etags.add(client.get(url)["ETag"])
+
+    Entry.objects.create(gallery=gallery, basename="e2", filenames=[], order=2.0)
+    etags.add(client.get(url)["ETag"])
+
+    entry.delete()
+    etags.add(client.get(url)["ETag"])
+    assert len(etags) == 5
+
+
+def test_revision_only_increases(gallery):
+    stale = Gallery.objects.get(pk=gallery.pk)
+    Entry.objects.create(gallery=gallery, basename="e2", filenames=[], order=2.0)
+    Entry.objects.create(gallery=gallery, basename="e3", filenames=[], order=3.0)
+    current = Gallery.objects.get(pk=gallery.pk).revision
+
+    stale.name = "renamed"
+    stale.save()
+    assert stale.revision == current + 1
+
+
+def test_gallery_list_etag(client, gallery):
+    url = reverse("gallery2:gallery_list")
+    etag = client.get(url)["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    gallery.name = "renamed"
+    gallery.save()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "renamed" in response.text
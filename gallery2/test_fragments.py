@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from django.template.loader import get_template
+from django.urls import reverse
+
+from gallery2 import fragments
+from gallery2.models import Gallery, Entry
+
+
+class CountingTemplate:
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+        self.rendered = []
+
+    def render(self, context):
+        self.rendered.append(context["entry"].basename)
+        return self.template.render(context)
+
+
+@pytest.fixture
+def counting_template(monkeypatch):
+    template = CountingTemplate(get_template(fragments.ENTRY_TEMPLATE))
+    monkeypatch.setattr(fragments, "get_template", lambda name: template)
+    return template
+
+
+@pytest.fixture
+def gallery(db):
+    gallery = Gallery.objects.create(name="fragments")
+    for i in range(3):
+        Entry.objects.create(
+            gallery=gallery, basename=f"e{i}", filenames=[], order=i, caption=f"c{i}"
+        )
+    return gallery
+
+
+def test_fragments_are_cached(client, gallery, counting_template):
+    url = reverse("gallery2:gallery_detail", args=[gallery.id])
+    client.get(url)
+    assert counting_template.rendered == ["e0", "e1", "e2"]
+
+    response = client.get(url)
+    assert counting_template.rendered == ["e0", "e1", "e2"]
+    for i in range(3):
+        assert f"<p>c{i}</p>" in response.text
+
+
+def test_edits_invalidate_one_fragment(client, gallery, counting_template):
+    url = reverse("gallery2:gallery_detail", args=[gallery.id])
+    client.get(url)
+    counting_template.rendered.clear()
+
+    entry = Entry.objects.get(basename="e1")
+    client.post(
+        reverse("gallery2:entry_edit_caption", args=[entry.id]),
+        json.dumps({"caption": "*new*"}),
+        content_type="application/json",
+    )
+    response = client.get(url)
+    assert counting_template.rendered == ["e1"]
+    assert "<em>new</em>" in response.text
+
+    entry = Entry.objects.get(basename="e2")
+    client.post(
+        reverse("gallery2:set_entry_hidden", args=[entry.id]),
+        json.dumps({"hidden": True}),
+        content_type="application/json",
+    )
+    client.get(url)
+    assert counting_template.rendered == ["e1", "e2"]
+
+
+def test_version_is_bumped_on_every_save(gallery):
+    entry = Entry.objects.get(basename="e0")
+    version = entry.version
+    entry.phash = "0" * 16
+    entry.save(update_fields=["phash"])
+    assert Entry.objects.get(pk=entry.pk).version == version + 1
@@ -0,0 +1,55 @@
+import json
+import shutil
+
+from django.urls import reverse
+
+from gallery2.instrumentation import RequestTiming, span
+from gallery2.models import Gallery, Entry
+
+from .tests import blue_png_file
+
+
+def test_span_does_nothing_outside_requests():
+    with span("thumbnail"):
+        pass
+
+
+def test_server_timing(db, client, settings, tmp_path, blue_png_file, caplog):
+    settings.GALLERY_SERVER_TIMING = True
+    gallery = Gallery.objects.create(name="timing", directory=tmp_path)
+    shutil.copy(blue_png_file, tmp_path / "e1.png")
+    entry = Entry.objects.create(
+        gallery=gallery, basename="e1", filenames=["e1.png"], order=1.0
+    )
+    url = reverse("gallery2:entry_thumbnail", args=[entry.id])
+
+    with caplog.at_level("INFO", logger="gallery2.instrumentation"):
+        response = client.get(url)
+    metrics = [m.split(";")[0] for m in response["Server-Timing"].split(", ")]
+    assert metrics[:2] == ["total", "db"]
+    assert "thumbnail" in metrics
+
+    logged = json.loads(caplog.records[-1].getMessage())
+    assert logged["path"] == url
+    assert logged["status"] == 200
+    assert logged["db_queries"] > 0
+    assert logged["spans"]["thumbnail"]["count"] == 1
+
+    # a cache hit doesn’t make a thumbnail
+    assert "thumbnail;" not in client.get(url)["Server-Timing"]
+
+
+def test_server_timing_off(db, client, settings):
+    settings.GALLERY_SERVER_TIMING = False
+    response = client.get(reverse("gallery2:gallery_list"))
+    assert response.status_code == 200
+    assert "Server-Timing" not in response
+
+
+def test_request_timing_header():
+    timing = RequestTiming()
+    timing.add("render", 0.002)
+    timing.add("render", 0.001)
+    assert timing.header(0.01) == (
+        'total;dur=10.0, db;dur=0.0;desc="0 queries", render;dur=3.0;desc="2×"'
+    )
@@ -0,0 +1,194 @@
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+import av
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from gallery2 import jobs
+from gallery2.models import Gallery, Entry, Job
+
+from .tests import one_frame_mov_file
+
+
+@pytest.fixture
+def video_entry(db, tmp_path, one_frame_mov_file):
+    gallery = Gallery.objects.create(name="video", directory=tmp_path)
+    shutil.copy(one_frame_mov_file, tmp_path / "v.mov")
+    return Entry.objects.create(
+        gallery=gallery, basename="v", filenames=["v.mov"], order=1.0
+    )
+
+
+def test_enqueue_deduplicates(video_entry):
+    job = jobs.enqueue(video_entry, Job.Kind.REMUX)
+    assert jobs.enqueue(video_entry, Job.Kind.REMUX) == job
+    assert Job.objects.count() == 1
+
+    claimed = jobs.claim_next()
+    assert claimed == job
+    assert claimed.status == Job.Status.RUNNING
+    assert claimed.attempts == 1
+    assert jobs.claim_next() is None
+    # still running, so still not queued again
+    assert jobs.enqueue(video_entry, Job.Kind.REMUX) == job
+
+
+def test_claim_next_reclaims_stale_jobs(video_entry, settings):
+    settings.GALLERY_JOB_TIMEOUT = 60
+    job = jobs.enqueue(video_entry, Job.Kind.REMUX)
+    jobs.claim_next()
+    Job.objects.filter(pk=job.pk).update(
+        started_at=timezone.now() - timedelta(seconds=120)
+    )
+
+    reclaimed = jobs.claim_next()
+    assert reclaimed == job
+    assert reclaimed.attempts == 2
+
+
+def test_video_is_remuxed_by_worker(client, video_entry):
+    url = reverse("gallery2:entry_video", args=[video_entry.id])
+    status_url = reverse("gallery2:entry_video_status", args=[video_entry.id])
+
+    response = client.get(url)
+    assert response.status_code == 202
+    assert response.json() == {"status": "pending", "status_url": status_url}
+    assert client.get(url).status_code == 202
+    assert Job.objects.count() == 1
+
+    # the original is served as-is in the meantime
+    response = client.get(reverse("gallery2:entry_original", args=[video_entry.id]))
+    assert response.status_code == 200
+    assert response["Content-Type"] == "video/quicktime"
+
+    call_command("runworker", "--once")
+    assert Job.objects.get().status == Job.Status.DONE
+    assert client.get(status_url).json() == {"status": "done", "url": url}
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response["Content-Type"] == "video/mp4"
+    response = client.get(reverse("gallery2:entry_original", args=[video_entry.id]))
+    assert response["Content-Type"] == "video/mp4"
+
+
+def test_failed_job_is_not_retried_until_source_changes(client, video_entry):
+    (Path(video_entry.gallery.directory) / "v.mov").write_bytes(b"not a video")
+    url = reverse("gallery2:entry_video", args=[video_entry.id])
+
+    assert client.get(url).status_code == 202
+    call_command("runworker", "--once")
+    assert Job.objects.get().status == Job.Status.FAILED
+
+    response = client.get(url)
+    assert response.status_code == 500
+    assert response.json()["status"] == "failed"
+    assert Job.objects.count() == 1
+
+
+def test_hls_is_segmented_by_worker(client, video_entry):
+    playlist_url = reverse("gallery2:entry_hls", args=[video_entry.id, "index.m3u8"])
+
+    response = client.get(playlist_url)
+    assert response.status_code == 202
+    assert response.json()["status_url"] == reverse(
+        "gallery2:entry_hls_status", args=[video_entry.id]
+    )
+    # segments don’t queue anything
+    assert (
+        client.get(
+            reverse("gallery2:entry_hls", args=[video_entry.id, "seg000.m4s"])
+        ).status_code
+        == 404
+    )
+
+    call_command("runworker", "--once")
+    assert Job.objects.get().kind == Job.Kind.HLS
+
+    response = client.get(playlist_url)
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/vnd.apple.mpegurl"
+    playlist = b"".join(response.streaming_content).decode()
+    assert '#EXT-X-MAP:URI="init.mp4"' in playlist
+
+    segments = [line for line in playlist.splitlines() if line.endswith(".m4s")]
+    assert segments
+    for name in ["init.mp4"] + segments:
+        response = client.get(
+            reverse("gallery2:entry_hls", args=[video_entry.id, name])
+        )
+        assert response.status_code == 200
+
+    assert (
+        client.get(
+            reverse("gallery2:entry_hls", args=[video_entry.id, "source"])
+        ).status_code
+        == 404
+    )
+
+
+def test_transcodes_are_limited(video_entry, settings):
+    settings.GALLERY_MAX_CONCURRENT_TRANSCODES = 1
+    first = jobs.enqueue(video_entry, Job.Kind.TRANSCODE, variant="1080p")
+    second = jobs.enqueue(video_entry, Job.Kind.TRANSCODE, variant="720p")
+    remux = jobs.enqueue(video_entry, Job.Kind.REMUX)
+    assert first != second
+
+    assert jobs.claim_next() == first
+    # the second transcode has to wait, but other kinds don’t
+    assert jobs.claim_next() == remux
+    assert jobs.claim_next() is None
+
+    Job.objects.filter(pk=first.pk).update(status=Job.Status.DONE)
+    assert jobs.claim_next() == second
+
+
+def test_video_is_transcoded_by_worker(client, video_entry):
+    # the test video is 1200×800, too small for 1080p
+    assert (
+        client.get(
+            reverse("gallery2:entry_video_variant", args=[video_entry.id, "1080p"])
+        ).status_code
+        == 404
+    )
+
+    url = reverse("gallery2:entry_video_variant", args=[video_entry.id, "720p"])
+    response = client.get(url)
+    assert response.status_code == 202
+    assert response.json()["status_url"] == url + "status"
+
+    call_command("runworker", "--once")
+    job = Job.objects.get()
+    assert (job.kind, job.variant, job.status) == ("transcode", "720p", "done")
+    assert client.get(url + "status").json() == {"status": "done", "url": url}
+
+    response = client.get(url)
+    assert response.status_code == 200
+    out = Path(video_entry.gallery.directory) / "720p.mp4"
+    out.write_bytes(b"".join(response.streaming_content))
+    with av.open(str(out)) as container:
+        stream = container.streams.video[0]
+        assert stream.codec_context.name == "h264"
+        assert (stream.width, stream.height) == (1080, 720)
+
+
+def test_current_transcode_is_served_without_probing(client, video_entry, monkeypatch):
+    url = reverse("gallery2:entry_video_variant", args=[video_entry.id, "720p"])
+    client.get(url)
+    call_command("runworker", "--once")
+
+    def no_probe(path):
+        raise AssertionError(f"probed {path}")
+
+    monkeypatch.setattr("gallery2.views.transcode_rungs", no_probe)
+    assert client.get(url, HTTP_RANGE="bytes=0-99").status_code == 206
+    assert (
+        client.get(
+            reverse("gallery2:entry_video_variant", args=[video_entry.id, "4k"])
+        ).status_code
+        == 404
+    )
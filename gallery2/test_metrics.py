@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from django.urls import reverse
+
+from gallery2 import jobs, metrics
+from gallery2.models import Gallery, Entry, Job
+
+from .tests import blue_png_file
+
+
+def samples(text):
+    return dict(
+        line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#")
+    )
+
+
+def test_export_histogram():
+    metrics.observe("gallery2_job_seconds", 0.5, kind="remux", status="done")
+    metrics.observe("gallery2_job_seconds", 7, kind="remux", status="done")
+
+    exported = samples(metrics.export())
+    labels = 'kind="remux",status="done"'
+    assert exported[f'gallery2_job_seconds_bucket{{{labels},le="0.25"}}'] == "0"
+    assert exported[f'gallery2_job_seconds_bucket{{{labels},le="0.5"}}'] == "1"
+    assert exported[f'gallery2_job_seconds_bucket{{{labels},le="10.0"}}'] == "2"
+    assert exported[f'gallery2_job_seconds_bucket{{{labels},le="+Inf"}}'] == "2"
+    assert exported[f"gallery2_job_seconds_count{{{labels}}}"] == "2"
+    assert exported[f"gallery2_job_seconds_sum{{{labels}}}"] == "7.5"
+
+
+def run_in_worker(settings, code, **kwargs):
+    """Start a separate Python process, as a separate uwsgi worker would be,
+    running code with metrics recorded in the same database."""
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys, django; django.setup();"
+            "from django.conf import settings;"
+            "settings.GALLERY_METRICS_DB = sys.argv[1];"
+            "from gallery2 import metrics;" + code,
+            str(settings.GALLERY_METRICS_DB),
+        ],
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "website.dev_settings"},
+        **kwargs,
+    )
+
+
+def test_metrics_are_shared_between_processes(settings):
+    name = "gallery2_thumbnail_requests_total"
+    metrics.inc(name, 2)
+    assert run_in_worker(settings, f"metrics.inc({name!r})").wait() == 0
+    assert samples(metrics.export())[name] == "3"
+
+
+def test_gauges_drop_processes_that_are_gone(settings):
+    name = "gallery2_exiftool_queue"
+    metrics.set_gauge(name, 2)
+    metrics.set_gauge(name, 1)
+
+    # a process that dies without cleaning up, while still busy
+    worker = run_in_worker(
+        settings,
+        f"metrics.set_gauge({name!r}, 5); metrics.flush();"
+        "print(flush=True); sys.stdin.read(); import os; os._exit(0)",
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    worker.stdout.readline()
+    assert samples(metrics.export())[name] == "6"
+    worker.stdin.close()
+    assert worker.wait() == 0
+    assert samples(metrics.export())[name] == "1"
+
+    # one that exits normally
+    assert run_in_worker(settings, f"metrics.set_gauge({name!r}, 5)").wait() == 0
+    assert samples(metrics.export())[name] == "1"
+
+
+def test_metrics_view(db, client, admin_client, tmp_path, blue_png_file):
+    url = reverse("gallery2:metrics")
+    assert client.get(url).status_code == 302
+
+    gallery = Gallery.objects.create(name="metrics", directory=tmp_path)
+    shutil.copy(blue_png_file, tmp_path / "e1.png")
+    entry = Entry.objects.create(
+        gallery=gallery, basename="e1", filenames=["e1.png"], order=1.0
+    )
+    for _ in range(3):
+        client.get(reverse("gallery2:entry_thumbnail", args=[entry.id]))
+    jobs.enqueue(entry, Job.Kind.REMUX)
+
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    exported = samples(response.content.decode())
+    labels = 'extractor="image",result="hit",size="1600"'
+    miss_labels = 'extractor="image",result="miss",size="1600"'
+    assert exported[f"gallery2_thumbnail_requests_total{{{labels}}}"] == "2"
+    assert exported[f"gallery2_thumbnail_requests_total{{{miss_labels}}}"] == "1"
+    assert (
+        exported['gallery2_thumbnail_seconds_count{extractor="image",size="1600"}']
+        == "1"
+    )
+    assert exported['gallery2_jobs{kind="remux",status="pending"}'] == "1"
+    assert exported['gallery2_jobs{kind="remux",status="running"}'] == "0"
@@ -0,0 +1,56 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gallery2.models import Gallery, Entry
+
+
+@pytest.fixture
+def gallery(db, settings):
+    settings.GALLERY_PAGE_SIZE = 3
+    gallery = Gallery.objects.create(name="paged")
+    for i in range(7):
+        Entry.objects.create(
+            gallery=gallery, basename=f"e{i}", filenames=[], order=i + 0.1
+        )
+    return gallery
+
+
+def basenames(response):
+    return [e.basename for e in response.context["entries"]]
+
+
+def test_detail_view_is_paged(client, gallery):
+    response = client.get(reverse("gallery2:gallery_detail", args=[gallery.id]))
+    assert basenames(response) == ["e0", "e1", "e2"]
+    assert response.context["next_page_url"].endswith("?after=2.1")
+    assert b'data-next-url="/gallery/%d/entries/?after=2.1"' % gallery.id in (
+        response.content
+    )
+
+    response = client.get(response.context["next_page_url"])
+    assert basenames(response) == ["e3", "e4", "e5"]
+
+
+def test_entries_fragment(client, gallery):
+    url = reverse("gallery2:gallery_entries", args=[gallery.id])
+
+    response = client.get(url + "?after=5.1")
+    assert basenames(response) == ["e6"]
+    assert "next_fragment_url" not in response.context
+    assert b"entries-sentinel" not in response.content
+    assert b"<html" not in response.content
+
+    assert client.get(url + "?after=nan").status_code == 400
+    assert client.get(url + "?after=x").status_code == 400
+
+
+def test_page_queries_dont_depend_on_position(client, gallery):
+    url = reverse("gallery2:gallery_entries", args=[gallery.id])
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url + "?after=3.1")
+    sql = [q["sql"] for q in queries if "gallery2_entry" in q["sql"]]
+    assert len(sql) == 1
+    assert "OFFSET" not in sql[0]
+    assert '"order" > 3.1' in sql[0]
@@ -0,0 +1,152 @@
+import random
+from datetime import datetime, timezone
+from unittest import mock
+
+import numpy as np
+import pytest
+from PIL import Image
+from django.core.management import call_command
+
+from gallery2.models import Gallery, Entry
+from gallery2.phash import (
+    BKTree,
+    dhash,
+    dhash_file,
+    ensure_entry_phash,
+    format_hash,
+    hamming,
+)
+from gallery2.thumbnails import get_thumbnail_extractor
+
+
+def noise_image(seed, size=(600, 400)):
+    rng = np.random.default_rng(seed)
+    # smooth noise, so that downscaling keeps the structure
+    small = rng.integers(0, 256, (4, 5, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+
+
+@pytest.fixture
+def noise_files(tmp_path):
+    """a.jpg and b.png are the same picture at different sizes, c.jpg isn’t."""
+    src_dir = tmp_path / "src"
+    src_dir.mkdir()
+    noise_image(1).save(src_dir / "a.jpg", quality=90)
+    noise_image(1, size=(300, 200)).save(src_dir / "b.png")
+    noise_image(2).save(src_dir / "c.jpg", quality=90)
+    return src_dir
+
+
+def test_dhash_resized_copy_is_close(noise_files):
+    a = dhash_file(noise_files / "a.jpg")
+    b = dhash_file(noise_files / "b.png")
+    c = dhash_file(noise_files / "c.jpg")
+
+    assert hamming(a, b) <= 4
+    assert hamming(a, c) > 16
+
+
+def test_dhash_is_64_bits():
+    assert 0 <= dhash(noise_image(3)) < 2**64
+    assert len(format_hash(dhash(noise_image(3)))) == 16
+
+
+def test_bk_tree_matches_brute_force():
+    rng = random.Random(4)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    # some near-duplicates
+    hashes += [h ^ (1 << rng.randrange(64)) for h in hashes[:50]]
+
+    tree = BKTree((h, i) for i, h in enumerate(hashes))
+    assert len(tree) == len(hashes)
+
+    for query in hashes[:20] + [rng.getrandbits(64) for _ in range(20)]:
+        expected = sorted(i for i, h in enumerate(hashes) if hamming(query, h) <= 20)
+        assert sorted(i for _, i in tree.search(query, 20)) == expected
+
+
+def test_importimages_skip_near_duplicates(db, noise_files):
+    gallery = Gallery.objects.create(name="dupes", directory=noise_files)
+
+    with mock.patch(
+        "gallery2.management.commands.importimages.Command.extract_timestamp",
+        side_effect=lambda path: datetime(
+            2023, 1, 1, ord(path.stem) - ord("a"), tzinfo=timezone.utc
+        ),
+    ):
+        call_command(
+            "importimages", str(noise_files), gallery.id, "--skip-near-duplicates"
+        )
+
+    basenames = sorted(e.basename for e in Entry.objects.filter(gallery=gallery))
+    assert len(basenames) == 2
+    assert "c" in basenames
+    assert all(e.phash for e in Entry.objects.filter(gallery=gallery))
+
+
+def test_find_duplicates(db, noise_files, capsys):
+    gallery = Gallery.objects.create(name="dupes", directory=noise_files)
+    for i, name in enumerate(["a.jpg", "b.png", "c.jpg"]):
+        Entry.objects.create(
+            gallery=gallery, basename=name[0], filenames=[name], order=i
+        )
+
+    call_command("find_duplicates", gallery.id)
+
+    out = capsys.readouterr().out
+    assert "Near-duplicates: a (" in out
+    assert ", b (" in out
+    assert "c (" not in out
+    assert "found 1 groups" in out
+    assert Entry.objects.filter(gallery=gallery, phash__isnull=True).count() == 0
+
+
+def test_find_duplicates_skips_unreadable_images(db, noise_files, capsys):
+    gallery = Gallery.objects.create(name="dupes", directory=noise_files)
+    (noise_files / "broken.jpg").write_bytes(b"not a jpeg")
+    for i, name in enumerate(["a.jpg", "broken.jpg", "b.png"]):
+        Entry.objects.create(
+            gallery=gallery, basename=name.split(".")[0], filenames=[name], order=i
+        )
+
+    call_command("find_duplicates", gallery.id)
+
+    out = capsys.readouterr().out
+    assert "Could not hash 'broken'" in out
+    assert "Near-duplicates: a (" in out
+    assert "Checked 2 entries, found 1 groups" in out
+
+
+def test_thumbnail_keeps_the_import_hash(db, noise_files):
+    gallery = Gallery.objects.create(name="dupes", directory=noise_files)
+    with mock.patch(
+        "gallery2.management.commands.importimages.Command.extract_timestamp",
+        return_value=datetime(2023, 1, 1, tzinfo=timezone.utc),
+    ):
+        call_command(
+            "importimages", str(noise_files), gallery.id, "--skip-near-duplicates"
+        )
+    entry = Entry.objects.get(gallery=gallery, basename="c")
+    imported = entry.phash
+
+    get_thumbnail_extractor(entry.filenames, gallery.id, entry.id, 100).get_thumbnail(
+        noise_files / "c.jpg"
+    )
+    entry.refresh_from_db()
+    assert entry.phash == imported == format_hash(dhash_file(noise_files / "c.jpg"))
+
+
+def test_hashing_does_not_change_the_gallery(db, noise_files):
+    gallery = Gallery.objects.create(name="dupes", directory=noise_files)
+    entry = Entry.objects.create(
+        gallery=gallery, basename="a", filenames=["a.jpg"], order=1
+    )
+    version = entry.version
+    gallery.refresh_from_db()
+    revision = gallery.revision
+
+    assert ensure_entry_phash(entry) == dhash_file(noise_files / "a.jpg")
+    entry.refresh_from_db()
+    gallery.refresh_from_db()
+    assert entry.phash
+    assert (entry.version, gallery.revision) == (version, revision)
@@ -0,0 +1,57 @@
+import os
+import pstats
+import time
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from gallery2.models import Gallery
+from gallery2.profiling import profiles_dir, prune_profiles
+
+
+def test_staff_can_profile_a_request(db, client, admin_client, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    url = reverse("gallery2:gallery_list")
+
+    # only staff
+    assert "X-Profile" not in client.get(url, {"profile": "1"})
+    assert not profiles_dir().exists()
+
+    assert "X-Profile" not in admin_client.get(url)
+    response = admin_client.get(url, headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    profile = tmp_path / response["X-Profile"]
+    assert profile.parent == profiles_dir()
+    assert "GET_gallery" in profile.name
+    assert pstats.Stats(str(profile)).total_calls > 0
+
+
+def test_command_profile(db, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    gallery = Gallery.objects.create(name="profile")
+    (tmp_path / "src").mkdir()
+
+    call_command("importimages", str(tmp_path / "src"), gallery.id, "--profile")
+    [profile] = profiles_dir().glob("*.prof")
+    assert "importimages" in profile.name
+
+
+def test_prune_profiles(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.GALLERY_PROFILES_MAX_BYTES = 250
+    settings.GALLERY_PROFILES_MAX_AGE = 60
+    profiles_dir().mkdir()
+
+    now = time.time()
+    for name, age in [("new", 0), ("old", 20), ("older", 40), ("expired", 120)]:
+        path = profiles_dir() / f"{name}.prof"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - age, now - age))
+
+    prune_profiles()
+    assert sorted(p.stem for p in profiles_dir().iterdir()) == ["new", "old"]
+
+
+def test_unprofiled_requests_do_not_load_the_session(db, admin_client):
+    response = admin_client.get(reverse("gallery2:gallery_list"))
+    assert not response.wsgi_request.session.accessed
@@ -0,0 +1,238 @@
+import errno
+import gzip
+import json
+import re
+import shutil
+import stat
+
+import brotli
+import pytest
+from PIL import Image
+from django.core.management import call_command
+
+from gallery2 import metrics
+from gallery2.files import UMASK
+from gallery2.models import Derivative, Gallery
+from gallery2.publishing import COPY_METHODS, MANIFEST_NAME, Publisher
+from gallery2.timing import StageReport
+
+from .test_metrics import samples
+from .tests import blue_jpg_file
+
+
+INDEX = {"index.html", "index.html.gz", "index.html.br"}
+
+
+def build(gallery, publish, *args):
+    call_command("buildgallery", str(gallery.id), "--output-dir", str(publish), *args)
+
+
+def mtimes(publish):
+    return {
+        str(p.relative_to(publish)): p.stat().st_mtime_ns
+        for p in publish.rglob("*")
+        if p.is_file() and p.name != MANIFEST_NAME
+    }
+
+
+def test_incremental_build(db, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    src = tmp_path / "src"
+    src.mkdir()
+    for name, color in [("e1", "blue"), ("e2", "red")]:
+        Image.new("RGB", (900, 600), color=color).save(src / f"{name}.jpg")
+    gallery = Gallery.objects.create(name="incremental", directory=src)
+    e1 = gallery.entry_set.create(
+        order=1.0, basename="e1", filenames=["e1.jpg"], caption="one"
+    )
+    e2 = gallery.entry_set.create(
+        order=2.0, basename="e2", filenames=["e2.jpg"], caption="two"
+    )
+    publish = tmp_path / "publish"
+    (publish / "stale").mkdir(parents=True)
+    (publish / "stale" / "file.txt").write_text("left over")
+
+    build(gallery, publish, "--incremental")
+    manifest = json.loads((publish / MANIFEST_NAME).read_text())
+    assert "index.html" in manifest["files"]
+    assert not (publish / "stale").exists()
+    first = mtimes(publish)
+
+    # nothing changed, so nothing is rewritten
+    build(gallery, publish, "--incremental")
+    assert mtimes(publish) == first
+
+    e1.caption = "one, again"
+    e1.save()
+    build(gallery, publish, "--incremental")
+    second = mtimes(publish)
+    assert {k for k in first if second.get(k) != first[k]} == INDEX
+    assert "one, again" in (publish / "index.html").read_text()
+
+    e2.hidden = True
+    e2.save()
+    build(gallery, publish, "--incremental")
+    [e2_media] = second.keys() - mtimes(publish).keys()
+    assert e2_media.startswith("media/")
+
+    # a full build starts over
+    (publish / "index.html").write_text("edited by hand")
+    build(gallery, publish)
+    assert "one, again" in (publish / "index.html").read_text()
+
+
+def test_published_names_are_content_hashes(db, settings, tmp_path, blue_jpg_file):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    src = tmp_path / "src"
+    src.mkdir()
+    gallery = Gallery.objects.create(name="hashed", directory=src)
+    entries = []
+    for i, color in enumerate(["blue", "red", "green"]):
+        Image.new("RGB", (900, 600), color=color).save(src / f"e{i}.jpg")
+        entries.append(
+            gallery.entry_set.create(
+                order=i, basename=f"e{i}", filenames=[f"e{i}.jpg"], caption="."
+            )
+        )
+    publish = tmp_path / "publish"
+    build(gallery, publish, "--incremental")
+
+    html = (publish / "index.html").read_text()
+    first = mtimes(publish)
+    for rel in first:
+        if rel in INDEX or rel.endswith((".gz", ".br")):
+            continue
+        assert re.search(r"(^|[/.])[0-9a-f]{16}\.", rel), rel
+        assert f'"{rel}"' in html
+    assert re.search(r'"css/gallery\.[0-9a-f]{16}\.css"', html)
+
+    # moving an entry to the front only changes index.html
+    entries[2].order = -1
+    entries[2].save()
+    build(gallery, publish, "--incremental")
+    second = mtimes(publish)
+    assert second.keys() == first.keys()
+    assert {k for k in first if second[k] != first[k]} == INDEX
+
+
+def test_parallel_build(db, settings, tmp_path, blue_jpg_file):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    # so that the workers have to flush their metrics on the way out
+    settings.GALLERY_METRICS_FLUSH_INTERVAL = 3600
+    src = tmp_path / "src"
+    src.mkdir()
+    gallery = Gallery.objects.create(name="parallel", directory=src)
+    for i in range(4):
+        shutil.copy(blue_jpg_file, src / f"e{i}.jpg")
+        gallery.entry_set.create(
+            order=i, basename=f"e{i}", filenames=[f"e{i}.jpg"], caption=f"caption {i}"
+        )
+
+    build(gallery, tmp_path / "parallel", "--jobs", "3")
+    assert Derivative.objects.filter(entry__gallery=gallery).count() == 4
+    build(gallery, tmp_path / "serial")
+
+    parallel = (tmp_path / "parallel" / "index.html").read_text()
+    assert parallel == (tmp_path / "serial" / "index.html").read_text()
+    assert [parallel.index(f"caption {i}") for i in range(4)] == sorted(
+        parallel.index(f"caption {i}") for i in range(4)
+    )
+
+    exported = samples(metrics.export())
+    for result in ["miss", "hit"]:
+        labels = f'extractor="image",result="{result}",size="1600"'
+        assert exported[f"gallery2_thumbnail_requests_total{{{labels}}}"] == "4"
+
+
+@pytest.mark.parametrize("method", COPY_METHODS)
+def test_copy_methods(tmp_path, method):
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"x" * 100_000)
+    publisher = Publisher(tmp_path / "publish", StageReport("test"), copy_method=method)
+    try:
+        publisher.publish_file(src, "media/dest.bin")
+    except OSError as e:
+        pytest.skip(f"{method} not supported here: {e}")
+
+    dest = tmp_path / "publish" / "media" / "dest.bin"
+    assert dest.read_bytes() == src.read_bytes()
+    assert dest.stat().st_mtime_ns == src.stat().st_mtime_ns
+    assert publisher.copied_by == {method: 1}
+
+
+def test_auto_copy_falls_back(tmp_path, monkeypatch):
+    attempts = []
+
+    def unsupported(src, dest):
+        attempts.append(src.name)
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setitem(COPY_METHODS, "reflink", unsupported)
+    monkeypatch.setitem(COPY_METHODS, "hardlink", unsupported)
+    report = StageReport("test")
+    publisher = Publisher(tmp_path / "publish", report)
+    for name in ["a", "b"]:
+        (tmp_path / name).write_text(name)
+        publisher.publish_file(tmp_path / name, name)
+
+    assert (tmp_path / "publish" / "b").read_text() == "b"
+    # each method is only tried once on the same filesystem
+    assert attempts == ["a", "a"]
+    assert publisher.copied_by == {"copy_file_range": 2}
+    stages = report.as_dict()["stages"]
+    assert stages["copy:reflink"]["count"] == 0
+    assert stages["copy:copy_file_range"]["count"] == 2
+
+
+def test_compressed_variants(tmp_path):
+    publish = tmp_path / "publish"
+    script = tmp_path / "gallery.js"
+    script.write_text("console.log('hi');\n" * 100)
+    report = StageReport("test")
+    publisher = Publisher(publish, report, incremental=True)
+    publisher.publish_bytes(b"<p>hello</p>" * 100, "index.html")
+    publisher.publish_file(script, "js/gallery.js")
+    publisher.publish_bytes(b"not text", "media/0000.webp")
+    publisher.finish()
+
+    for rel in ["index.html", "js/gallery.js"]:
+        data = (publish / rel).read_bytes()
+        assert gzip.decompress((publish / f"{rel}.gz").read_bytes()) == data
+        assert brotli.decompress((publish / f"{rel}.br").read_bytes()) == data
+        for variant in [f"{rel}.gz", f"{rel}.br"]:
+            mode = stat.S_IMODE((publish / variant).stat().st_mode)
+            assert mode == 0o666 & ~UMASK
+    assert not (publish / "media" / "0000.webp.gz").exists()
+    assert report.as_dict()["stages"]["compress"]["count"] == 4
+
+    # only remade when the original changes
+    report = StageReport("test")
+    publisher = Publisher(publish, report, incremental=True)
+    publisher.publish_bytes(b"<p>goodbye</p>" * 100, "index.html")
+    publisher.publish_file(script, "js/gallery.js")
+    publisher.finish()
+    assert report.as_dict()["stages"]["compress"]["count"] == 2
+    assert gzip.decompress((publish / "index.html.gz").read_bytes()).startswith(
+        b"<p>goodbye"
+    )
+    assert not (publish / "media").exists()
+
+
+def test_published_files_are_readable(db, settings, tmp_path, blue_jpg_file):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    src = tmp_path / "src"
+    src.mkdir()
+    shutil.copy(blue_jpg_file, src / "e1.jpg")
+    gallery = Gallery.objects.create(name="modes", directory=src)
+    gallery.entry_set.create(order=1, basename="e1", filenames=["e1.jpg"], caption=".")
+
+    publish = tmp_path / "publish"
+    for method in ["copy", "hardlink"]:
+        build(gallery, publish, "--copy-method", method)
+        for rel in ["index.html", MANIFEST_NAME]:
+            mode = stat.S_IMODE((publish / rel).stat().st_mode)
+            assert mode == 0o666 & ~UMASK, (method, rel)
+        # copies keep their source’s mode, which is at least this readable
+        for rel in mtimes(publish):
+            mode = stat.S_IMODE((publish / rel).stat().st_mode)
+            assert mode & 0o444 == 0o666 & ~UMASK & 0o444, (method, rel)
@@ -0,0 +1,228 @@
+import shutil
+import stat
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from gallery2.files import UMASK
+from gallery2.models import Gallery, Entry
+from gallery2.thumbnails import ImageThumbnailExtractor
+
+from .tests import blue_png_file, one_frame_mov_file
+
+
+def make_entry(tmp_path, blue_png_file):
+    gallery = Gallery.objects.create(name="serving", directory=tmp_path)
+    shutil.copy(blue_png_file, tmp_path / "e1.png")
+    return Entry.objects.create(
+        gallery=gallery, basename="e1", filenames=["e1.png"], order=1.0
+    )
+
+
+def test_thumbnail_conditional_get(db, client, tmp_path, blue_png_file):
+    entry = make_entry(tmp_path, blue_png_file)
+    url = reverse("gallery2:entry_thumbnail", kwargs={"entry_id": entry.id})
+
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert etag.startswith('"')
+    assert response["Cache-Control"] == "no-cache"
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert not response.content
+
+    response = client.get(url, headers={"If-Modified-Since": response["Last-Modified"]})
+    assert response.status_code == 304
+
+    response = client.get(url, headers={"If-None-Match": '"something-else"'})
+    assert response.status_code == 200
+
+
+def test_hidden_toggle_keeps_thumbnails(
+    db, client, tmp_path, blue_png_file, monkeypatch
+):
+    entry = make_entry(tmp_path, blue_png_file)
+    url = reverse("gallery2:entry_thumbnail", kwargs={"entry_id": entry.id})
+    hidden_url = reverse("gallery2:set_entry_hidden", args=[entry.id])
+
+    extracted = []
+    extract = ImageThumbnailExtractor._extract_thumbnail
+
+    def counting_extract(self, path):
+        extracted.append(self.size)
+        return extract(self, path)
+
+    monkeypatch.setattr(ImageThumbnailExtractor, "_extract_thumbnail", counting_extract)
+
+    visible = client.get(url)["ETag"]
+    for hidden in [True, False, True, False]:
+        client.post(hidden_url, {"hidden": hidden}, content_type="application/json")
+        client.get(url)
+    assert extracted == [1600, 250]
+    assert sorted(entry.derivatives.values_list("size", flat=True)) == [250, 1600]
+    assert client.get(url)["ETag"] == visible
+
+
+def test_original_and_public_media_revalidate(db, client, tmp_path, blue_png_file):
+    entry = make_entry(tmp_path, blue_png_file)
+    (tmp_path / "media" / "public").mkdir(parents=True)
+    (tmp_path / "media" / "public" / "hello.txt").write_text("hello\n", "utf-8")
+
+    for url in [
+        reverse("gallery2:entry_original", kwargs={"entry_id": entry.id}),
+        reverse(
+            "gallery2:serve_public_media",
+            kwargs={"gallery_id": entry.gallery_id, "filename": "hello.txt"},
+        ),
+    ]:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response["Cache-Control"] == "no-cache"
+
+        response = client.get(url, headers={"If-None-Match": response["ETag"]})
+        assert response.status_code == 304
+
+
+def test_x_accel_redirect_offload(db, client, tmp_path, blue_png_file, settings):
+    entry = make_entry(tmp_path, blue_png_file)
+    settings.GALLERY_FILE_OFFLOAD = "x-accel-redirect"
+    settings.GALLERY_OFFLOAD_LOCATIONS = {tmp_path: "/_offload/src/"}
+    url = reverse("gallery2:entry_original", kwargs={"entry_id": entry.id})
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response["X-Accel-Redirect"] == "/_offload/src/e1.png"
+    assert response["Content-Type"] == "image/png"
+    assert response["ETag"]
+    assert not response.content
+
+    # validators are still checked before handing off
+    response = client.get(url, headers={"If-None-Match": response["ETag"]})
+    assert response.status_code == 304
+    assert "X-Accel-Redirect" not in response
+
+    # files outside the internal locations are streamed as usual
+    settings.GALLERY_OFFLOAD_LOCATIONS = {tmp_path / "elsewhere": "/_offload/x/"}
+    response = client.get(url)
+    assert "X-Accel-Redirect" not in response
+    assert b"".join(response.streaming_content)
+
+
+def test_x_sendfile_offload(db, client, tmp_path, blue_png_file, settings):
+    entry = make_entry(tmp_path, blue_png_file)
+    settings.GALLERY_FILE_OFFLOAD = "x-sendfile"
+
+    response = client.get(
+        reverse("gallery2:entry_original", kwargs={"entry_id": entry.id})
+    )
+    assert response["X-Sendfile"] == str((tmp_path / "e1.png").resolve())
+
+
+@pytest.fixture
+def video_entry(db, tmp_path, one_frame_mov_file):
+    gallery = Gallery.objects.create(name="video", directory=tmp_path)
+    shutil.copy(one_frame_mov_file, tmp_path / "v.mov")
+    return Entry.objects.create(
+        gallery=gallery, basename="v", filenames=["v.mov"], order=1.0
+    )
+
+
+def remuxed_bytes(client, entry):
+    url = reverse("gallery2:entry_video", args=[entry.id])
+    assert client.get(url).status_code == 202
+    call_command("runworker", "--once")
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response["Accept-Ranges"] == "bytes"
+    return b"".join(response.streaming_content), response["ETag"]
+
+
+def test_video_single_range(client, video_entry):
+    data, etag = remuxed_bytes(client, video_entry)
+    url = reverse("gallery2:entry_video", args=[video_entry.id])
+
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 100-199/{len(data)}"
+    assert response["Content-Length"] == "100"
+    assert response["Content-Type"] == "video/mp4"
+    assert b"".join(response.streaming_content) == data[100:200]
+
+    # open-ended, as browsers send when seeking
+    response = client.get(url, headers={"Range": f"bytes={len(data) - 10}-"})
+    assert response.status_code == 206
+    assert b"".join(response.streaming_content) == data[-10:]
+
+    # suffix
+    response = client.get(url, headers={"Range": "bytes=-5"})
+    assert b"".join(response.streaming_content) == data[-5:]
+
+
+def test_video_multiple_ranges(client, video_entry):
+    data, etag = remuxed_bytes(client, video_entry)
+
+    response = client.get(
+        reverse("gallery2:entry_video", args=[video_entry.id]),
+        headers={"Range": "bytes=0-9, 50-59, 55-64"},
+    )
+    assert response.status_code == 206
+    content_type = response["Content-Type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.split("boundary=")[1].encode()
+
+    body = b"".join(response.streaming_content)
+    assert len(body) == int(response["Content-Length"])
+    parts = body.split(b"--" + boundary)
+    assert parts[-1] == b"--\r\n"
+    # overlapping ranges are merged
+    assert len(parts[1:-1]) == 2
+    assert parts[1].endswith(b"\r\n\r\n" + data[0:10] + b"\r\n")
+    assert b"Content-Range: bytes 50-64/" in parts[2]
+    assert parts[2].endswith(b"\r\n\r\n" + data[50:65] + b"\r\n")
+
+
+def test_video_if_range_and_unsatisfiable(client, video_entry):
+    data, etag = remuxed_bytes(client, video_entry)
+    url = reverse("gallery2:entry_video", args=[video_entry.id])
+
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+
+    # stale validator: send the whole, current file
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == data
+
+    response = client.get(url, headers={"Range": f"bytes={len(data)}-"})
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{len(data)}"
+
+    # malformed headers are ignored
+    response = client.get(url, headers={"Range": "bytes=9-3"})
+    assert response.status_code == 200
+
+
+def test_original_range(db, client, tmp_path, blue_png_file):
+    entry = make_entry(tmp_path, blue_png_file)
+    data = (tmp_path / "e1.png").read_bytes()
+
+    response = client.get(
+        reverse("gallery2:entry_original", args=[entry.id]),
+        headers={"Range": "bytes=1-3"},
+    )
+    assert response.status_code == 206
+    assert b"".join(response.streaming_content) == data[1:4]
+
+
+def test_thumbnails_are_not_private(db, tmp_path, blue_png_file, settings):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    entry = make_entry(tmp_path, blue_png_file)
+    path = ImageThumbnailExtractor(entry.gallery_id, entry.id).get_thumbnail(
+        tmp_path / "e1.png"
+    )
+    assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~UMASK
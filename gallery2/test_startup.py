@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+# Slow to import, and only needed once a request or job actually touches a
+# media file
+HEAVY_MODULES = {"av", "PIL", "pillow_heif", "exiftool", "numpy", "hdr"}
+
+# What a uwsgi worker does before its first request, and runworker before its
+# first job. (System checks, as run
+# by manage.py, also import PIL for polls’ ImageField.)
+STARTUP = """
+from website.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+import gallery2.jobs
+"""
+
+
+def import_times(code):
+    """{top-level module: cumulative µs} for running code in a new python with
+    -X importtime, as a worker or manage.py command would start up."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "website.dev_settings"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if cumulative.strip().isdigit():
+            top = name.strip().split(".")[0]
+            times[top] = max(times.get(top, 0), int(cumulative))
+    return times
+
+
+def test_startup_does_not_import_media_libraries():
+    times = import_times(STARTUP)
+    slowest = sorted(times.items(), key=lambda item: -item[1])[:10]
+    loaded = HEAVY_MODULES & times.keys()
+    assert not loaded, f"{loaded} imported at startup; slowest imports: {slowest}"
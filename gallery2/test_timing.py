@@ -0,0 +1,98 @@
+import io
+import json
+import shutil
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.core.management import call_command
+
+from gallery2.models import Gallery
+from gallery2.timing import StageReport, write_report
+
+from .tests import blue_jpg_file
+
+
+def test_stage_report_accumulates_and_keeps_slowest():
+    report = StageReport("test", top_n=2)
+
+    for name in ["a", "b", "c"]:
+        with report.stage("copy", path=name) as timing:
+            timing.bytes_read = timing.bytes_written = 10
+
+    with report.stage("list") as timing:
+        timing.count = 5
+
+    d = report.as_dict()
+    assert d["stages"]["copy"]["count"] == 3
+    assert d["stages"]["copy"]["bytes_read"] == 30
+    assert d["stages"]["copy"]["bytes_written"] == 30
+    assert d["stages"]["list"]["count"] == 5
+    assert len(d["slowest"]) == 2
+    assert d["slowest"][0]["wall"] >= d["slowest"][1]["wall"]
+
+
+def test_report_file_alone_writes_text(tmp_path):
+    report = StageReport("test")
+    with report.stage("list"):
+        pass
+    stdout = io.StringIO()
+
+    write_report(report, None, stdout=stdout)
+    write_report(report, None, tmp_path / "report.txt", stdout=stdout)
+
+    assert stdout.getvalue() == ""
+    assert (tmp_path / "report.txt").read_text("utf-8").startswith("test: ")
+
+
+def test_importimages_json_report(db, tmpdir, blue_jpg_file):
+    src_dir = tmpdir / "src"
+    src_dir.mkdir()
+    shutil.copy(blue_jpg_file, src_dir / "e1.jpg")
+    g = Gallery.objects.create(name="report")
+
+    report_file = tmpdir / "report.jsonl"
+    with mock.patch(
+        "gallery2.management.commands.importimages.Command.extract_timestamp",
+        return_value=datetime(2023, 1, 1, tzinfo=timezone.utc),
+    ):
+        call_command(
+            "importimages",
+            str(src_dir),
+            g.id,
+            "--report",
+            "json",
+            "--report-file",
+            str(report_file),
+        )
+
+    report = json.loads(report_file.read_text("utf-8").splitlines()[-1])
+    assert report["command"] == "importimages"
+    assert report["stages"]["list"]["count"] == 1
+    assert report["stages"]["exif"]["count"] == 1
+    assert report["stages"]["db"]["count"] == 1
+    assert report["slowest"][0]["path"].endswith("e1.jpg")
+
+
+def test_buildgallery_json_report(db, tmpdir, blue_jpg_file):
+    src_dir = tmpdir / "src"
+    src_dir.mkdir()
+    shutil.copy(blue_jpg_file, src_dir / "e1.jpg")
+    g = Gallery.objects.create(name="report", directory=src_dir)
+    g.entry_set.create(order=1.0, basename="e1", filenames=["e1.jpg"], caption="x")
+
+    report_file = tmpdir / "report.jsonl"
+    call_command(
+        "buildgallery",
+        str(g.id),
+        "--output-dir",
+        str(tmpdir / "publish"),
+        "--report",
+        "json",
+        "--report-file",
+        str(report_file),
+    )
+
+    report = json.loads(report_file.read_text("utf-8"))
+    assert report["stages"]["thumbnail"]["count"] == 1
+    assert report["stages"]["copy"]["bytes_written"] > 0
+    assert report["stages"]["render"]["bytes_written"] > 0
@@ -0,0 +1,41 @@
+from django.urls import reverse
+
+from gallery2 import warmup
+
+
+def test_warmup_and_ready(db, client, settings, monkeypatch):
+    url = reverse("gallery2:ready")
+    settings.GALLERY_WARMUP = []
+    assert client.get(url).json() == {"ready": True, "steps": {}}
+
+    monkeypatch.setattr(warmup, "_warmup", None)
+    settings.GALLERY_WARMUP = ["imaging", "database"]
+    response = client.get(url)
+    assert response.status_code == 503
+    assert response.json()["steps"] == {"imaging": "pending", "database": "pending"}
+
+    warmup.start()
+    assert warmup._warmup.done.wait(timeout=30)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json() == {
+        "ready": True,
+        "steps": {"imaging": "done", "database": "done"},
+    }
+
+    # only once per process
+    first = warmup._warmup
+    warmup.start()
+    assert warmup._warmup is first
+
+
+def test_failed_step_still_finishes(settings, monkeypatch):
+    monkeypatch.setattr(warmup, "_warmup", None)
+    monkeypatch.setitem(warmup.STEPS, "broken", lambda: 1 / 0)
+    settings.GALLERY_WARMUP = ["broken"]
+
+    warmup.start()
+    assert warmup._warmup.done.wait(timeout=30)
+    ready, steps = warmup.status()
+    assert ready
+    assert steps["broken"].startswith("failed: ")
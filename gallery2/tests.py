@@ -100,7 +100,7 @@ def test_gallery_detail_view(db, client):
 
     assert "entries" in response.context
     entries = response.context["entries"]
-    assert entries.count() == 3
+    assert len(entries) == 3
 
     assert list(entries) == [entry2, entry1, entry3]
 
@@ -5,17 +5,18 @@ This module provides classes for extracting thumbnails from different types of f
 """
 
 import os
+import time
 from contextlib import closing
 from pathlib import Path
 from typing import List, Optional
 
-import av
-from PIL import Image
 from django.conf import settings
 
-from gallery2.files import IMAGE_EXTENSIONS, MOVIE_EXTENSIONS
-from gallery2.models import Entry
-from hdr.hdr_jpg_thumb import HdrSourceImage
+from gallery2 import metrics
+from gallery2.files import IMAGE_EXTENSIONS, MOVIE_EXTENSIONS, write_atomically
+from gallery2.instrumentation import span
+from gallery2.models import Derivative, Entry
+from gallery2.phash import dhash_file, format_hash
 
 
 class ThumbnailExtractor:
@@ -35,44 +36,95 @@ class ThumbnailExtractor:
             / f"gallery_{self.gallery_id}_entry_{self.entry_id}_thumb_{self.size}"
         ).with_suffix(suffix)
 
-    def _thumbnail_exists(self, original_path) -> bool:
-        if not self.entry.main_thumbnail_path:
-            return False
-        if not (self.thumbnails_dir / self.entry.main_thumbnail_path).exists():
-            return False
+    def _current_derivative(self, original_path) -> Optional[Derivative]:
+        mtime = original_path.stat().st_mtime
+        for derivative in self.entry.derivatives.filter(size=self.size):
+            if (
+                mtime in derivative.source_mtimes
+                and (self.thumbnails_dir / derivative.path).exists()
+            ):
+                return derivative
+        return None
 
-        stat = original_path.stat()
-        if self.entry.mtimes and stat.st_mtime in self.entry.mtimes:
-            return True
-        else:
-            return False
+    def is_current(self, path):
+        return self._current_derivative(path) is not None
 
     def get_thumbnail(self, path):
-        if not self._thumbnail_exists(path):
-            self._extract_thumbnail(path)
-        return self.thumbnails_dir / self.entry.main_thumbnail_path
-
-    def _extract_thumbnail(self, original_path):
+        derivative = self._current_derivative(path)
+        if derivative is None:
+            return self.save_thumbnail(**self.render_thumbnail(path))
+        metrics.inc(
+            "gallery2_thumbnail_requests_total",
+            result="hit",
+            extractor=self.kind,
+            size=self.size,
+        )
+        return self.thumbnails_dir / derivative.path
+
+    def render_thumbnail(self, original_path) -> dict:
+        """Write the thumbnail file, and return what save_thumbnail() needs to
+        record it. Doesn’t touch the database, so that buildgallery --jobs can
+        run it in a worker process."""
+        labels = dict(extractor=self.kind, size=self.size)
+        metrics.inc("gallery2_thumbnail_requests_total", result="miss", **labels)
+        start = time.perf_counter()
+        with span("thumbnail"):
+            rendered = self._extract_thumbnail(original_path)
+        metrics.observe(
+            "gallery2_thumbnail_seconds", time.perf_counter() - start, **labels
+        )
+        return rendered
+
+    def save_thumbnail(self, **rendered) -> Path:
+        derivative = self._save_thumb_meta(**rendered)
+        return self.thumbnails_dir / derivative.path
+
+    def _extract_thumbnail(self, original_path) -> dict:
         raise NotImplementedError("Subclasses must implement extract_thumbnail")
 
-    def _save_thumb_meta(self, width, height, thumbnail_path):
+    def _save_thumb_meta(self, width, height, thumbnail_path, phash=None):
         print("saved", self.entry.id, "thumbnail", thumbnail_path)
         new_mtimes = []
         for p in self.entry.filenames:
             new_mtimes.append(os.stat(Path(self.entry.gallery.directory) / p).st_mtime)
-        self.entry.mtimes = new_mtimes
-        self.entry.width = width
-        self.entry.height = height
-        if thumbnail_path is not None:
-            self.entry.main_thumbnail_path = thumbnail_path.relative_to(
-                self.thumbnails_dir
-            )
-        self.entry.save()
+
+        # Other formats of this size are out of date now
+        for old in self.entry.derivatives.filter(size=self.size).exclude(
+            format=thumbnail_path.suffix[1:]
+        ):
+            (self.thumbnails_dir / old.path).unlink(missing_ok=True)
+            old.delete()
+        derivative, _ = Derivative.objects.update_or_create(
+            entry=self.entry,
+            size=self.size,
+            format=thumbnail_path.suffix[1:],
+            defaults=dict(
+                path=str(thumbnail_path.relative_to(self.thumbnails_dir)),
+                source_mtimes=new_mtimes,
+            ),
+        )
+
+        if phash is not None:
+            phash = format_hash(phash)
+        else:
+            phash = self.entry.phash
+        if (width, height, phash) != (
+            self.entry.width,
+            self.entry.height,
+            self.entry.phash,
+        ):
+            self.entry.width = width
+            self.entry.height = height
+            self.entry.phash = phash
+            self.entry.save(update_fields=["width", "height", "phash"])
+        return derivative
 
 
 class ImageThumbnailExtractor(ThumbnailExtractor):
     """Thumbnail extractor for image files (png, jpeg, heic)."""
 
+    kind = "image"
+
     @classmethod
     def can_handle(cls, filename: str) -> bool:
         """Check if this extractor can handle the given filename."""
@@ -80,12 +132,15 @@ class ImageThumbnailExtractor(ThumbnailExtractor):
         return ext in IMAGE_EXTENSIONS
 
     def _extract_thumbnail(self, original_path):
+        from gallery2.images import Image
+        from hdr.hdr_jpg_thumb import HdrSourceImage
+
         with closing(HdrSourceImage(original_path.absolute())) as im:
             if im.file_is_supported():
                 width, height = im.width, im.height
                 thumbnail_path = self._thumbnail_path_name(".jpg")
                 jpeg_bytes = im.to_jpeg(max_size=self.size)
-                thumbnail_path.write_bytes(jpeg_bytes)
+                write_atomically(thumbnail_path, lambda p: p.write_bytes(jpeg_bytes))
             else:
                 with Image.open(original_path) as img:
                     thumbnail_path = self._thumbnail_path_name(".webp")
@@ -93,21 +148,31 @@ class ImageThumbnailExtractor(ThumbnailExtractor):
                     # Get original dimensions before creating thumbnail
                     width, height = img.size
                     img.thumbnail((self.size, self.size))
-                    img.save(thumbnail_path, "WEBP", quality=90)
+                    write_atomically(
+                        thumbnail_path, lambda p: img.save(p, "WEBP", quality=90)
+                    )
 
-        self._save_thumb_meta(width=width, height=height, thumbnail_path=thumbnail_path)
+        # Hashed from the original, as importimages does, not the thumbnail
+        phash = dhash_file(original_path)
+        return dict(
+            width=width, height=height, thumbnail_path=thumbnail_path, phash=phash
+        )
 
 
 class VideoThumbnailExtractor(ThumbnailExtractor):
     """Thumbnail extractor for video files."""
 
+    kind = "video"
+
     @classmethod
     def can_handle(cls, filename: str) -> bool:
         """Check if this extractor can handle the given filename."""
         ext = Path(filename).suffix.lower()
         return ext in MOVIE_EXTENSIONS
 
-    def _extract_thumbnail(self, original_path: Path) -> tuple:
+    def _extract_thumbnail(self, original_path: Path) -> dict:
+        import av
+
         thumbnail_path = self._thumbnail_path_name(".webp")
 
         container = av.open(str(original_path))
@@ -125,11 +190,11 @@ class VideoThumbnailExtractor(ThumbnailExtractor):
         for frame in container.decode(video_stream):
             img = frame.to_image()
             img.thumbnail((self.size, self.size))
-            img.save(thumbnail_path, "WEBP", quality=90)
+            write_atomically(thumbnail_path, lambda p: img.save(p, "WEBP", quality=90))
             break
         container.close()
 
-        self._save_thumb_meta(width=width, height=height, thumbnail_path=thumbnail_path)
+        return dict(width=width, height=height, thumbnail_path=thumbnail_path)
 
 
 def get_thumbnail_extractor(
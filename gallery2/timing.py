@@ -0,0 +1,185 @@
+"""
+Per-stage timing reports for the importimages and buildgallery commands.
+
+A StageReport collects wall time, CPU time, counts, and bytes read/written for
+each named stage of a run, plus the slowest individual files, so that slow
+imports and publishes can be compared across runs.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+DEFAULT_TOP_N = 10
+
+
+def _cpu_time():
+    # Include reaped children so ffmpeg and ultrahdr_app subprocesses count
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class StageTiming:
+    """Mutable handle yielded by StageReport.stage() for recording counts and
+    I/O from inside the timed block."""
+
+    def __init__(self, count):
+        self.count = count
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+class StageStats:
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.count = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def as_dict(self):
+        return {
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "count": self.count,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+class StageReport:
+    def __init__(self, command, top_n=DEFAULT_TOP_N):
+        self.command = command
+        self.top_n = top_n
+        self.stages = {}
+        self.started_at = datetime.now(timezone.utc)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = _cpu_time()
+        # min-heap of (wall, seq, stage, path), so the fastest is evicted first
+        self._slowest = []
+        self._seq = itertools.count()
+
+    @contextmanager
+    def stage(self, name, path=None, count=1):
+        """Time the enclosed block as one (or `count`) items of stage `name`.
+
+        If `path` is given, the block is also a candidate for the slowest-files
+        list.
+        """
+        timing = StageTiming(count)
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        try:
+            yield timing
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = _cpu_time() - cpu_start
+
+            stats = self.stages.setdefault(name, StageStats())
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.count += timing.count
+            stats.bytes_read += timing.bytes_read
+            stats.bytes_written += timing.bytes_written
+
+            if path is not None:
+                self._add_slowest(wall, name, path)
+
+    def _add_slowest(self, wall, name, path):
+        if self.top_n <= 0:
+            return
+        item = (wall, next(self._seq), name, os.fspath(path))
+        if len(self._slowest) < self.top_n:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    def merge(self, stages, slowest):
+        """Add in another report’s stages and slowest(), e.g. from one made in
+        a worker process."""
+        for name, other in stages.items():
+            stats = self.stages.setdefault(name, StageStats())
+            stats.wall += other.wall
+            stats.cpu += other.cpu
+            stats.count += other.count
+            stats.bytes_read += other.bytes_read
+            stats.bytes_written += other.bytes_written
+        for item in slowest:
+            self._add_slowest(item["wall"], item["stage"], item["path"])
+
+    def slowest(self):
+        return [
+            {"stage": stage, "path": path, "wall": round(wall, 6)}
+            for wall, _, stage, path in sorted(self._slowest, reverse=True)
+        ]
+
+    def as_dict(self):
+        return {
+            "command": self.command,
+            "started_at": self.started_at.isoformat(),
+            "wall": round(time.perf_counter() - self._wall_start, 6),
+            "cpu": round(_cpu_time() - self._cpu_start, 6),
+            "stages": {name: s.as_dict() for name, s in self.stages.items()},
+            "slowest": self.slowest(),
+        }
+
+    def summary_lines(self):
+        d = self.as_dict()
+        yield f"{self.command}: {d['wall']:.3f}s wall, {d['cpu']:.3f}s cpu"
+        for name, s in d["stages"].items():
+            yield (
+                f"  {name:<12} {s['count']:>6} × {s['wall']:>9.3f}s wall"
+                f" {s['cpu']:>9.3f}s cpu"
+                f" {s['bytes_read']:>12} B read {s['bytes_written']:>12} B written"
+            )
+        if d["slowest"]:
+            yield "  slowest:"
+            for item in d["slowest"]:
+                yield f"    {item['wall']:>9.3f}s {item['stage']:<12} {item['path']}"
+
+
+def add_report_arguments(parser):
+    parser.add_argument(
+        "--report",
+        choices=["text", "json"],
+        default=None,
+        help="Print per-stage timings at the end of the run"
+        " (default: text if --report-file is given, otherwise none)",
+    )
+    parser.add_argument(
+        "--report-file",
+        type=str,
+        default=None,
+        help="Append the report to this file instead of printing it;"
+        " json reports are written one object per line",
+    )
+    parser.add_argument(
+        "--report-top",
+        type=int,
+        default=DEFAULT_TOP_N,
+        help=f"Number of slowest files to include (default: {DEFAULT_TOP_N})",
+    )
+
+
+def write_report(report, report_format, report_file=None, stdout=sys.stdout):
+    if report_format is None:
+        if report_file is None:
+            return
+        # Asking for a report file is asking for a report
+        report_format = "text"
+
+    if report_format == "json":
+        text = json.dumps(report.as_dict()) + "\n"
+    else:
+        text = "\n".join(report.summary_lines()) + "\n"
+
+    if report_file is None:
+        stdout.write(text)
+    else:
+        with open(report_file, "a") as f:
+            f.write(text)
@@ -6,6 +6,11 @@ app_name = "gallery2"
 urlpatterns = [
     path("", views.GalleryListView.as_view(), name="gallery_list"),
     path("<int:pk>/", views.GalleryDetailView.as_view(), name="gallery_detail"),
+    path("<int:pk>/entries/", views.gallery_entries, name="gallery_entries"),
+    path(
+        "<int:pk>/entries.json", views.gallery_entries_json, name="gallery_entries_json"
+    ),
+    path("<int:pk>/entries/bulk", views.bulk_edit_entries, name="bulk_edit_entries"),
     path("create/", views.GalleryCreateView.as_view(), name="gallery_create"),
     path(
         "entry/<int:entry_id>/thumbnail/", views.entry_thumbnail, name="entry_thumbnail"
@@ -35,6 +40,35 @@ urlpatterns = [
         views.entry_video,
         name="entry_video",
     ),
+    path(
+        "entry/<int:entry_id>/video/status",
+        views.entry_video_status,
+        name="entry_video_status",
+    ),
+    path(
+        "entry/<int:entry_id>/video/<str:variant>/",
+        views.entry_video,
+        name="entry_video_variant",
+    ),
+    path(
+        "entry/<int:entry_id>/video/<str:variant>/status",
+        views.entry_video_status,
+        {"kind": "transcode"},
+        name="entry_video_variant_status",
+    ),
+    path(
+        "entry/<int:entry_id>/hls/status",
+        views.entry_video_status,
+        {"kind": "hls"},
+        name="entry_hls_status",
+    ),
+    path(
+        "entry/<int:entry_id>/hls/<str:name>",
+        views.entry_hls,
+        name="entry_hls",
+    ),
+    path("metrics", views.metrics_view, name="metrics"),
+    path("ready", views.ready, name="ready"),
     path(
         "<int:gallery_id>/media/public/<path:filename>",
         views.serve_public_media,
@@ -0,0 +1,329 @@
+"""
+Browser-friendly derivatives of entry videos.
+
+These can take a while to make, so views don’t make them; instead they queue a
+job with gallery2.jobs, and the runworker command calls into here.
+"""
+
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+
+from gallery2.files import MOVIE_EXTENSIONS
+from gallery2.instrumentation import span
+from gallery2.models import Entry
+
+REMUXABLE_EXTENSIONS = (".mov", ".mp4")
+
+HLS_PLAYLIST = "index.m3u8"
+HLS_SEGMENT_SECONDS = 4
+# Names ffmpeg gives the playlist, init segment, and media segments
+HLS_FILENAME_RE = re.compile(r"^(index\.m3u8|init\.mp4|seg\d+\.m4s)$")
+
+# Codecs that browsers with native HLS can play from fMP4 segments as-is
+HLS_COPY_VIDEO_CODECS = ("h264", "hevc")
+HLS_COPY_AUDIO_CODECS = ("aac",)
+
+
+def find_video_source(entry):
+    """Path to the entry’s original video file, or None."""
+    for filename in entry.filenames:
+        if Path(filename).suffix.lower() in MOVIE_EXTENSIONS:
+            path = Path(entry.gallery.directory) / filename
+            if path.exists():
+                return path
+    return None
+
+
+def remux_output_path(entry):
+    return Path(settings.MEDIA_ROOT) / "video" / f"{entry.id}.mp4"
+
+
+def remux_is_current(entry, path):
+    """Whether the remuxed copy of path exists and is up to date."""
+    return (
+        remux_output_path(entry).exists()
+        and bool(entry.video_mtimes)
+        and path.stat().st_mtime in entry.video_mtimes
+    )
+
+
+def remux_if_necessary(entry, path):
+    """Chrome can’t handle raw .mov files … and we want to strip metadata anyway."""
+    if not path.suffix.lower() in REMUXABLE_EXTENSIONS:
+        return path
+
+    out_file = remux_output_path(entry)
+    if remux_is_current(entry, path):
+        return out_file
+
+    remux(path, out_file)
+    record_remux(entry, path)
+    return out_file
+
+
+def remux(path, out_file):
+    """Write the remuxed copy of path to out_file. Only touches files, unlike
+    remux_if_necessary()."""
+    out_file.parent.mkdir(exist_ok=True)
+    with TemporaryDirectory() as tmpdir, span("remux"):
+        tmpdir = Path(tmpdir)
+        subprocess.check_call(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-i",
+                path.absolute(),
+                "-map_metadata",
+                "-1",
+                "-acodec",
+                "copy",
+                "-vcodec",
+                "copy",
+                "-fflags",
+                "+fastseek",
+                "-movflags",
+                "faststart",
+                "out.mp4",
+            ],
+            cwd=tmpdir,
+            stdin=subprocess.DEVNULL,
+        )
+        shutil.move(tmpdir / "out.mp4", out_file)
+
+
+def record_remux(entry, path):
+    """Note that the remuxed copy was made from path as it is now."""
+    e2 = Entry.objects.get(pk=entry.id)
+    if path.stat().st_mtime not in e2.video_mtimes:
+        e2.video_mtimes.append(path.stat().st_mtime)
+        e2.save()
+    entry.video_mtimes = e2.video_mtimes
+
+
+def source_fingerprint(path):
+    stat = path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def hls_output_dir(entry):
+    return Path(settings.MEDIA_ROOT) / "hls" / str(entry.id)
+
+
+def hls_is_current(entry, path):
+    """Whether the HLS segments for path exist and are up to date.
+
+    Each segment directory has a `source` file recording the fingerprint of the
+    video it was made from.
+    """
+    out_dir = hls_output_dir(entry)
+    try:
+        made_from = (out_dir / "source").read_text()
+    except FileNotFoundError:
+        return False
+    return made_from == source_fingerprint(path) and (out_dir / HLS_PLAYLIST).exists()
+
+
+def probe_codecs(path):
+    """([video codec, …], [audio codec, …]) of path’s streams."""
+    import av
+
+    with av.open(str(path)) as container:
+        video = [s.codec_context.name for s in container.streams.video]
+        audio = [s.codec_context.name for s in container.streams.audio]
+    return video, audio
+
+
+def probe_short_side(path):
+    """The smaller of the width and height of path’s first video stream."""
+    import av
+
+    with av.open(str(path)) as container:
+        for stream in container.streams.video:
+            return min(stream.width, stream.height)
+    return None
+
+
+def hls_codec_args(path):
+    """ffmpeg codec options: stream copy where the codecs allow, else H.264/AAC."""
+    video, audio = probe_codecs(path)
+
+    args = []
+    if video and video[0] in HLS_COPY_VIDEO_CODECS:
+        args += ["-c:v", "copy"]
+        if video[0] == "hevc":
+            # Safari only plays HEVC in fMP4 tagged this way
+            args += ["-tag:v", "hvc1"]
+    else:
+        args += ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p"]
+        # cut segments on keyframes at the segment length
+        args += ["-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})"]
+    if audio:
+        if audio[0] in HLS_COPY_AUDIO_CODECS:
+            args += ["-c:a", "copy"]
+        else:
+            args += ["-c:a", "aac", "-b:a", "128k"]
+    return args
+
+
+def make_hls_if_necessary(entry, path):
+    """Write an HLS playlist with fMP4 segments for path, and return its dir.
+
+    The new segments are written next to the old ones and swapped in with a
+    rename, so that a player never sees a mix of old and new segments.
+    """
+    out_dir = hls_output_dir(entry)
+    if hls_is_current(entry, path):
+        return out_dir
+
+    fingerprint = source_fingerprint(path)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    with TemporaryDirectory(dir=out_dir.parent, prefix=f".{entry.id}-") as tmpdir:
+        tmpdir = Path(tmpdir)
+        new_dir = tmpdir / "new"
+        new_dir.mkdir()
+        subprocess.check_call(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-i",
+                path.absolute(),
+                "-map",
+                "0:v:0",
+                "-map",
+                "0:a:0?",
+                "-map_metadata",
+                "-1",
+                *hls_codec_args(path),
+                "-f",
+                "hls",
+                "-hls_time",
+                str(HLS_SEGMENT_SECONDS),
+                "-hls_playlist_type",
+                "vod",
+                "-hls_segment_type",
+                "fmp4",
+                "-hls_fmp4_init_filename",
+                "init.mp4",
+                "-hls_segment_filename",
+                "seg%03d.m4s",
+                "-hls_flags",
+                "independent_segments",
+                HLS_PLAYLIST,
+            ],
+            cwd=new_dir,
+            stdin=subprocess.DEVNULL,
+        )
+        (new_dir / "source").write_text(fingerprint)
+
+        if out_dir.exists():
+            out_dir.rename(tmpdir / "old")
+        new_dir.rename(out_dir)
+
+    return out_dir
+
+
+def get_rung(name):
+    """The GALLERY_TRANSCODE_LADDER rung called name, or None."""
+    for rung in settings.GALLERY_TRANSCODE_LADDER:
+        if rung["name"] == name:
+            return rung
+    return None
+
+
+def transcode_rungs(path):
+    """The ladder rungs worth making for path, largest first.
+
+    Those bigger than the video itself are skipped, except that a video
+    smaller than every rung still gets the smallest one, at its own size.
+    """
+    short_side = probe_short_side(path)
+    if short_side is None:
+        return []
+    ladder = sorted(
+        settings.GALLERY_TRANSCODE_LADDER, key=lambda r: r["height"], reverse=True
+    )
+    return [r for r in ladder if r["height"] <= short_side] or ladder[-1:]
+
+
+def transcode_output_path(entry, name):
+    return Path(settings.MEDIA_ROOT) / "transcode" / str(entry.id) / f"{name}.mp4"
+
+
+def transcode_is_current(entry, path, name):
+    """Whether the name rendition of path exists and was made from it as it
+    is now, going by a `.source` file next to it like the HLS one."""
+    out_file = transcode_output_path(entry, name)
+    try:
+        made_from = out_file.with_suffix(".source").read_text()
+    except FileNotFoundError:
+        return False
+    return made_from == source_fingerprint(path) and out_file.exists()
+
+
+def transcode_if_necessary(entry, path, rung):
+    """Transcode path to H.264/AAC at the size and bitrates of a ladder rung.
+
+    Uses at most GALLERY_TRANSCODE_THREADS threads; how many of these run at
+    once is up to the job queue.
+    """
+    out_file = transcode_output_path(entry, rung["name"])
+    if transcode_is_current(entry, path, rung["name"]):
+        return out_file
+
+    fingerprint = source_fingerprint(path)
+    height = min(rung["height"], probe_short_side(path))
+    # scale the shorter side, after ffmpeg has applied any rotation
+    scale = f"scale='if(gt(iw,ih),-2,{height})':'if(gt(iw,ih),{height},-2)'"
+    video_bitrate = rung["video_bitrate"]
+
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        subprocess.check_call(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-i",
+                path.absolute(),
+                "-map",
+                "0:v:0",
+                "-map",
+                "0:a:0?",
+                "-map_metadata",
+                "-1",
+                "-vf",
+                scale,
+                "-c:v",
+                "libx264",
+                "-preset",
+                "medium",
+                "-pix_fmt",
+                "yuv420p",
+                "-b:v",
+                video_bitrate,
+                "-maxrate",
+                video_bitrate,
+                "-bufsize",
+                video_bitrate,
+                "-c:a",
+                "aac",
+                "-b:a",
+                rung["audio_bitrate"],
+                "-threads",
+                str(settings.GALLERY_TRANSCODE_THREADS),
+                "-movflags",
+                "faststart",
+                "out.mp4",
+            ],
+            cwd=tmpdir,
+            stdin=subprocess.DEVNULL,
+        )
+        shutil.move(tmpdir / "out.mp4", out_file)
+        out_file.with_suffix(".source").write_text(fingerprint)
+
+    return out_file
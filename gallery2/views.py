@@ -1,45 +1,253 @@
 import json
+import math
 import mimetypes
-import shutil
-import subprocess
 from pathlib import Path
-from tempfile import TemporaryDirectory
 
+import reversion
 from django.conf import settings
-from django.http import FileResponse, Http404, JsonResponse
-from django.shortcuts import get_object_or_404
-from django.urls import reverse_lazy
-from django.views.decorators.http import require_http_methods
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.db.models import Count, Min
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from django.views.generic import ListView, CreateView, DetailView
 
-from .models import Gallery, Entry
-from .templatetags.gallery_extras import markdown_to_html
+from . import jobs, metrics, warmup
+from .etags import gallery_detail_etag, gallery_list_etag
+from .files import MOVIE_EXTENSIONS
+from .fragments import render_entry_fragments
+from .models import Gallery, Entry, Job
+from .serving import serve_file
+from .templatetags.gallery_extras import scale_dimensions
 from .thumbnails import (
     get_thumbnail_extractor,
     ImageThumbnailExtractor,
     VideoThumbnailExtractor,
 )
+from .video import (
+    HLS_FILENAME_RE,
+    HLS_PLAYLIST,
+    REMUXABLE_EXTENSIONS,
+    find_video_source,
+    get_rung,
+    hls_is_current,
+    hls_output_dir,
+    remux_is_current,
+    remux_output_path,
+    transcode_is_current,
+    transcode_output_path,
+    transcode_rungs,
+)
 
 mimetypes.add_type("image/heic", ".heic")
 mimetypes.add_type("video/quicktime", ".mov")
 mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
 
 
+@method_decorator(
+    [
+        cache_control(private=True, no_cache=True),
+        condition(etag_func=gallery_list_etag),
+    ],
+    name="get",
+)
 class GalleryListView(ListView):
     model = Gallery
     context_object_name = "galleries"
 
 
+@method_decorator(
+    [
+        cache_control(private=True, no_cache=True),
+        condition(etag_func=gallery_detail_etag),
+    ],
+    name="get",
+)
 class GalleryDetailView(DetailView):
+    """
+    The first GALLERY_PAGE_SIZE entries of a gallery, or with ?after=<order>,
+    the ones after that. The page ends with a link to the next page, which
+    index.ts replaces with the gallery_entries fragment when scrolled to.
+    """
+
     model = Gallery
     context_object_name = "gallery"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["entries"] = Entry.objects.filter(gallery=self.object).order_by("order")
+        context.update(entry_page_context(self.object, parse_after(self.request)))
         return context
 
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=gallery_detail_etag)
+def gallery_entries(request, pk):
+    """HTML fragment of the entries after ?after=<order>, for infinite scroll."""
+    gallery = get_object_or_404(Gallery, pk=pk)
+    return render(
+        request,
+        "gallery2/_entries.html",
+        entry_page_context(gallery, parse_after(request)),
+    )
+
+
+def parse_after(request):
+    after = request.GET.get("after")
+    if after is None:
+        return None
+    try:
+        after = float(after)
+    except ValueError:
+        raise BadRequest(f"Invalid after {after!r}")
+    if not math.isfinite(after):
+        raise BadRequest(f"Invalid after {after!r}")
+    return after
+
+
+def entry_page_context(gallery, after=None):
+    """
+    Template context for the GALLERY_PAGE_SIZE entries of gallery after order
+    `after`, with URLs for the page and fragment after that if there are more.
+
+    This seeks on the (gallery, order) unique index instead of using OFFSET,
+    so every page takes the same time to fetch however far in it is.
+    """
+    page_size = settings.GALLERY_PAGE_SIZE
+    entries = Entry.objects.filter(gallery=gallery).order_by("order")
+    if after is not None:
+        entries = entries.filter(order__gt=after)
+    entries = list(entries[: page_size + 1])
+
+    context = {"entries": entries[:page_size]}
+    context["entry_fragments"] = render_entry_fragments(context["entries"])
+    if len(entries) > page_size:
+        # repr() round-trips the float exactly
+        query = f"?after={entries[page_size - 1].order!r}"
+        context["next_page_url"] = (
+            reverse("gallery2:gallery_detail", args=[gallery.id]) + query
+        )
+        context["next_fragment_url"] = (
+            reverse("gallery2:gallery_entries", args=[gallery.id]) + query
+        )
+    return context
+
+
+# For each field entries.json can return, the Entry columns it needs
+ENTRY_JSON_FIELDS = {
+    "id": ["id"],
+    "basename": ["basename"],
+    "filenames": ["filenames"],
+    "order": ["order"],
+    "caption": ["caption"],
+    "caption_html": ["caption_html"],
+    "timestamp": ["timestamp"],
+    "hidden": ["hidden"],
+    "width": ["width"],
+    "height": ["height"],
+    "has_video": ["filenames"],
+    "thumbnail": ["id", "width", "height", "hidden"],
+    "video_url": ["id", "filenames"],
+}
+MAX_ENTRIES_JSON_LIMIT = 1000
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=gallery_detail_etag)
+def gallery_entries_json(request, pk):
+    """
+    JSON list of a gallery’s entries, for scripts and the frontend.
+
+    Query parameters:
+      - fields: comma-separated subset of ENTRY_JSON_FIELDS, default all
+      - after: order value to continue after, as in the `next` URL
+      - limit: entries per response, default GALLERY_PAGE_SIZE
+
+    Rows come from .values(), and URLs are filled into templates reversed once
+    per request, so that large pages cost little more than the query.
+    """
+    revision = Gallery.objects.filter(pk=pk).values_list("revision", flat=True).first()
+    if revision is None:
+        raise Http404(f"No gallery {pk}")
+
+    fields = request.GET.get("fields")
+    fields = fields.split(",") if fields else list(ENTRY_JSON_FIELDS)
+    unknown = set(fields) - ENTRY_JSON_FIELDS.keys()
+    if unknown:
+        raise BadRequest(f"Unknown fields {sorted(unknown)}")
+
+    try:
+        limit = int(request.GET.get("limit", settings.GALLERY_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("Invalid limit")
+    if not 1 <= limit <= MAX_ENTRIES_JSON_LIMIT:
+        raise BadRequest(f"limit must be from 1 to {MAX_ENTRIES_JSON_LIMIT}")
+
+    columns = {"order"}
+    for field in fields:
+        columns.update(ENTRY_JSON_FIELDS[field])
+
+    rows = Entry.objects.filter(gallery_id=pk).order_by("order")
+    after = parse_after(request)
+    if after is not None:
+        rows = rows.filter(order__gt=after)
+    rows = list(rows.values(*columns)[: limit + 1])
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        query = request.GET.copy()
+        query["after"] = repr(rows[-1]["order"])
+        next_url = request.path + "?" + query.urlencode(safe=",")
+
+    thumbnail_url = _url_template("gallery2:entry_thumbnail")
+    video_url = _url_template("gallery2:entry_video")
+
+    entries = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field == "has_video":
+                item[field] = _has_video(row["filenames"])
+            elif field == "thumbnail":
+                item[field] = {"url": thumbnail_url(row["id"]), **_thumbnail_size(row)}
+            elif field == "video_url":
+                item[field] = (
+                    video_url(row["id"]) if _has_video(row["filenames"]) else None
+                )
+            else:
+                item[field] = row[field]
+        entries.append(item)
+
+    return JsonResponse({"revision": revision, "entries": entries, "next": next_url})
+
+
+def _url_template(name):
+    """Function from entry ID to the URL for the view name, from a single
+    reverse()."""
+    placeholder = 1234567890
+    prefix, suffix = reverse(name, args=[placeholder]).split(str(placeholder))
+    return lambda entry_id: f"{prefix}{entry_id}{suffix}"
+
+
+def _thumbnail_size(row):
+    """Display size of the thumbnail, as in _entry.html."""
+    if row["width"] is None or row["height"] is None:
+        return {"width": None, "height": None}
+    size = 100 if row["hidden"] else 800
+    return scale_dimensions(row["width"], row["height"], size)
+
+
+def _has_video(filenames):
+    return any(Path(f).suffix.lower() in MOVIE_EXTENSIONS for f in filenames)
+
+
 class GalleryCreateView(CreateView):
     model = Gallery
     fields = ["name"]
@@ -55,7 +263,8 @@ def entry_thumbnail(request, entry_id, size=1600, hidden_thumbnail_size=250):
     For video files, extracts a frame to use as a thumbnail.
 
     Returns:
-        FileResponse with the thumbnail image
+        FileResponse with the thumbnail image, or a 304 if the client’s copy
+        is current
     """
     entry = get_object_or_404(Entry, pk=entry_id)
     gallery = entry.gallery
@@ -91,7 +300,7 @@ def entry_thumbnail(request, entry_id, size=1600, hidden_thumbnail_size=250):
 
     thumbnail_path = extractor.get_thumbnail(original_path)
 
-    return FileResponse(open(thumbnail_path, "rb"))
+    return serve_file(request, thumbnail_path)
 
 
 @require_http_methods(["POST"])
@@ -130,7 +339,7 @@ def edit_caption(request, entry_id):
                 "gallery_id": entry.gallery_id,
                 "basename": entry.basename,
                 "caption": entry.caption,
-                "html_caption": markdown_to_html(entry.caption),
+                "html_caption": entry.caption_html,
                 "order": entry.order,
                 "timestamp": entry.timestamp.isoformat() if entry.timestamp else None,
             }
@@ -150,21 +359,189 @@ def set_entry_hidden(request, entry_id):
         data = json.loads(request.body)
         if "hidden" not in data:
             return JsonResponse({"error": "'hidden' field is required"}, status=400)
-        if bool(data["hidden"]) != entry.hidden:
-            if entry.main_thumbnail_path:
-                Path(entry.main_thumbnail_path).unlink(missing_ok=True)
-            entry.main_thumbnail_path = None
         entry.hidden = bool(data["hidden"])
-        entry.save()
+        entry.save(update_fields=["hidden"])
         return JsonResponse({"id": entry.id, "hidden": entry.hidden})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+# Fields bulk_edit_entries can change, and their types
+BULK_EDIT_FIELDS = {"caption": str, "hidden": bool, "order": (int, float)}
+
+
+@require_http_methods(["POST"])
+def bulk_edit_entries(request, pk):
+    """
+    REST JSON endpoint to change many entries of a gallery at once.
+    Expects: {"changes": [{"id": 1, "caption": "…", "hidden": false,
+                           "order": 2.5}, …]}
+    where each change has an id and any of the fields.
+
+    The valid changes are applied with bulk_update in one transaction, with
+    one reversion revision. Returns {"results": [...]} with, for each change
+    in order, either the entry’s new values or an error.
+    """
+    gallery = get_object_or_404(Gallery, pk=pk)
+    try:
+        changes = json.loads(request.body)["changes"]
+        if not isinstance(changes, list):
+            raise TypeError
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return JsonResponse(
+            {"error": "Expected {'changes': [...]} JSON data"}, status=400
+        )
+
+    with transaction.atomic(), reversion.create_revision(atomic=False):
+        entries = Entry.objects.filter(gallery=gallery).in_bulk(
+            [c.get("id") for c in changes if _change_id(c) is not None]
+        )
+        results, changed = _apply_bulk_changes(gallery, entries, changes)
+
+        if changed:
+            fields = set()
+            for entry in changed:
+                fields.update(entry.changed_fields)
+                entry.version += 1
+            fields.add("version")
+            if "caption" in fields:
+                fields.update(["caption_html", "caption_html_version"])
+
+            if "order" in fields:
+                _bulk_reorder(
+                    gallery, [e for e in changed if "order" in e.changed_fields]
+                )
+            Entry.objects.bulk_update(changed, fields - {"order"})
+
+            for entry in changed:
+                reversion.add_to_revision(entry)
+            reversion.set_comment(f"Bulk edit of {len(changed)} entries")
+            Gallery.bump_revisions([gallery.id])
+
+    return JsonResponse({"results": results})
+
+
+def _valid_order(value):
+    if isinstance(value, bool):
+        return False
+    try:
+        # JSON integers can be too big for a float
+        return math.isfinite(float(value))
+    except OverflowError:
+        return False
+
+
+def _apply_bulk_changes(gallery, entries, changes):
+    """Validate changes and apply the valid ones to entries in memory.
+
+    Returns per-change results, and the entries that changed, each with a
+    changed_fields set.
+    """
+    errors = {}
+    for i, change in enumerate(changes):
+        if _change_id(change) not in entries:
+            errors[i] = "No such entry in this gallery"
+            continue
+        unknown = change.keys() - BULK_EDIT_FIELDS.keys() - {"id"}
+        if unknown:
+            errors[i] = f"Unknown fields {sorted(unknown)}"
+        for field, field_type in BULK_EDIT_FIELDS.items():
+            if field in change and (
+                not isinstance(change[field], field_type)
+                or field == "order"
+                and not _valid_order(change[field])
+            ):
+                errors[i] = f"Invalid {field}"
+
+    # Orders must stay unique within the gallery. Dropping a change can
+    # leave its entry where another change wanted to move something, so
+    # check again until nothing else fails.
+    current_orders = dict(
+        Entry.objects.filter(gallery=gallery).values_list("order", "id")
+    )
+    while True:
+        moves = {}
+        new_errors = {}
+        for i, change in enumerate(changes):
+            if i not in errors and "order" in change:
+                moves[change["id"]] = float(change["order"])
+        owners = {}
+        for i, change in enumerate(changes):
+            if i in errors or "order" not in change:
+                continue
+            order = moves[change["id"]]
+            holder = current_orders.get(order)
+            if owners.setdefault(order, change["id"]) != change["id"]:
+                new_errors[i] = "Duplicate order in this batch"
+            elif holder not in (None, change["id"]) and holder not in moves:
+                new_errors[i] = "Another entry already has that order"
+        if not new_errors:
+            break
+        errors.update(new_errors)
+
+    results = []
+    changed = {}
+    for i, change in enumerate(changes):
+        if i in errors:
+            results.append({"id": _change_id(change), "ok": False, "error": errors[i]})
+            continue
+
+        entry = entries[change["id"]]
+        entry.changed_fields = getattr(entry, "changed_fields", set())
+        if "caption" in change:
+            entry.caption = change["caption"]
+            entry.render_caption_if_stale()
+            entry.changed_fields.add("caption")
+        if "hidden" in change:
+            entry.hidden = change["hidden"]
+            entry.changed_fields.add("hidden")
+        if "order" in change:
+            entry.order = float(change["order"])
+            entry.changed_fields.add("order")
+        changed[entry.id] = entry
+        results.append({"id": entry.id, "ok": True})
+
+    for result in results:
+        if result["ok"]:
+            entry = changed[result["id"]]
+            result.update(
+                caption=entry.caption,
+                caption_html=entry.caption_html,
+                hidden=entry.hidden,
+                order=entry.order,
+            )
+    return results, list(changed.values())
+
+
+def _change_id(change):
+    """The entry id of a bulk change, or None if it doesn’t have a valid one."""
+    if isinstance(change, dict):
+        entry_id = change.get("id")
+        if isinstance(entry_id, int) and not isinstance(entry_id, bool):
+            return entry_id
+    return None
+
+
+def _bulk_reorder(gallery, entries):
+    """Save new orders without tripping the (gallery, order) unique
+    constraint when entries swap places: first move them all out of the way
+    to orders below any in the gallery, then to where they are going."""
+    lowest = Entry.objects.filter(gallery=gallery).aggregate(Min("order"))["order__min"]
+    final = {entry.id: entry.order for entry in entries}
+    for i, entry in enumerate(entries):
+        entry.order = min(lowest, 0) - 1 - i
+    Entry.objects.bulk_update(entries, ["order"])
+    for entry in entries:
+        entry.order = final[entry.id]
+    Entry.objects.bulk_update(entries, ["order"])
+
+
 def entry_original(request, entry_id):
     """
     Serve the original file for an entry.
     Prioritizes image files over video files, similar to thumbnail extraction.
+    Videos are served remuxed once the remux job has run, and as-is until
+    then.
 
     Returns:
         FileResponse with the original file
@@ -193,76 +570,160 @@ def entry_original(request, entry_id):
     if not found:
         raise Http404(f"No original file found for entry {entry_id}")
 
-    found = remux_if_necessary(entry, found)
+    if found.suffix.lower() in REMUXABLE_EXTENSIONS:
+        if remux_is_current(entry, found):
+            found = remux_output_path(entry)
+        else:
+            jobs.enqueue(entry, Job.Kind.REMUX, source_path=found)
+
+    return serve_file(request, found)
 
-    return FileResponse(open(found, "rb"))
 
+def entry_video(request, entry_id, variant=None):
+    """
+    Serve the browser-friendly remux of an entry’s video, or with variant, its
+    H.264 rendition for that GALLERY_TRANSCODE_LADDER rung.
 
-def entry_video(request, entry_id):
+    Those can take a while to make, so if it isn’t done yet, this queues a job
+    for the runworker command and returns 202 with a URL to poll instead.
+    """
     entry = get_object_or_404(Entry, pk=entry_id)
-    gallery = entry.gallery
 
-    found = None
-    for filename in entry.filenames:
-        if filename.lower().endswith(".mov"):
-            video_path = Path(gallery.directory) / filename
-            if video_path.exists():
-                found = filename
-                break
+    video_path = find_video_source(entry)
+    if video_path is None:
+        raise Http404(f"No video file found for entry {entry_id}")
 
-    video_path = remux_if_necessary(entry, video_path)
+    if variant is None:
+        if remux_is_current(entry, video_path):
+            return serve_file(request, remux_output_path(entry))
+        return _enqueue_response(entry, Job.Kind.REMUX, video_path)
 
-    if not found:
+    if get_rung(variant) is None:
+        raise Http404(f"No {variant} rendition for entry {entry_id}")
+    if transcode_is_current(entry, video_path, variant):
+        return serve_file(request, transcode_output_path(entry, variant))
+    # Only probe the video, which is slow, when there’s something to make
+    if variant not in [r["name"] for r in transcode_rungs(video_path)]:
+        raise Http404(f"No {variant} rendition for entry {entry_id}")
+    return _enqueue_response(entry, Job.Kind.TRANSCODE, video_path, variant)
+
+
+def entry_hls(request, entry_id, name):
+    """
+    Serve the HLS playlist or one of its fMP4 segments for an entry’s video.
+
+    Like entry_video, a request for the playlist before the segments are made
+    queues a job and returns 202.
+    """
+    if not HLS_FILENAME_RE.match(name):
+        raise Http404(f"No HLS file {name}")
+
+    entry = get_object_or_404(Entry, pk=entry_id)
+
+    video_path = find_video_source(entry)
+    if video_path is None:
         raise Http404(f"No video file found for entry {entry_id}")
 
-    return FileResponse(open(video_path, "rb"))
-
-
-def remux_if_necessary(entry, path):
-    """Chrome can’t handle raw .mov files … and we want to strip metadata anyway."""
-    if not path.suffix.lower() in [".mov", ".mp4"]:
-        return path
-
-    REMUX_DIR = settings.MEDIA_ROOT / "video"
-
-    out_file = REMUX_DIR / f"{entry.id}.mp4"
-    if out_file.exists():
-        if entry.video_mtimes and path.stat().st_mtime in entry.video_mtimes:
-            return out_file
-
-    if not REMUX_DIR.exists():
-        REMUX_DIR.mkdir(exist_ok=True)
-    with TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
-        subprocess.check_call(
-            [
-                "ffmpeg",
-                "-hide_banner",
-                "-i",
-                path.absolute(),
-                "-map_metadata",
-                "-1",
-                "-acodec",
-                "copy",
-                "-vcodec",
-                "copy",
-                "-fflags",
-                "+fastseek",
-                "-movflags",
-                "faststart",
-                "out.mp4",
-            ],
-            cwd=tmpdir,
-            stdin=subprocess.DEVNULL,
-        )
-        shutil.move(tmpdir / "out.mp4", out_file)
+    if hls_is_current(entry, video_path):
+        path = hls_output_dir(entry) / name
+        if not path.exists():
+            raise Http404(f"No HLS file {name}")
+        return serve_file(request, path)
+
+    if name != HLS_PLAYLIST:
+        raise Http404(f"No HLS file {name}")
+    return _enqueue_response(entry, Job.Kind.HLS, video_path)
+
+
+def entry_video_status(request, entry_id, kind=Job.Kind.REMUX, variant=""):
+    """JSON status of making an entry’s video derivative, for polling after a
+    202."""
+    entry = get_object_or_404(Entry, pk=entry_id)
 
-        e2 = Entry.objects.get(pk=entry.id)
-        if path.stat().st_mtime not in e2.video_mtimes:
-            e2.video_mtimes.append(path.stat().st_mtime)
-            e2.save()
+    video_path = find_video_source(entry)
+    if video_path is None:
+        raise Http404(f"No video file found for entry {entry_id}")
+
+    if _derivative_is_current(entry, video_path, kind, variant):
+        url, _ = _video_job_urls(entry, kind, variant)
+        return JsonResponse({"status": Job.Status.DONE, "url": url})
+
+    job = jobs.latest_job(entry, kind, variant)
+    if job is None:
+        return JsonResponse({"status": None}, status=404)
+    return _job_status_response(entry, job)
+
+
+def _derivative_is_current(entry, video_path, kind, variant):
+    if kind == Job.Kind.HLS:
+        return hls_is_current(entry, video_path)
+    if kind == Job.Kind.TRANSCODE:
+        return transcode_is_current(entry, video_path, variant)
+    return remux_is_current(entry, video_path)
 
-        return out_file
+
+def _video_job_urls(entry, kind, variant=""):
+    """URLs of a video derivative and of its job status."""
+    if kind == Job.Kind.HLS:
+        return (
+            reverse("gallery2:entry_hls", args=[entry.id, HLS_PLAYLIST]),
+            reverse("gallery2:entry_hls_status", args=[entry.id]),
+        )
+    if kind == Job.Kind.TRANSCODE:
+        return (
+            reverse("gallery2:entry_video_variant", args=[entry.id, variant]),
+            reverse("gallery2:entry_video_variant_status", args=[entry.id, variant]),
+        )
+    return (
+        reverse("gallery2:entry_video", args=[entry.id]),
+        reverse("gallery2:entry_video_status", args=[entry.id]),
+    )
+
+
+def _enqueue_response(entry, kind, video_path, variant=""):
+    job = jobs.enqueue(entry, kind, source_path=video_path, variant=variant)
+    response = _job_status_response(entry, job)
+    response.status_code = 500 if job.status == Job.Status.FAILED else 202
+    return response
+
+
+def _job_status_response(entry, job):
+    _, status_url = _video_job_urls(entry, job.kind, job.variant)
+    data = {"status": job.status, "status_url": status_url}
+    if job.status == Job.Status.FAILED:
+        data["error"] = job.error.strip().splitlines()[-1] if job.error else ""
+    return JsonResponse(data)
+
+
+def ready(request):
+    """Readiness check: 503 until this worker has warmed up."""
+    is_ready, steps = warmup.status()
+    return JsonResponse(
+        {"ready": is_ready, "steps": steps}, status=200 if is_ready else 503
+    )
+
+
+@staff_member_required
+def metrics_view(request):
+    """Prometheus metrics, from gallery2.metrics plus the job queue."""
+    queued = {
+        (row["kind"], row["status"]): row["n"]
+        for row in Job.objects.filter(status__in=Job.ACTIVE_STATUSES)
+        .values("kind", "status")
+        .annotate(n=Count("id"))
+    }
+    jobs_samples = [
+        (
+            "gallery2_jobs",
+            {"kind": kind, "status": status},
+            queued.get((kind, status), 0),
+        )
+        for kind in Job.Kind.values
+        for status in Job.ACTIVE_STATUSES
+    ]
+    return HttpResponse(
+        metrics.export(jobs_samples), content_type="text/plain; version=0.0.4"
+    )
 
 
 def serve_public_media(request, gallery_id, filename):
@@ -276,4 +737,4 @@ def serve_public_media(request, gallery_id, filename):
     if not file_path.exists() or not file_path.is_file():
         raise Http404("File not found")
 
-    return FileResponse(open(file_path, "rb"))
+    return serve_file(request, file_path)
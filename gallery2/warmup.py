@@ -0,0 +1,125 @@
+"""
+Warming up new worker processes, so that their first requests don’t pay for
+starting exiftool, loading Pillow’s plugins, HEIF support and codecs, or
+reading the hot tables from disk.
+
+GALLERY_WARMUP lists the steps to run, in a background thread. Under uwsgi
+they start after each worker forks, from a post-fork hook that
+Gallery2Config.ready() installs. With other servers, website/wsgi.py starts
+them. The ready view returns 503 until they are done.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+STEPS = {}
+
+
+def step(fn):
+    STEPS[fn.__name__] = fn
+    return fn
+
+
+@step
+def imaging():
+    import av
+    from gallery2.images import Image
+
+    # Registers every format plugin, which Image.open() would otherwise do
+    # on the first file that isn’t one of the common formats
+    Image.init()
+    for codec in ["h264", "hevc"]:
+        av.codec.Codec(codec, "r")
+
+
+@step
+def exiftool():
+    from hdr.hdr_jpg_thumb import exiftool_process
+
+    exiftool_process.start()
+
+
+@step
+def database():
+    from gallery2.models import Derivative, Entry, Gallery
+
+    # Reads the tables’ pages into the OS cache
+    for model in [Gallery, Entry, Derivative]:
+        model.objects.count()
+
+
+class Warmup:
+    def __init__(self, steps):
+        self.pid = os.getpid()
+        self.steps = {name: "pending" for name in steps}
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            for name in self.steps:
+                start = time.perf_counter()
+                try:
+                    STEPS[name]()
+                except Exception as e:
+                    logger.exception(f"Warm-up step {name} failed")
+                    self.steps[name] = f"failed: {e}"
+                else:
+                    self.steps[name] = "done"
+                    logger.info(
+                        f"Warm-up step {name} took {time.perf_counter() - start:.2f}s"
+                    )
+        finally:
+            connections.close_all()
+            self.done.set()
+
+
+_warmup = None
+
+
+def _in_uwsgi_master():
+    try:
+        import uwsgi
+    except ImportError:
+        return False
+    return uwsgi.worker_id() == 0
+
+
+def start():
+    """Start warming up this process in the background, if that hasn’t
+    already started. Safe to call more than once."""
+    global _warmup
+    if not settings.GALLERY_WARMUP or _in_uwsgi_master():
+        # after fork, each worker warms itself up
+        return
+    if _warmup is not None and _warmup.pid == os.getpid():
+        return
+    _warmup = Warmup(settings.GALLERY_WARMUP)
+    threading.Thread(target=_warmup.run, name="warmup", daemon=True).start()
+
+
+def install_uwsgi_hook():
+    """Warm up each uwsgi worker after it forks. Does nothing outside uwsgi,
+    so that management commands don’t warm up."""
+    if not settings.GALLERY_WARMUP:
+        return
+    try:
+        from uwsgidecorators import postfork
+    except ImportError:
+        return
+    postfork(start)
+
+
+def status():
+    """(ready, {step: status}) for this process."""
+    if not settings.GALLERY_WARMUP:
+        return True, {}
+    if _warmup is None or _warmup.pid != os.getpid():
+        return False, {name: "pending" for name in settings.GALLERY_WARMUP}
+    return _warmup.done.is_set(), dict(_warmup.steps)
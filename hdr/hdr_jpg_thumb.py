@@ -9,8 +9,9 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from textwrap import dedent
 
-from PIL import Image
-from exiftool import ExifTool
+from gallery2 import metrics
+from gallery2.images import Image
+from gallery2.instrumentation import span
 
 ULTRAHDR_APP_MODE_ENCODE = "0"
 ULTRAHDR_APP_MODE_DECODE = "1"
@@ -22,23 +23,54 @@ logger = logging.getLogger(__name__)
 
 class ExifToolWrapper:
     def __init__(self):
-        self._exiftool = ExifTool()
-        self._running = False
+        self._exiftool = None
+        self._pid = None
         self.lock = threading.Lock()
+        # Queries waiting for or holding the lock, in process _queue_pid
+        self._queue = 0
+        self._queue_pid = None
+        self._queue_lock = threading.Lock()
+
+    def _start(self):
+        # After a fork, the process belongs to the parent
+        if self._exiftool is None or self._pid != os.getpid():
+            # exiftool is slow to import, and to start
+            from exiftool import ExifTool
+
+            exiftool = ExifTool()
+            exiftool.run()
+            self._exiftool = exiftool
+            self._pid = os.getpid()
+
+    def start(self):
+        """Start the exiftool process now instead of on the first query."""
+        with self.lock:
+            self._start()
+
+    def _add_to_queue(self, n):
+        with self._queue_lock:
+            # A forked child doesn’t have its parent’s queries
+            if self._queue_pid != os.getpid():
+                self._queue, self._queue_pid = 0, os.getpid()
+            self._queue += n
+            metrics.set_gauge("gallery2_exiftool_queue", self._queue)
 
     def execute_json(self, *query):
-        with self.lock:
-            if not self._running:
-                self._exiftool.run()
-                self._running = True
-            try:
-                return self._exiftool.execute_json(*query)
-            except Exception as e:
-                logger.exception(f"Failed on query {query!r}")
-                raise
+        self._add_to_queue(1)
+        try:
+            with span("exiftool"), self.lock:
+                self._start()
+                try:
+                    return self._exiftool.execute_json(*query)
+                except Exception as e:
+                    logger.exception(f"Failed on query {query!r}")
+                    raise
+        finally:
+            self._add_to_queue(-1)
 
 
-exiftool_json = ExifToolWrapper().execute_json
+exiftool_process = ExifToolWrapper()
+exiftool_json = exiftool_process.execute_json
 
 
 class HdrSourceImage:
@@ -159,20 +191,21 @@ class HdrSourceImage:
                     gain_im = Image.open(io.BytesIO(gain_map_data))
                     config_file = tmpdir / "out-config.cfg"
 
-                    subprocess.check_call(
-                        [
-                            "ultrahdr_app",
-                            "-m",
-                            ULTRAHDR_APP_MODE_DECODE,
-                            "-j",
-                            self._image_path,
-                            "-f",
-                            config_file,
-                            "-z",
-                            "/dev/null",
-                        ],
-                        cwd=tmpdir,
-                    )
+                    with span("ultrahdr"):
+                        subprocess.check_call(
+                            [
+                                "ultrahdr_app",
+                                "-m",
+                                ULTRAHDR_APP_MODE_DECODE,
+                                "-j",
+                                self._image_path,
+                                "-f",
+                                config_file,
+                                "-z",
+                                "/dev/null",
+                            ],
+                            cwd=tmpdir,
+                        )
                     config = config_file.read_text()
                 else:
                     raise Exception("unsupported")
@@ -193,20 +226,21 @@ class HdrSourceImage:
 
             out_path = tmpdir / "out.jpg"
 
-            subprocess.check_call(
-                [
-                    "ultrahdr_app",
-                    "-m",
-                    ULTRAHDR_APP_MODE_ENCODE,
-                    "-i",
-                    base_path.relative_to(tmpdir),
-                    "-g",
-                    gain_path.relative_to(tmpdir),
-                    "-f",
-                    config_path.relative_to(tmpdir),
-                    "-z",
-                    out_path.relative_to(tmpdir),
-                ],
-                cwd=tmpdir,
-            )
+            with span("ultrahdr"):
+                subprocess.check_call(
+                    [
+                        "ultrahdr_app",
+                        "-m",
+                        ULTRAHDR_APP_MODE_ENCODE,
+                        "-i",
+                        base_path.relative_to(tmpdir),
+                        "-g",
+                        gain_path.relative_to(tmpdir),
+                        "-f",
+                        config_path.relative_to(tmpdir),
+                        "-z",
+                        out_path.relative_to(tmpdir),
+                    ],
+                    cwd=tmpdir,
+                )
             return out_path.read_bytes()
@@ -49,11 +49,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "gallery2.instrumentation.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "gallery2.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -122,6 +124,72 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 MEDIA_URL = "media/"
 
+# Python-Markdown extensions for captions. After changing this, run
+# `./manage.py render_captions` to re-render the stored caption HTML.
+GALLERY_MARKDOWN_EXTENSIONS = []
+
+# Entries per page, and per infinite-scroll fragment, of the gallery view
+GALLERY_PAGE_SIZE = 50
+
+# How the gallery’s file-serving views send file contents, once they have
+# checked the request and found the file:
+#   - None: stream the file from Python. Under uwsgi with --offload-threads,
+#     uwsgi’s offload engine does the transfer.
+#   - "x-accel-redirect": reply with an X-Accel-Redirect header so that nginx
+#     sends the file from one of the internal locations in
+#     GALLERY_OFFLOAD_LOCATIONS, a dict of {filesystem dir: internal URI
+#     prefix}, see website.nginx.conf. Files outside those dirs are streamed.
+#   - "x-sendfile": reply with the absolute path in an X-Sendfile header, for
+#     servers supporting that.
+GALLERY_FILE_OFFLOAD = None
+GALLERY_OFFLOAD_LOCATIONS = {}
+
+# Seconds after which a job still marked running, presumably because its
+# runworker process died, may be claimed again by another worker.
+GALLERY_JOB_TIMEOUT = 60 * 60
+
+# H.264/AAC renditions of entry videos, for browsers that can’t play the
+# usually-HEVC originals, and so that viewers don’t have to download 4K
+# bitrates. `height` is that of the shorter side, so that it suits portrait
+# videos too; renditions bigger than the original aren’t made. Browsers play
+# the first rendition whose `media` query matches, if any, else the last.
+GALLERY_TRANSCODE_LADDER = [
+    {
+        "name": "1080p",
+        "height": 1080,
+        "video_bitrate": "5M",
+        "audio_bitrate": "160k",
+        "media": "(min-width: 1200px)",
+    },
+    {
+        "name": "720p",
+        "height": 720,
+        "video_bitrate": "2500k",
+        "audio_bitrate": "128k",
+    },
+]
+# Transcodes are CPU-bound, so at most this many run at once, across all
+# workers, with this many ffmpeg threads each.
+GALLERY_MAX_CONCURRENT_TRANSCODES = 1
+GALLERY_TRANSCODE_THREADS = 2
+
+# Whether to time each request, sending the timings in a Server-Timing header
+# and logging them to gallery2.instrumentation; see there.
+GALLERY_SERVER_TIMING = False
+
+# SQLite file that every process adds its metrics into, for the metrics view;
+# None turns metrics off. See gallery2.metrics.
+GALLERY_METRICS_DB = None
+GALLERY_METRICS_FLUSH_INTERVAL = 10
+
+# Limits on the profiles kept in MEDIA_ROOT/profiles; see gallery2.profiling.
+GALLERY_PROFILES_MAX_BYTES = 200 * 1024 * 1024
+GALLERY_PROFILES_MAX_AGE = 14 * 24 * 60 * 60
+
+# Steps from gallery2.warmup to run when a worker starts, any of "imaging",
+# "exiftool" and "database"
+GALLERY_WARMUP = []
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -130,3 +198,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGGING = deepcopy(DEFAULT_LOGGING)
 
 LOGGING["handlers"]["console"]["filters"].remove("require_debug_true")
+LOGGING["loggers"]["gallery2.instrumentation"] = {
+    "handlers": ["console"],
+    "level": "INFO",
+}
@@ -5,6 +5,9 @@ DEBUG = True
 
 FRONTEND_VITE_PORT = 3231
 
+GALLERY_SERVER_TIMING = True
+GALLERY_METRICS_DB = BASE_DIR / "cache" / "metrics.sqlite3"
+
 TEST_RUNNER = "pytest_django.runner.TestRunner"
 
 ## Database
@@ -19,6 +22,22 @@ DATABASES = {
     }
 }
 
+## Cache
+
+# The fragments cache holds rendered gallery entries, see gallery2.fragments.
+# It is file-based so that every worker process shares it.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "fragments",
+        "TIMEOUT": 30 * 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 50_000},
+    },
+}
+
 ## Debug toolbar
 
 DEBUG_TOOLBAR = True
@@ -1,3 +1,5 @@
+import os
+
 from .common_settings import *
 
 DEBUG = False
@@ -24,6 +26,14 @@ SECURE_HSTS_PRELOAD = True
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 
+# Set GALLERY_FILE_OFFLOAD=x-accel-redirect when running behind the nginx
+# profile in docker-compose.yml.
+GALLERY_FILE_OFFLOAD = os.environ.get("GALLERY_FILE_OFFLOAD") or None
+GALLERY_OFFLOAD_LOCATIONS = {BASE_DIR / "media": "/_offload/media/"}
+
+# Set GALLERY_SERVER_TIMING=1 to see where the time goes in each request.
+GALLERY_SERVER_TIMING = bool(os.environ.get("GALLERY_SERVER_TIMING"))
+
 #
 
 DATABASES = {
@@ -32,3 +42,20 @@ DATABASES = {
         "NAME": BASE_DIR / "db" / "prod.sqlite3",
     }
 }
+
+GALLERY_METRICS_DB = BASE_DIR / "db" / "metrics.sqlite3"
+
+GALLERY_WARMUP = ["imaging", "exiftool", "database"]
+
+# See dev_settings. The db dir is the one that is writable in the container.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "db" / "cache" / "fragments",
+        "TIMEOUT": 30 * 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 50_000},
+    },
+}
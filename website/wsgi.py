@@ -12,3 +12,8 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 application = get_wsgi_application()
+
+# Start warming up this worker in the background; see gallery2.warmup
+from gallery2 import warmup
+
+warmup.start()